@@ -3,12 +3,15 @@ Flask 应用工厂
 """
 from flask import Flask
 from flask_cors import CORS
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 from sqlalchemy.exc import SQLAlchemyError
 
 from app.config import config
 from app.extensions import db, jwt
 from app.middleware.error_handler import register_error_handlers
+from app.services.embedding import embedding_service
+from app.services.ingestion import ingestion_manager
+from app.services.message_writer import message_writer
 
 # 导入蓝图
 from app.api.auth import auth_bp
@@ -17,7 +20,10 @@ from app.api.kb import kb_bp
 from app.api.chat import chat_bp
 
 # 导入模型（确保 SQLAlchemy 能创建表）
-from app.models import User, Conversation, Message  # noqa: F401
+from app.models import (  # noqa: F401
+    User, Conversation, Message, IngestJob, UploadSession, KBBlob, KBChunk, KBChunkText, KBDocument, KBRevision,
+    Team, TeamMember
+)
 
 
 def create_app(config_name='default'):
@@ -42,7 +48,7 @@ def create_app(config_name='default'):
         r"/api/*": {
             "origins": app.config['CORS_ORIGINS'],
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"],
+            "allow_headers": ["Content-Type", "Authorization", "Last-Event-ID"],
             "expose_headers": app.config.get('CORS_EXPOSE_HEADERS', [])
         }
     })
@@ -66,6 +72,15 @@ def create_app(config_name='default'):
     # 配置日志
     configure_logging(app)
     
+    # 初始化嵌入服务
+    embedding_service.init_app(app)
+    
+    # 启动文档入库任务调度
+    ingestion_manager.init_app(app)
+    
+    # 助手消息后台写入
+    message_writer.init_app(app)
+    
     return app
 
 
@@ -90,6 +105,7 @@ def init_database(app):
             
             # 创建数据库表（Flask-SQLAlchemy 会自动处理路径）
             db.create_all()
+            upgrade_schema(app)
             
             # 测试数据库连接
             db.session.execute(text('SELECT 1'))
@@ -105,6 +121,33 @@ def init_database(app):
             raise
 
 
+def upgrade_schema(app):
+    """
+    补齐已有数据库中缺少的列和索引
+
+    create_all 只创建不存在的表，不会修改已有的表；模型给已有的表新增的列
+    （须可为空）和索引在这里补上，旧版本创建的数据库升级后无需手动迁移。
+
+    Args:
+        app: Flask 应用实例
+    """
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                app.logger.info(f"数据表 {table.name} 新增列: {column.name}")
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+                    app.logger.info(f"数据表 {table.name} 新增索引: {index.name}")
+
+
 def configure_logging(app):
     """
     配置日志
@@ -7,6 +7,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.utils.responses import APIResponse
 from app.extensions import db
 from app.models import Conversation, Message, User
+from app.services.message_writer import message_writer
 from . import chat_bp
 
 
@@ -73,6 +74,9 @@ def get_conversation(conversation_id):
         if not conversation:
             return APIResponse.error(message="对话不存在", code=404)
         
+        # 刚结束的回答可能还在本进程的后台写入队列中（不轮询数据库，回答仍在生成时不阻塞）
+        message_writer.wait(conversation_id, poll=False)
+        
         return APIResponse.success(
             data=conversation.to_dict(include_messages=True),
             message="获取对话成功"
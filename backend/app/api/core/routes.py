@@ -1,114 +1,319 @@
 """
 核心功能路由（聊天）
 """
-import time
 import json
+import time
+import uuid
+import asyncio
+import threading
+from datetime import datetime
+
 from flask import request, Response, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
+from app.asgi import ASYNC_CHAT_KEY
 from app.utils.responses import APIResponse
+from app.utils.sse import encode_event, with_id, DONE_FRAME
 from app.extensions import db
-from app.models import Conversation, Message
+from app.models import Conversation, Message, KBRevision
+from app.services.namespaces import readable_namespaces
+from app.services.history import build_history
+from app.services.message_writer import message_writer, PendingMessage
+from app.services.stream_buffer import get_stream_buffer
+from app.services.single_flight import get_single_flight, flight_key
+from app.services.llm import create_answer_stream
+from app.services.rag import create_rag_pipeline, build_messages
 from . import core_bp
 
 
-def non_rag_chat_generator(_prompt, conversation_id=None, user_message_id=None):
-    """非 RAG 模式流式生成器（逐字符输出）"""
-    # 首先发送 conversation_id（如果存在）
-    if conversation_id:
-        yield f"data: {json.dumps({'type': 'conversation_id', 'conversation_id': conversation_id})}\n\n"
-    
-    response_text = "测试回复：非RAG模式下的回复"
-    full_content = ""
-    # 逐字符 yield，实现打字机效果
-    for char in response_text:
-        full_content += char
-        yield f"data: {json.dumps({'type': 'content', 'content': char})}\n\n"
-        time.sleep(0.05)  # 保持和 RAG 一致的打字机间隔
-    # 输出结束标识
-    yield "data: [DONE]\n\n"
-    
-    # 保存助手消息到数据库（在请求上下文中执行）
-    if conversation_id and user_message_id:
+class ChatStream:
+    """
+    一次聊天的流式响应
+    先发送 conversation_id，然后是回答事件（非 RAG 模式为大模型的回答片段与 generate 阶段的
+    stage 事件；RAG 模式为流水线各阶段的 stage 事件、searching_end 与回答片段），最后是结束标识。
+    结束后把助手消息交给后台写入（见 app.services.message_writer）。
+    启用续传时每个事件带 id 并写入回答流缓冲（见 app.services.stream_buffer）；客户端中途断开
+    后生成继续进行（最多 STREAM_DETACH_TIMEOUT 秒），客户端带 Last-Event-ID 重连时从缓冲续传。
+    未启用续传或超过该时间时取消上游请求，已输出的部分回答同样保存。
+    同步服务模式下由 frames() 在工作线程中输出；异步服务模式（见 app/asgi.py）下由 aframes()
+    在事件循环上输出，不占用线程
+    """
+
+    def __init__(self, app, source, conversation_id=None, user_message_id=None, buffer=None, user_id=None):
+        """
+        Args:
+            app: Flask 应用
+            source: 回答事件来源（AnswerStream 或 RagPipeline），提供 events() / aevents(executor)
+                以及已输出的 answer（RAG 模式还有 sources）
+            conversation_id: 对话 ID
+            user_message_id: 用户消息 ID
+            buffer: 回答流缓冲（为空时不支持续传）
+            user_id: 当前用户（只有本人可以续传）
+        """
+        self.app = app
+        self.source = source
+        self.conversation_id = conversation_id
+        self.user_message_id = user_message_id
+        self.buffer = buffer
+        self.detach_timeout = app.config.get('STREAM_DETACH_TIMEOUT', 30)
+        self.stream_id = uuid.uuid4().hex if buffer is not None else None
+        if buffer is not None:
+            buffer.open(self.stream_id, user_id)
+        self._seq = 0
+        self._detached_at = None
+        self._finished = False
+
+    def frames(self):
+        """同步输出 SSE 帧（在请求上下文中迭代）"""
+        events = self.source.events()
         try:
-            assistant_message = Message(
-                conversation_id=conversation_id,
-                role='assistant',
-                content=full_content
-            )
-            db.session.add(assistant_message)
-            
-            # 更新对话的更新时间
-            conversation = Conversation.query.get(conversation_id)
-            if conversation:
-                from datetime import datetime
-                conversation.updated_at = datetime.utcnow()
-            
-            db.session.commit()
-        except Exception as e:
-            current_app.logger.error(f"保存助手消息失败: {str(e)}")
-            db.session.rollback()
+            if self.conversation_id:
+                yield self._frame(encode_event({'type': 'conversation_id', 'conversation_id': self.conversation_id}))
+            for event in events:
+                yield self._frame(encode_event(event))
+            # 输出结束标识
+            yield self._frame(DONE_FRAME)
+        except GeneratorExit:
+            # 客户端断开：在后台线程中继续生成，供重连的客户端续传
+            if self.detach():
+                threading.Thread(target=self._run_detached, args=(events,), name='chat-detached', daemon=True).start()
+                return
+            raise
+        finally:
+            if self._detached_at is None:
+                events.close()
+                self._finish()
+
+    def _run_detached(self, events):
+        with self.app.app_context():
+            try:
+                for event in events:
+                    self._frame(encode_event(event))
+                    if self._detach_expired():
+                        break
+                else:
+                    self._frame(DONE_FRAME)
+            except Exception as e:  # noqa: BLE001
+                self.app.logger.warning(f"断开后继续生成时出错: {str(e)}")
+            finally:
+                events.close()
+                self._finish()
 
+    async def aframes(self, executor=None):
+        """
+        异步输出 SSE 帧；客户端断开后由 ASGI 适配层调用 detach()，继续迭代但不再发送
+
+        Args:
+            executor: 执行阻塞调用（检索阶段、直接写入消息）的线程池
+        """
+        events = self.source.aevents(executor)
+        try:
+            if self.conversation_id:
+                yield self._frame(encode_event({'type': 'conversation_id', 'conversation_id': self.conversation_id}))
+            async for event in events:
+                yield self._frame(encode_event(event))
+                if self._detach_expired():
+                    return
+            yield self._frame(DONE_FRAME)
+        finally:
+            await events.aclose()
+            self._finish(executor)
 
-def rag_chat_generator(_prompt, conversation_id=None, user_message_id=None):
+    def detach(self):
+        """
+        客户端已断开
+
+        Returns:
+            bool: 是否在断开后继续生成（启用续传时）
+        """
+        if self.buffer is None or self.detach_timeout <= 0:
+            return False
+        self._detached_at = time.monotonic()
+        return True
+
+    def _detach_expired(self):
+        return self._detached_at is not None and time.monotonic() - self._detached_at > self.detach_timeout
+
+    def _frame(self, frame):
+        """为帧分配事件 id 并写入回答流缓冲"""
+        if self.buffer is None:
+            return frame
+        self._seq += 1
+        frame = with_id(frame, f"{self.stream_id}:{self._seq}")
+        self.buffer.append(self.stream_id, self._seq, frame)
+        return frame
+
+    def _finish(self, executor=None):
+        """回答流结束（完成、出错或客户端断开）：标记缓冲结束，保存助手消息（只执行一次）"""
+        if self._finished:
+            return
+        self._finished = True
+        if self.buffer is not None:
+            self.buffer.finish(self.stream_id)
+        message = self._message()
+        if message is None or message_writer.submit(message):
+            return
+        # 写入队列已满：直接写入（异步模式下在线程池中执行）
+        if executor is not None:
+            asyncio.get_running_loop().run_in_executor(executor, self._write_in_context, message)
+        else:
+            with self.app.app_context():
+                message_writer.write([message])
+
+    def _write_in_context(self, message):
+        with self.app.app_context():
+            message_writer.write([message])
+
+    def _message(self):
+        """待保存的助手消息（没有任何输出时不保存）"""
+        if not (self.conversation_id and self.user_message_id):
+            return None
+        answer = self.source.answer
+        if not answer:
+            return None
+        sources = getattr(self.source, 'sources', None)
+        return PendingMessage(
+            conversation_id=self.conversation_id,
+            role='assistant',
+            content=answer,
+            sources=json.dumps(sources) if sources else None,
+            created_at=datetime.utcnow()
+        )
+
+
+class ResumedStream:
     """
-    模拟 RAG 处理逻辑
-    这是一个生成器，它模拟了 RAG 的三个阶段：
-    1. Embedding & Search (检索)
-    2. Prompt Construction (构建上下文)
-    3. Generation (生成回答)
+    续传的回答流：先发送 resumed 事件（missed 为环形缓冲中已丢弃、无法补发的事件数），
+    然后补发 Last-Event-ID 之后的帧，并跟随尚未结束的生成直到结束标识
     """
-    # 首先发送 conversation_id（如果存在）
-    if conversation_id:
-        yield f"data: {json.dumps({'type': 'conversation_id', 'conversation_id': conversation_id})}\n\n"
-    
-    # --- 阶段 1: 模拟检索过程 ---
-    time.sleep(1.5)  # 模拟去向量数据库查询的时间
-    
-    # 模拟检索到的文档片段
-    mock_sources = []
-    
-    # 发送一个特殊事件告诉前端：检索结束，并带上引用源
-    yield f"data: {json.dumps({'type': 'searching_end', 'sources': mock_sources})}\n\n"
-    
-    # --- 阶段 2: 模拟 LLM 基于文档回答 ---
-    response_text = "测试回复：xxxxx"
-    full_content = ""
-    
-    for char in response_text:
-        full_content += char
-        yield f"data: {json.dumps({'type': 'content', 'content': char})}\n\n"
-        time.sleep(0.05)  # 打字机效果
-    
-    yield "data: [DONE]\n\n"
-    
-    # 保存助手消息到数据库（在请求上下文中执行）
-    if conversation_id and user_message_id:
-        try:
-            assistant_message = Message(
-                conversation_id=conversation_id,
-                role='assistant',
-                content=full_content,
-                sources=json.dumps(mock_sources) if mock_sources else None
-            )
-            db.session.add(assistant_message)
-            
-            # 更新对话的更新时间
-            conversation = Conversation.query.get(conversation_id)
-            if conversation:
-                from datetime import datetime
-                conversation.updated_at = datetime.utcnow()
-            
-            db.session.commit()
-        except Exception as e:
-            current_app.logger.error(f"保存助手消息失败: {str(e)}")
-            db.session.rollback()
+
+    def __init__(self, app, buffer, stream_id, after_seq):
+        self.app = app
+        self.buffer = buffer
+        self.stream_id = stream_id
+        self.after_seq = after_seq
+        self.poll_interval = app.config.get('STREAM_BUFFER_POLL_MS', 100) / 1000
+
+    def frames(self):
+        """同步输出 SSE 帧"""
+        after = self.after_seq
+        first = True
+        last = []
+        while True:
+            rows, info = self.buffer.read(self.stream_id, after)
+            if first:
+                yield self._resumed(after, rows)
+                first = False
+            for seq, frame in rows:
+                after = seq
+                yield bytes(frame)
+            if rows:
+                last = rows
+            if info is None or (info.done and not rows):
+                break
+            if not rows:
+                time.sleep(self.poll_interval)
+        yield from self._tail(last)
+
+    async def aframes(self, executor=None):
+        """异步输出 SSE 帧（读取在线程池中执行）"""
+        loop = asyncio.get_running_loop()
+        after = self.after_seq
+        first = True
+        last = []
+        while True:
+            rows, info = await loop.run_in_executor(executor, self.buffer.read, self.stream_id, after)
+            if first:
+                yield self._resumed(after, rows)
+                first = False
+            for seq, frame in rows:
+                after = seq
+                yield bytes(frame)
+            if rows:
+                last = rows
+            if info is None or (info.done and not rows):
+                break
+            if not rows:
+                await asyncio.sleep(self.poll_interval)
+        for frame in self._tail(last):
+            yield frame
+
+    def _resumed(self, after, rows):
+        missed = rows[0][0] - after - 1 if rows else 0
+        return encode_event({'type': 'resumed', 'missed': max(missed, 0)})
+
+    @staticmethod
+    def _tail(rows):
+        """回答流没有结束标识就结束时（生成被取消或缓冲已过期）补发结束标识"""
+        if not rows or not bytes(rows[-1][1]).endswith(DONE_FRAME):
+            yield DONE_FRAME
+
+
+def _answer_source(prompt, use_rag, history, user_id):
+    """
+    回答事件来源；同一时间相同的问题（知识库版本、检索范围和对话历史也相同）合并为
+    一次生成（见 app.services.single_flight）
+    """
+    namespaces = readable_namespaces(user_id) if use_rag else []
+
+    def create_source():
+        if use_rag:
+            # RAG 模式：检索 namespaces 中的知识库，各阶段有时间预算，超时或失败时降级继续；
+            # 相似问题命中语义答案缓存时跳过检索和生成，按同样的事件序列重放缓存的回答
+            return create_rag_pipeline(prompt, namespaces, history)
+        return create_answer_stream(build_messages(
+            prompt,
+            history=history.messages if history else None,
+            summary=history.summary if history else ''
+        ))
+
+    single_flight = get_single_flight()
+    if single_flight is None:
+        return create_source()
+    key = flight_key(
+        prompt, use_rag,
+        kb_versions=KBRevision.current(namespaces) if use_rag else None,
+        namespaces=namespaces,
+        history=history,
+        asynchronous=ASYNC_CHAT_KEY in request.environ
+    )
+    subscription = single_flight.join(key, create_source)
+    if not subscription.leader:
+        current_app.logger.info(f"合并到进行中的相同问题: {prompt[:50]}...")
+    return subscription
+
+
+def _resume(last_event_id, user_id):
+    """按 Last-Event-ID 续传回答流"""
+    buffer = get_stream_buffer()
+    stream_id, _, seq = last_event_id.partition(':')
+    if buffer is None or not seq.isdigit():
+        return APIResponse.error(message="无效的 Last-Event-ID", code=400)
+    info = buffer.lookup(stream_id)
+    if info is None or info.user_id != str(user_id):
+        return APIResponse.error(message="回答流不存在或已过期", code=404)
+    current_app.logger.info(f"续传回答流: stream_id={stream_id}, last_seq={seq}")
+    return _stream_response(ResumedStream(current_app._get_current_object(), buffer, stream_id, int(seq)), {})
+
+
+def _stream_response(stream, headers):
+    """流式响应：异步服务模式下交给事件循环输出，请求线程立即返回"""
+    async_chat = request.environ.get(ASYNC_CHAT_KEY)
+    if async_chat is not None:
+        async_chat.stream = stream
+        return Response(mimetype='text/event-stream', headers=headers)
+    # 同步模式使用 stream_with_context 保持请求上下文
+    return Response(stream_with_context(stream.frames()), mimetype='text/event-stream', headers=headers)
 
 
 @core_bp.route('/chat', methods=['POST'])
 @jwt_required()
 def chat():
-    """聊天接口（流式响应）"""
+    """聊天接口（流式响应；带 Last-Event-ID 时续传之前的回答流）"""
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id:
+        return _resume(last_event_id, get_jwt_identity())
+    
     if not request.is_json:
         return APIResponse.error(message="Content-Type must be application/json", code=400)
     
@@ -142,6 +347,8 @@ def chat():
             
             if conversation:
                 current_app.logger.info(f"使用现有对话: conversation_id={conversation_id}, 标题={conversation.title}")
+                # 上一条回答可能还在后台写入队列中，写入后再构建历史
+                message_writer.wait(conversation_id)
             else:
                 current_app.logger.warning(f"对话不存在或无权限: conversation_id={conversation_id}, user_id={user_id}, 将创建新对话")
         
@@ -172,29 +379,25 @@ def chat():
         user_message_id = user_message.id
         
         # 更新对话的更新时间
-        from datetime import datetime
         conversation.updated_at = datetime.utcnow()
         
         db.session.commit()
         
-        # 生成流式响应（使用 stream_with_context 保持请求上下文）
+        # 对话历史：token 预算内的最近消息，更早的消息折叠为滚动摘要
+        history = build_history(conversation, user_message)
+        
+        # 生成流式响应
         # 在响应头中返回 conversation_id，方便前端更新
         headers = {
             'X-Conversation-Id': str(conversation_id)
         }
         
-        if use_rag:
-            return Response(
-                stream_with_context(rag_chat_generator(prompt, conversation_id, user_message_id)),
-                mimetype='text/event-stream',
-                headers=headers
-            )
-        else:
-            return Response(
-                stream_with_context(non_rag_chat_generator(prompt, conversation_id, user_message_id)),
-                mimetype='text/event-stream',
-                headers=headers
-            )
+        source = _answer_source(prompt, use_rag, history, user_id)
+        stream = ChatStream(
+            current_app._get_current_object(), source, conversation_id, user_message_id,
+            buffer=get_stream_buffer(), user_id=user_id
+        )
+        return _stream_response(stream, headers)
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"处理聊天请求时出错: {str(e)}")
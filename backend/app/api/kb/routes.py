@@ -1,19 +1,36 @@
 """
 知识库管理路由
 """
-import os
 from flask import request, current_app
-from flask_jwt_extended import jwt_required
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.utils import secure_filename
 
+from app.extensions import db
+from app.models import IngestJob, Team, TeamMember, User
+from app.services.embedding import embedding_service
+from app.services.ingestion import ingestion_manager
+from app.services.keyword import get_keyword_index, get_keyword_index_shards
+from app.services.namespaces import (
+    SHARED, team_namespace, readable_namespaces, can_write, resolve_writable, resolve_readable
+)
+from app.services.rag import get_answer_cache
+from app.services.single_flight import get_single_flight
+from app.services.storage import catalog, reindex, get_blob_store, get_chunked_upload_store, UploadOffsetError
+from app.services.vectorstore import get_vector_store, get_vector_store_shards
+from app.utils.exceptions import ValidationError, ConflictError, NotFoundError, AuthorizationError
 from app.utils.responses import APIResponse
 from . import kb_bp
 
+# kb-info 文件列表的默认和最大每页数量
+KB_INFO_PAGE_SIZE = 100
+KB_INFO_MAX_PAGE_SIZE = 1000
+
+
 # 从配置中获取上传配置
 def get_upload_config():
     """获取上传配置"""
     return {
-        'folder': current_app.config.get('UPLOAD_FOLDER'),
         'max_size': current_app.config.get('MAX_UPLOAD_SIZE', 10485760),
         'allowed_extensions': current_app.config.get('ALLOWED_EXTENSIONS', {'txt', 'pdf', 'md', 'doc', 'docx', 'csv'})
     }
@@ -28,46 +45,92 @@ def allowed_file(filename, allowed_extensions):
 @kb_bp.route('/kb-info', methods=['GET'])
 @jwt_required()
 def get_kb_info():
-    """获取知识库信息接口"""
-    config = get_upload_config()
-    upload_folder = config['folder']
-    
-    # 获取真实文件列表
-    files = []
-    if os.path.exists(upload_folder):
-        for f in os.listdir(upload_folder):
-            file_path = os.path.join(upload_folder, f)
-            if os.path.isfile(file_path) and not f.startswith('.'):
-                size_kb = os.path.getsize(file_path) / 1024
-                files.append({
-                    "name": f,
-                    "size": f"{size_kb:.1f} KB",
-                    "type": f.split('.')[-1].lower()
-                })
-    
-    # 模拟向量数量（实际应从 ChromaDB 查询）
-    vector_count = len(files) * 52
+    """
+    获取知识库信息接口
+
+    默认列出当前用户可读的全部命名空间，namespace 指定单个命名空间。
+    文件列表按 (文件名, 命名空间) 排序分页：page、per_page（或 after 与
+    after_namespace，上一页最后一项），可按 status、type、origin、
+    prefix（文件名前缀）、q（文件名包含的文本）筛选
+    """
+    namespaces = resolve_readable(int(get_jwt_identity()), request.args.get('namespace'))
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', KB_INFO_PAGE_SIZE, type=int)
+    if page < 1 or not 1 <= per_page <= KB_INFO_MAX_PAGE_SIZE:
+        raise ValidationError(f"page 必须大于 0，per_page 必须在 1 到 {KB_INFO_MAX_PAGE_SIZE} 之间")
+    
+    after = request.args.get('after')
+    if after is not None:
+        after = (after, request.args.get('after_namespace', ''))
+    documents, total, has_more = catalog.list_documents(
+        namespaces,
+        status=request.args.get('status'),
+        file_type=request.args.get('type'),
+        origin=request.args.get('origin'),
+        prefix=request.args.get('prefix'),
+        query=request.args.get('q'),
+        page=page,
+        per_page=per_page,
+        after=after
+    )
+    files = [doc.to_dict() for doc in documents]
+    totals = catalog.catalog_totals(namespaces)
+    keyword_shards = get_keyword_index_shards()
+    answer_cache = get_answer_cache()
+    single_flight = get_single_flight()
+    shards = {}
+    for namespace in namespaces:
+        keyword_index = get_keyword_index(namespace)
+        shards[namespace] = {
+            "vector_store": get_vector_store(namespace).stats(),
+            "keyword_index": keyword_index.stats() if keyword_index is not None else None
+        }
     
     return APIResponse.success(
         data={
-            "file_count": len(files),
-            "vector_count": vector_count,
-            "files": files
+            "file_count": totals['file_count'],
+            "vector_count": totals['vector_count'],
+            "status_counts": totals['status_counts'],
+            "namespaces": namespaces,
+            "shards": shards,
+            "shard_registry": {
+                "vector_store": get_vector_store_shards().stats(),
+                "keyword_index": keyword_shards.stats() if keyword_shards is not None else None
+            },
+            "embedding_cache": embedding_service.cache_stats(),
+            "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+            "chat_coalescing": single_flight.stats() if single_flight is not None else None,
+            "files": files,
+            "total": total,
+            "page": page,
+            "per_page": per_page,
+            "next_after": files[-1]['name'] if has_more else None,
+            "next_after_namespace": files[-1]['namespace'] if has_more else None
         },
         message="获取成功"
     )
 
 
+def _job_summary(job):
+    return {"id": job.id, "filename": job.filename, "status": job.status}
+
+
 @kb_bp.route('/upload', methods=['POST'])
 @jwt_required()
 def upload_file():
-    """文件上传接口"""
+    """文件上传接口（表单字段 namespace 为目标命名空间，默认个人知识库）"""
     if 'file' not in request.files:
         return APIResponse.error(message="No file part", code=400)
     
     config = get_upload_config()
     files = request.files.getlist('file')  # 支持多文件上传
+    overwrite = request.form.get('overwrite', '').lower() in ('true', '1', 'yes')
+    user_id = int(get_jwt_identity())
+    namespace = resolve_writable(user_id, request.form.get('namespace'))
+    blob_store = get_blob_store()
     saved_files = []
+    deduplicated = []
+    jobs = []
     errors = []
     
     # 检查是否有有效文件
@@ -83,32 +146,39 @@ def upload_file():
             errors.append(f"文件 {file.filename} 类型不允许")
             continue
         
-        # 检查文件大小
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)
-        
-        if file_size > config['max_size']:
-            errors.append(f"文件 {file.filename} 超过大小限制")
-            continue
-        
-        # 保存文件
         filename = secure_filename(file.filename)
-        file_path = os.path.join(config['folder'], filename)
         
         try:
-            file.save(file_path)
-            saved_files.append(filename)
-            current_app.logger.info(f"文件上传成功: {filename}")
-            
-            # TODO: 触发异步任务进行向量化
-            # 1. 读取文件内容 (Loader)
-            # 2. 文本切片 (Splitter)
-            # 3. 向量化并存入 ChromaDB (Vector Store)
-            
-        except (OSError, IOError) as e:
+            # 边读边计算摘要，超过大小限制时立即停止
+            sha256, size, tmp_path = blob_store.write_stream(file.stream, config['max_size'])
+            document, job = catalog.commit_document(
+                blob_store, user_id, namespace, filename, sha256, size, tmp_path, overwrite=overwrite
+            )
+        except ValidationError:
+            errors.append(f"文件 {file.filename} 超过大小限制")
+            continue
+        except ConflictError as e:
+            db.session.rollback()
+            errors.append(e.message)
+            continue
+        except (OSError, IOError, SQLAlchemyError) as e:
+            db.session.rollback()
             current_app.logger.error(f"保存文件失败 {filename}: {str(e)}")
             errors.append(f"保存文件 {file.filename} 失败: {str(e)}")
+            continue
+        
+        saved_files.append(filename)
+        if job:
+            # 新内容：由后台进程池完成加载、切分、向量化和写入
+            jobs.append(job)
+            current_app.logger.info(f"文件上传成功: {filename}")
+        else:
+            # 相同内容已入库，跳过解析和向量化
+            deduplicated.append(filename)
+            current_app.logger.info(f"文件内容已存在，跳过入库: {filename} ({document.blob_sha256[:12]})")
+    
+    if jobs:
+        ingestion_manager.notify()
     
     if not saved_files and errors:
         return APIResponse.error(
@@ -119,46 +189,245 @@ def upload_file():
     
     return APIResponse.success(
         data={
+            "namespace": namespace,
             "files": saved_files,
+            "jobs": [_job_summary(job) for job in jobs],
+            "deduplicated": deduplicated,
             "errors": errors
         },
         message=f"成功上传 {len(saved_files)} 个文件"
     )
 
 
+@kb_bp.route('/uploads', methods=['POST'])
+@jwt_required()
+def init_chunked_upload():
+    """分片上传：创建上传会话（namespace 为目标命名空间，默认个人知识库）"""
+    data = request.get_json() or {}
+    original_name = data.get('filename', '')
+    total_size = data.get('size')
+    
+    if not original_name or not isinstance(total_size, int):
+        return APIResponse.error(message="filename 和 size 不能为空", code=400)
+    
+    config = get_upload_config()
+    if not allowed_file(original_name, config['allowed_extensions']):
+        return APIResponse.error(message=f"文件 {original_name} 类型不允许", code=400)
+    
+    user_id = int(get_jwt_identity())
+    namespace = resolve_writable(user_id, data.get('namespace'))
+    store = get_chunked_upload_store()
+    session = store.init(user_id, namespace, secure_filename(original_name), total_size)
+    
+    result = session.to_dict()
+    result['part_max_size'] = store.max_part_size
+    return APIResponse.success(data=result, message="创建上传会话成功", code=201)
+
+
+@kb_bp.route('/uploads/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_chunked_upload(upload_id):
+    """分片上传：查询进度（received_size 即续传偏移）"""
+    session = get_chunked_upload_store().get(int(get_jwt_identity()), upload_id)
+    return APIResponse.success(data=session.to_dict(), message="获取成功")
+
+
+@kb_bp.route('/uploads/<upload_id>/parts', methods=['PUT'])
+@jwt_required()
+def append_chunked_upload(upload_id):
+    """分片上传：追加分片（请求体为原始字节，offset 为分片起始偏移）"""
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return APIResponse.error(message="offset 不能为空", code=400)
+    
+    store = get_chunked_upload_store()
+    session = store.get(int(get_jwt_identity()), upload_id)
+    try:
+        session = store.append(session, offset, request.stream, request.content_length)
+    except UploadOffsetError as e:
+        return APIResponse.error(message=e.message, code=e.code, errors={"offset": e.expected_offset})
+    
+    return APIResponse.success(data=session.to_dict(), message="分片上传成功")
+
+
+@kb_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_chunked_upload(upload_id):
+    """分片上传：完成上传，校验摘要并登记文件（新内容创建入库任务）"""
+    data = request.get_json(silent=True) or {}
+    user_id = int(get_jwt_identity())
+    
+    store = get_chunked_upload_store()
+    session = store.get(user_id, upload_id)
+    # 创建会话后可能已被移出团队
+    resolve_writable(user_id, session.namespace)
+    try:
+        part_path = store.finalize(session, expected_sha256=data.get('sha256'))
+    except UploadOffsetError as e:
+        return APIResponse.error(message=e.message, code=e.code, errors={"offset": e.expected_offset})
+    
+    # 上传会话先标记为已完成：登记失败（如同名冲突）时文件内容已丢弃，需要重新上传
+    db.session.commit()
+    document, job = catalog.commit_document(
+        get_blob_store(), user_id, session.namespace, session.filename, session.sha256, session.total_size,
+        part_path, overwrite=bool(data.get('overwrite'))
+    )
+    if job:
+        ingestion_manager.notify()
+    current_app.logger.info(f"分片上传完成: {session.filename}, 大小: {session.total_size}")
+    
+    return APIResponse.success(
+        data={
+            "upload": session.to_dict(),
+            "job": _job_summary(job) if job else None,
+            "deduplicated": job is None
+        },
+        message=f"文件 {session.filename} 上传成功"
+    )
+
+
+@kb_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def abort_chunked_upload(upload_id):
+    """分片上传：取消上传"""
+    store = get_chunked_upload_store()
+    session = store.get(int(get_jwt_identity()), upload_id)
+    store.abort(session)
+    return APIResponse.success(message="已取消上传")
+
+
+@kb_bp.route('/reindex', methods=['POST'])
+@jwt_required()
+def reindex_kb():
+    """
+    增量重建索引接口：把源目录的变化同步到共享知识库，force 时重新切分全部内容
+    （需要共享知识库的写入权限）
+    """
+    data = request.get_json(silent=True) or {}
+    user_id = int(get_jwt_identity())
+    resolve_writable(user_id, SHARED)
+    config = get_upload_config()
+    
+    stats = reindex.reindex(
+        get_blob_store(),
+        current_app.config.get('KB_SOURCE_FOLDER'),
+        config['allowed_extensions'],
+        current_app.config.get('MAX_CHUNKED_UPLOAD_SIZE'),
+        user_id=user_id,
+        force=bool(data.get('force'))
+    )
+    current_app.logger.info(f"增量重建索引完成: {stats}")
+    
+    return APIResponse.success(data=stats, message="重建索引完成")
+
+
+@kb_bp.route('/ingest-jobs/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_ingest_job(job_id):
+    """查询入库任务状态接口"""
+    user_id = int(get_jwt_identity())
+    
+    job = IngestJob.query.filter_by(id=job_id, user_id=user_id).first()
+    if not job:
+        return APIResponse.not_found("任务不存在")
+    
+    return APIResponse.success(data=job.to_dict(), message="获取成功")
+
+
 @kb_bp.route('/delete', methods=['POST'])
 @jwt_required()
 def delete_file():
-    """删除文件接口"""
+    """删除文件接口（namespace 为文件所在命名空间，默认个人知识库）"""
     data = request.get_json()
     filename = data.get('filename') if data else None
     
     if not filename:
         return APIResponse.error(message="Filename is required", code=400)
+    namespace = resolve_writable(int(get_jwt_identity()), data.get('namespace'))
     
-    config = get_upload_config()
-    
-    # 安全检查，防止路径遍历攻击
+    # 安全检查，与上传时的文件名处理保持一致
     filename = secure_filename(filename)
-    file_path = os.path.join(config['folder'], filename)
-    
-    # 确保文件在允许的目录内
-    if not os.path.abspath(file_path).startswith(os.path.abspath(config['folder'])):
-        return APIResponse.error(message="Invalid file path", code=400)
     
-    if os.path.exists(file_path):
-        try:
-            # 1. 物理删除文件
-            os.remove(file_path)
-            
-            # 2. TODO: 从向量数据库中删除对应的向量
-            # collection.delete(where={"source": filename})
-            
-            current_app.logger.info(f"文件删除成功: {filename}")
-            return APIResponse.success(message=f"文件 {filename} 删除成功")
-        except (OSError, IOError) as e:
-            current_app.logger.error(f"删除文件失败 {filename}: {str(e)}")
-            return APIResponse.server_error(f"删除文件失败: {str(e)}")
-    else:
+    try:
+        # 删除目录项；内容不再被任何文件引用时删除 Blob
+        catalog.remove_document(get_blob_store(), namespace, filename)
+        db.session.commit()
+    except NotFoundError:
         return APIResponse.not_found("文件不存在")
+    except (OSError, IOError, SQLAlchemyError) as e:
+        db.session.rollback()
+        current_app.logger.error(f"删除文件失败 {filename}: {str(e)}")
+        return APIResponse.server_error(f"删除文件失败: {str(e)}")
+    
+    current_app.logger.info(f"文件删除成功: {filename}")
+    return APIResponse.success(message=f"文件 {filename} 删除成功")
+
+
+@kb_bp.route('/namespaces', methods=['GET'])
+@jwt_required()
+def list_namespaces():
+    """当前用户可读的知识库命名空间（个人、所在团队、共享）"""
+    user_id = int(get_jwt_identity())
+    teams = {
+        team_namespace(team.id): team.name
+        for team in Team.query.join(TeamMember).filter(TeamMember.user_id == user_id)
+    }
+    names = {SHARED: "共享知识库"}
+    namespaces = [
+        {
+            "namespace": namespace,
+            "name": teams.get(namespace) or names.get(namespace, "个人知识库"),
+            "writable": can_write(user_id, namespace)
+        }
+        for namespace in readable_namespaces(user_id)
+    ]
+    return APIResponse.success(data=namespaces, message="获取成功")
+
 
+@kb_bp.route('/teams', methods=['POST'])
+@jwt_required()
+def create_team():
+    """创建团队，创建者为团队所有者"""
+    data = request.get_json(silent=True) or {}
+    name = (data.get('name') or '').strip()
+    if not name:
+        return APIResponse.error(message="团队名称不能为空", code=400)
+    
+    user_id = int(get_jwt_identity())
+    team = Team(name=name[:100], created_by=user_id)
+    team.members.append(TeamMember(user_id=user_id, role=TeamMember.ROLE_OWNER))
+    db.session.add(team)
+    db.session.commit()
+    
+    result = team.to_dict()
+    result['namespace'] = team_namespace(team.id)
+    return APIResponse.success(data=result, message="创建团队成功", code=201)
+
+
+@kb_bp.route('/teams/<int:team_id>/members', methods=['POST'])
+@jwt_required()
+def add_team_member(team_id):
+    """添加团队成员（仅团队所有者）"""
+    data = request.get_json(silent=True) or {}
+    username = (data.get('username') or '').strip()
+    if not username:
+        return APIResponse.error(message="username 不能为空", code=400)
+    
+    owner = TeamMember.query.filter_by(
+        team_id=team_id, user_id=int(get_jwt_identity()), role=TeamMember.ROLE_OWNER
+    ).first()
+    if owner is None:
+        raise AuthorizationError("只有团队所有者可以添加成员")
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise NotFoundError("用户不存在")
+    if TeamMember.query.filter_by(team_id=team_id, user_id=user.id).first():
+        raise ConflictError(f"{username} 已是团队成员")
+    
+    db.session.add(TeamMember(team_id=team_id, user_id=user.id))
+    db.session.commit()
+    return APIResponse.success(
+        data={"team_id": team_id, "user_id": user.id, "username": username},
+        message="添加成员成功",
+        code=201
+    )
@@ -0,0 +1,255 @@
+"""
+异步服务模式（ASGI）
+
+同步模式（gunicorn -w 4）下每个聊天流在整个生成期间占用一个工作线程，并发流数受
+线程数限制。异步模式下：
+- 所有请求仍由原有的 Flask 蓝图处理（请求与响应行为不变），WSGI 调用在有界线程池
+  （ASGI_BLOCKING_WORKERS）中执行，不阻塞事件循环；
+- 聊天接口在请求线程中完成校验、保存用户消息和构建历史后立即返回，回答流
+  （ChatStream.aframes）在事件循环上输出：大模型请求为异步请求，只有检索阶段和
+  保存消息短暂使用线程池，一个进程可以同时保持数千个聊天流；
+- 客户端断开时取消回答流（与同步模式一样取消上游请求，不保存助手消息）。
+
+不依赖第三方 ASGI 框架，由 ASGI 服务器（如 uvicorn）加载 backend/asgi.py。
+"""
+import sys
+import asyncio
+from tempfile import SpooledTemporaryFile
+from concurrent.futures import ThreadPoolExecutor
+
+# 聊天接口通过 WSGI environ 中的该键把回答流交给事件循环（同步模式下不存在）
+ASYNC_CHAT_KEY = 'ragdemo.async_chat'
+
+# 请求体超过该大小时写入临时文件
+_BODY_SPOOL_BYTES = 1024 * 1024
+
+
+class AsyncChatSlot:
+    """请求与 ASGI 适配层之间的交接：聊天接口在 stream 中放入 ChatStream"""
+
+    def __init__(self):
+        self.stream = None
+
+
+class AsgiAdapter:
+    """在事件循环上运行 Flask 应用的 ASGI 适配层"""
+
+    def __init__(self, app, blocking_workers=64):
+        """
+        Args:
+            app: Flask 应用
+            blocking_workers: 执行 WSGI 调用与阻塞操作的线程数
+        """
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=max(1, blocking_workers), thread_name_prefix='asgi-blocking')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise ValueError(f"不支持的 ASGI 连接类型: {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        body = await self._read_body(receive)
+        if body is None:
+            return
+        slot = AsyncChatSlot()
+        environ = self._environ(scope, body, slot)
+
+        try:
+            status, headers, chunks = await loop.run_in_executor(self.executor, self._call_wsgi, environ)
+        except Exception as e:  # noqa: BLE001
+            body.close()
+            self.app.logger.error(f"处理请求时出错: {scope['method']} {scope['path']}, {str(e)}")
+            await send({'type': 'http.response.start', 'status': 500, 'headers': [(b'content-type', b'text/plain')]})
+            await send({'type': 'http.response.body', 'body': b'Internal Server Error'})
+            return
+
+        if slot.stream is not None:
+            # 聊天接口：WSGI 响应体为空，回答流在事件循环上输出
+            await loop.run_in_executor(self.executor, self._close_wsgi, chunks, body)
+            headers = [(name, value) for name, value in headers if name != b'content-length']
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            await self._stream_chat(slot.stream, receive, send)
+            return
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        # 其他响应（包括流式响应）在线程池中迭代
+        iterator = iter(chunks)
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, iterator, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await loop.run_in_executor(self.executor, self._close_wsgi, chunks, body)
+
+    async def _stream_chat(self, stream, receive, send):
+        """输出回答流；客户端断开时取消，支持续传的回答流则继续生成但不再发送"""
+        detached = False
+
+        async def pump():
+            async for frame in stream.aframes(self.executor):
+                if not detached:
+                    await send({'type': 'http.response.body', 'body': frame, 'more_body': True})
+            if not detached:
+                await send({'type': 'http.response.body', 'body': b''})
+
+        pump_task = asyncio.ensure_future(pump())
+        disconnect = asyncio.ensure_future(self._wait_disconnect(receive))
+        await asyncio.wait({pump_task, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        if pump_task.done():
+            disconnect.cancel()
+            error = pump_task.exception()
+            if error is not None:
+                self.app.logger.error(f"输出回答流时出错: {str(error)}")
+            return
+        detach = getattr(stream, 'detach', None)
+        if detach is not None and detach():
+            # 客户端已断开：继续生成并写入回答流缓冲，供重连的客户端续传
+            detached = True
+        else:
+            # 客户端已断开：取消回答流（执行各层生成器的 finally，取消上游请求）
+            pump_task.cancel()
+        try:
+            await pump_task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:  # noqa: BLE001
+            self.app.logger.warning(f"结束回答流时出错: {str(e)}")
+
+    @staticmethod
+    async def _wait_disconnect(receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    @staticmethod
+    async def _read_body(receive):
+        """读取完整请求体（客户端提前断开时返回 None）"""
+        body = SpooledTemporaryFile(max_size=_BODY_SPOOL_BYTES)
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            body.write(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+        return body
+
+    def _call_wsgi(self, environ):
+        """调用 Flask 应用，返回状态码、响应头和响应体"""
+        response = {}
+        written = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and response:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+            ]
+            return written.append
+
+        chunks = self.app(environ, start_response)
+        if written:
+            chunks = _Prepend(written, chunks)
+        return response['status'], response['headers'], chunks
+
+    @staticmethod
+    def _close_wsgi(chunks, body):
+        """关闭 WSGI 响应体（执行请求上下文的清理）与请求体"""
+        try:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            body.close()
+
+    @staticmethod
+    def _environ(scope, body, slot):
+        """由 ASGI scope 构造 WSGI environ"""
+        root_path = scope.get('root_path', '')
+        path = scope['path']
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client')
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+            'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]) if server[1] is not None else '80',
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0] if client else '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            ASYNC_CHAT_KEY: slot
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1')
+            value = value.decode('latin-1')
+            if name == 'content-type':
+                key = 'CONTENT_TYPE'
+            elif name == 'content-length':
+                key = 'CONTENT_LENGTH'
+            else:
+                key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+
+class _Prepend:
+    """先输出 start_response 返回的 write() 写入的数据，再输出响应体"""
+
+    def __init__(self, written, chunks):
+        self.written = written
+        self.chunks = chunks
+
+    def __iter__(self):
+        yield from self.written
+        yield from self.chunks
+
+    def close(self):
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def create_asgi_app(app):
+    """
+    把 Flask 应用包装为 ASGI 应用
+
+    Args:
+        app: Flask 应用
+
+    Returns:
+        AsgiAdapter
+    """
+    return AsgiAdapter(app, blocking_workers=app.config.get('ASGI_BLOCKING_WORKERS', 64))
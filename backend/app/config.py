@@ -25,6 +25,14 @@ def get_env_int(key: str, default: int) -> int:
         return default
 
 
+def get_env_float(key: str, default: float) -> float:
+    """从环境变量读取浮点数值"""
+    try:
+        return float(os.getenv(key, str(default)))
+    except (ValueError, TypeError):
+        return default
+
+
 def get_env_list(key: str, default: list, separator: str = ',') -> list:
     """从环境变量读取列表（用分隔符分隔）"""
     value = os.getenv(key, '')
@@ -74,7 +82,6 @@ class Config:
         'connect_args': {
             'check_same_thread': False,  # SQLite 多线程支持
             'timeout': 20,
-            'isolation_level': None,
         },
         'pool_pre_ping': True,
         'echo': False,  # 设置为 True 可打印 SQL 语句（调试用）
@@ -116,15 +123,227 @@ class Config:
         get_env_list('ALLOWED_EXTENSIONS', ['txt', 'pdf', 'md', 'doc', 'docx', 'csv'])
     )
     
+    # 内容寻址存储目录（按 SHA-256 保存，相同内容只保存一份）
+    BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, 'blobs')
+    
+    # 分片上传：临时文件目录、单文件上限（默认 4GB）、单个分片上限（默认 16MB）
+    UPLOAD_TMP_FOLDER = os.path.join(INSTANCE_PATH, 'upload_parts')
+    MAX_CHUNKED_UPLOAD_SIZE = get_env_int('MAX_CHUNKED_UPLOAD_SIZE', 4 * 1024 ** 3)
+    UPLOAD_PART_MAX_SIZE = get_env_int('UPLOAD_PART_MAX_SIZE', 16 * 1024 ** 2)
+    # 未完成的上传会话保留时间（小时）
+    UPLOAD_SESSION_TTL_HOURS = get_env_int('UPLOAD_SESSION_TTL_HOURS', 24)
+    
+    # ========== 文档入库配置 ==========
+    # 是否在应用启动时运行入库任务调度
+    INGEST_AUTOSTART = get_env_bool('INGEST_AUTOSTART', True)
+    # 解析进程数，0 表示使用全部 CPU 核心
+    INGEST_WORKERS = get_env_int('INGEST_WORKERS', 0)
+    # 主进程中执行向量化/写入阶段的线程数
+    INGEST_WRITER_THREADS = get_env_int('INGEST_WRITER_THREADS', 2)
+    # 单个任务最大尝试次数
+    INGEST_MAX_ATTEMPTS = get_env_int('INGEST_MAX_ATTEMPTS', 3)
+    # 队列轮询间隔（秒），同进程入队会立即唤醒调度
+    INGEST_POLL_INTERVAL = get_env_int('INGEST_POLL_INTERVAL', 2)
+    # 运行中任务的租约（秒），超时未更新进度的任务会被重新入队
+    INGEST_JOB_LEASE_SECONDS = get_env_int('INGEST_JOB_LEASE_SECONDS', 600)
+    # 单个文件加载和切分的最长秒数与最多新增内存（MB），超出时任务失败且不再重试；0 表示不限制
+    INGEST_TASK_TIMEOUT = get_env_int('INGEST_TASK_TIMEOUT', 300)
+    INGEST_TASK_MEMORY_MB = get_env_int('INGEST_TASK_MEMORY_MB', 1024)
+    # 增量同步的源目录（如挂载的文件共享），为空表示不启用
+    KB_SOURCE_FOLDER = os.getenv('KB_SOURCE_FOLDER', '')
+    # 切片 token 上限与相邻切片的重叠 token 数（中文每个字计 1 个 token）
+    CHUNK_SIZE = get_env_int('CHUNK_SIZE', 500)
+    CHUNK_OVERLAP = get_env_int('CHUNK_OVERLAP', 50)
+    
+    # ========== 嵌入服务配置 ==========
+    # 嵌入后端：hash（本地确定性特征哈希，无需模型）/ openai（OpenAI 兼容接口）
+    EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'hash')
+    EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
+    # 向量维度（openai 后端为 0 时以接口返回为准）
+    EMBEDDING_DIM = get_env_int('EMBEDDING_DIM', 384)
+    EMBEDDING_API_BASE = os.getenv('EMBEDDING_API_BASE', 'https://api.openai.com/v1')
+    EMBEDDING_API_KEY = os.getenv('EMBEDDING_API_KEY', '')
+    EMBEDDING_TIMEOUT = get_env_int('EMBEDDING_TIMEOUT', 30)
+    # 单批最大文本数
+    EMBEDDING_BATCH_SIZE = get_env_int('EMBEDDING_BATCH_SIZE', 64)
+    # 批次未满时最长等待时间（毫秒），用于合并并发请求
+    EMBEDDING_MAX_WAIT_MS = get_env_int('EMBEDDING_MAX_WAIT_MS', 10)
+    # 并行调用模型的批处理线程数
+    EMBEDDING_WORKERS = get_env_int('EMBEDDING_WORKERS', 1)
+    # 持久化嵌入缓存（float16 内存映射 + SQLite 索引），按（模型 ID，文本哈希）复用向量
+    EMBEDDING_CACHE_ENABLED = get_env_bool('EMBEDDING_CACHE_ENABLED', True)
+    EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', os.path.join(INSTANCE_PATH, 'embedding_cache'))
+    # 每个模型最多缓存的向量条数，超出后按最近最少使用淘汰
+    EMBEDDING_CACHE_MAX_ENTRIES = get_env_int('EMBEDDING_CACHE_MAX_ENTRIES', 200000)
+    
     # ========== 日志配置 ==========
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FILE = os.path.join(LOGS_FOLDER, 'app.log')
     
+    # ========== 向量库配置 ==========
+    # 向量库后端：numpy（内置，内存映射 + 精确检索）/ ivf（内置，倒排索引近似检索）/ chroma（需要安装 chromadb）
+    VECTOR_STORE_BACKEND = os.getenv('VECTOR_STORE_BACKEND', 'numpy')
+    VECTOR_STORE_PATH = os.getenv('VECTOR_STORE_PATH', os.path.join(INSTANCE_PATH, 'vector_store'))
+    # 内置向量库新建时的存储精度：float32 检索时直接走 BLAS；float16 占用减半，但每次检索都要把
+    # 扫描的块转换为 float32，内存紧张、能接受更高检索延迟时再使用
+    VECTOR_STORE_DTYPE = os.getenv('VECTOR_STORE_DTYPE', 'float32')
+    # ivf 后端：簇数量（建议约为向量数的平方根）与检索时探查的簇数量（越大召回越高、越慢）
+    IVF_NLIST = get_env_int('IVF_NLIST', 1024)
+    IVF_NPROBE = get_env_int('IVF_NPROBE', 16)
+    # k-means 迭代次数与每个簇的训练采样数
+    IVF_TRAIN_ITERS = get_env_int('IVF_TRAIN_ITERS', 10)
+    IVF_TRAIN_SAMPLE_PER_LIST = get_env_int('IVF_TRAIN_SAMPLE_PER_LIST', 64)
+    # 开始训练的最少向量数，0 表示 IVF_NLIST * 39；不足时使用精确检索
+    IVF_MIN_TRAIN_SIZE = get_env_int('IVF_MIN_TRAIN_SIZE', 0)
+    # 内置向量库：删除的槽位占比超过 VECTOR_COMPACT_RATIO 且不少于 VECTOR_COMPACT_MIN_DELETED 个时后台压缩
+    VECTOR_COMPACT_RATIO = get_env_float('VECTOR_COMPACT_RATIO', 0.3)
+    VECTOR_COMPACT_MIN_DELETED = get_env_int('VECTOR_COMPACT_MIN_DELETED', 1024)
+    
+    # ========== 关键词索引配置 ==========
+    # 是否启用 BM25 关键词检索（与向量检索结果融合）
+    KEYWORD_INDEX_ENABLED = get_env_bool('KEYWORD_INDEX_ENABLED', True)
+    KEYWORD_INDEX_PATH = os.getenv('KEYWORD_INDEX_PATH', os.path.join(INSTANCE_PATH, 'keyword_index'))
+    # BM25 参数：k1 控制词频饱和，b 控制文档长度归一化
+    BM25_K1 = get_env_float('BM25_K1', 1.2)
+    BM25_B = get_env_float('BM25_B', 0.75)
+    # 索引段数量上限，超过后合并较小的段
+    KEYWORD_MAX_SEGMENTS = get_env_int('KEYWORD_MAX_SEGMENTS', 8)
+    
+    # ========== 知识库命名空间配置 ==========
+    # 每个命名空间（个人 / 团队 / 共享）的向量库和关键词索引是独立的分片，按需打开：
+    # 空闲超过 KB_SHARD_IDLE_SECONDS 秒（0 表示不按空闲时间关闭）或打开数超过 KB_SHARD_MAX_OPEN 时关闭最久未用的分片
+    KB_SHARD_IDLE_SECONDS = get_env_int('KB_SHARD_IDLE_SECONDS', 600)
+    KB_SHARD_MAX_OPEN = get_env_int('KB_SHARD_MAX_OPEN', 64)
+    
     # ========== ChromaDB 配置 ==========
     CHROMA_DB_PATH = os.getenv(
         'CHROMA_DB_PATH',
         os.path.join(INSTANCE_PATH, 'chroma_db')
     )
+    
+    # ========== RAG 配置 ==========
+    # 检索返回的切片数量
+    RAG_TOP_K = get_env_int('RAG_TOP_K', 5)
+    # 查询向量化的最长等待时间（秒）
+    RAG_QUERY_TIMEOUT = get_env_int('RAG_QUERY_TIMEOUT', 10)
+    # 向量检索和关键词检索各自召回的候选数量（融合后取 RAG_TOP_K）
+    RAG_CANDIDATES = get_env_int('RAG_CANDIDATES', 20)
+    # 倒数排名融合（RRF）常数：得分为 Σ 1 / (RAG_RRF_K + 排名)
+    RAG_RRF_K = get_env_int('RAG_RRF_K', 60)
+    # 流水线各阶段的时间预算（毫秒），超时后降级继续：向量化失败只用关键词检索、检索失败不带参考资料回答、
+    # 组装超时跳过 MMR；生成之前的阶段共享总预算 RAG_TTFT_BUDGET_MS，保证首个回答片段的等待时间有上限
+    RAG_TTFT_BUDGET_MS = get_env_int('RAG_TTFT_BUDGET_MS', 5000)
+    RAG_EMBED_BUDGET_MS = get_env_int('RAG_EMBED_BUDGET_MS', 2000)
+    RAG_RETRIEVE_BUDGET_MS = get_env_int('RAG_RETRIEVE_BUDGET_MS', 2000)
+    RAG_PACK_BUDGET_MS = get_env_int('RAG_PACK_BUDGET_MS', 1000)
+    # 阶段到达截止时间后额外等待的收尾时间（毫秒）与执行阶段的线程数
+    RAG_STAGE_GRACE_MS = get_env_int('RAG_STAGE_GRACE_MS', 50)
+    RAG_STAGE_WORKERS = get_env_int('RAG_STAGE_WORKERS', 16)
+    
+    # ========== 大模型配置 ==========
+    # 生成后端：mock（固定回复，逐字符输出）/ openai（OpenAI 兼容的 /chat/completions 流式接口）
+    LLM_BACKEND = os.getenv('LLM_BACKEND', 'mock')
+    LLM_API_BASE = os.getenv('LLM_API_BASE', 'http://localhost:8000/v1')
+    LLM_MODEL = os.getenv('LLM_MODEL', 'qwen2.5-7b-instruct')
+    LLM_API_KEY = os.getenv('LLM_API_KEY', '')
+    # 两个片段之间的最长等待时间与建立连接的超时（秒）
+    LLM_TIMEOUT = get_env_int('LLM_TIMEOUT', 60)
+    LLM_CONNECT_TIMEOUT = get_env_int('LLM_CONNECT_TIMEOUT', 5)
+    # 首个片段之前遇到连接错误、超时或 429/5xx 时的最大重试次数（之后出错不再重试）
+    LLM_MAX_RETRIES = get_env_int('LLM_MAX_RETRIES', 2)
+    # keep-alive 连接池大小（进程内所有生成请求共享）
+    LLM_POOL_SIZE = get_env_int('LLM_POOL_SIZE', 32)
+    # 异步服务模式下的连接数上限（生成请求在事件循环上发出，需要安装 httpx）
+    LLM_ASYNC_POOL_SIZE = get_env_int('LLM_ASYNC_POOL_SIZE', 1024)
+    # 采样温度（小于 0 时使用服务端默认值）与最大生成 token 数（0 时使用服务端默认值）
+    LLM_TEMPERATURE = get_env_float('LLM_TEMPERATURE', -1)
+    LLM_MAX_TOKENS = get_env_int('LLM_MAX_TOKENS', 0)
+    # mock 后端每个字符的输出间隔（毫秒，模拟上游生成速度；打字机效果由前端完成，默认不等待）
+    LLM_MOCK_TOKEN_DELAY_MS = get_env_int('LLM_MOCK_TOKEN_DELAY_MS', 0)
+    # 首个片段与整体生成的预算（毫秒），超时后取消上游请求
+    LLM_FIRST_TOKEN_BUDGET_MS = get_env_int('LLM_FIRST_TOKEN_BUDGET_MS', 10000)
+    LLM_GENERATE_BUDGET_MS = get_env_int('LLM_GENERATE_BUDGET_MS', 120000)
+    
+    # ========== 流式响应配置 ==========
+    # 首个回答片段立即发送，之后的片段合并成一个 SSE 帧：累计字节数达到 SSE_FLUSH_BYTES
+    # 或最早的片段已等待 SSE_FLUSH_INTERVAL_MS 毫秒时发送
+    SSE_FLUSH_BYTES = get_env_int('SSE_FLUSH_BYTES', 512)
+    SSE_FLUSH_INTERVAL_MS = get_env_int('SSE_FLUSH_INTERVAL_MS', 50)
+    
+    # ========== 消息写入配置 ==========
+    # 助手消息由后台线程批量写入（false 时在聊天流结束时直接写入）
+    MESSAGE_WRITE_BEHIND = get_env_bool('MESSAGE_WRITE_BEHIND', True)
+    # 每批最多写入的消息数与最早的消息最长等待（毫秒）
+    MESSAGE_WRITE_BATCH_SIZE = get_env_int('MESSAGE_WRITE_BATCH_SIZE', 100)
+    MESSAGE_WRITE_INTERVAL_MS = get_env_int('MESSAGE_WRITE_INTERVAL_MS', 50)
+    # 写入队列上限，队列已满时由聊天请求直接写入
+    MESSAGE_WRITE_QUEUE_SIZE = get_env_int('MESSAGE_WRITE_QUEUE_SIZE', 10000)
+    # 继续对话前等待上一条回答写入的最长时间（毫秒），包括其他工作进程写入队列中的回答
+    MESSAGE_WRITE_WAIT_MS = get_env_int('MESSAGE_WRITE_WAIT_MS', 1000)
+    
+    # ========== 回答流续传配置 ==========
+    # 聊天 SSE 事件带 id 并写入本机共享的回答流缓冲，客户端断线后带 Last-Event-ID 重连时续传
+    STREAM_RESUME_ENABLED = get_env_bool('STREAM_RESUME_ENABLED', True)
+    STREAM_BUFFER_PATH = os.getenv('STREAM_BUFFER_PATH', os.path.join(INSTANCE_PATH, 'stream_buffer'))
+    # 每个回答流保留的事件数（环形缓冲），更早的事件续传时无法补发
+    STREAM_BUFFER_MAX_EVENTS = get_env_int('STREAM_BUFFER_MAX_EVENTS', 256)
+    # 回答流结束后保留的秒数
+    STREAM_BUFFER_TTL = get_env_int('STREAM_BUFFER_TTL', 60)
+    # 批量写入缓冲的间隔（毫秒）；续传一侧按 STREAM_BUFFER_POLL_MS 轮询新事件
+    STREAM_BUFFER_FLUSH_MS = get_env_int('STREAM_BUFFER_FLUSH_MS', 100)
+    STREAM_BUFFER_POLL_MS = get_env_int('STREAM_BUFFER_POLL_MS', 100)
+    # 客户端断开后继续生成的最长秒数，0 表示立即取消生成
+    STREAM_DETACH_TIMEOUT = get_env_int('STREAM_DETACH_TIMEOUT', 30)
+    
+    # ========== 异步服务配置 ==========
+    # 异步服务模式（uvicorn asgi:app）下执行 WSGI 调用和阻塞操作（数据库、检索阶段）的线程数；
+    # 聊天回答流在事件循环上输出，不占用这些线程
+    ASGI_BLOCKING_WORKERS = get_env_int('ASGI_BLOCKING_WORKERS', 64)
+    
+    # ========== 重排序配置 ==========
+    # 检索后用打分器对候选重新排序：lexical（词项重叠，无需模型）/ cross-encoder（调用 /rerank 接口）
+    RERANK_ENABLED = get_env_bool('RERANK_ENABLED', True)
+    RERANK_SCORER = os.getenv('RERANK_SCORER', 'lexical')
+    RERANK_API_BASE = os.getenv('RERANK_API_BASE', 'http://localhost:8080')
+    RERANK_MODEL = os.getenv('RERANK_MODEL', 'bge-reranker-base')
+    RERANK_API_KEY = os.getenv('RERANK_API_KEY', '')
+    RERANK_TIMEOUT = get_env_int('RERANK_TIMEOUT', 10)
+    # 参与重排序、上下文组装的候选数量与每批打分的候选数
+    RERANK_CANDIDATES = get_env_int('RERANK_CANDIDATES', 20)
+    RERANK_BATCH_SIZE = get_env_int('RERANK_BATCH_SIZE', 8)
+    # 每次请求的重排序预算（毫秒），超时后未打分的候选保持检索顺序
+    RERANK_BUDGET_MS = get_env_int('RERANK_BUDGET_MS', 300)
+    
+    # ========== 上下文组装配置 ==========
+    # 参考资料的 token 预算（最多选择 RAG_TOP_K 个切片，相邻切片合并）
+    CONTEXT_MAX_TOKENS = get_env_int('CONTEXT_MAX_TOKENS', 2000)
+    # token 计数：simple（与切分器相同的规则）/ tiktoken:<编码名>（需要安装 tiktoken，如 tiktoken:cl100k_base）
+    CONTEXT_TOKENIZER = os.getenv('CONTEXT_TOKENIZER', 'simple')
+    TOKENIZER_CACHE_SIZE = get_env_int('TOKENIZER_CACHE_SIZE', 4096)
+    # MMR 相关性权重（越小越强调去重和多样性）
+    MMR_LAMBDA = get_env_float('MMR_LAMBDA', 0.5)
+    # 剩余预算少于此值时不再截断放入新的段
+    CONTEXT_MIN_TRUNCATE_TOKENS = get_env_int('CONTEXT_MIN_TRUNCATE_TOKENS', 32)
+    
+    # ========== 对话历史配置 ==========
+    # 发送给大模型的历史消息 token 预算（0 表示不带历史），按 (created_at, id) 从新到旧分页读取
+    HISTORY_MAX_TOKENS = get_env_int('HISTORY_MAX_TOKENS', 1500)
+    HISTORY_PAGE_SIZE = get_env_int('HISTORY_PAGE_SIZE', 20)
+    # 滑出窗口的消息折叠为滚动摘要（保存在对话上）：摘要上限与每条消息保留的 token 数
+    HISTORY_SUMMARY_MAX_TOKENS = get_env_int('HISTORY_SUMMARY_MAX_TOKENS', 500)
+    HISTORY_SUMMARY_LINE_TOKENS = get_env_int('HISTORY_SUMMARY_LINE_TOKENS', 60)
+    
+    # ========== 语义答案缓存配置 ==========
+    # 相似问题（查询向量余弦相似度不低于阈值）直接重放缓存的回答和来源；知识库变化后自动失效
+    ANSWER_CACHE_ENABLED = get_env_bool('ANSWER_CACHE_ENABLED', True)
+    ANSWER_CACHE_THRESHOLD = get_env_float('ANSWER_CACHE_THRESHOLD', 0.95)
+    # 条目有效期（秒，0 表示不过期）与每个工作进程最多缓存的条目数
+    ANSWER_CACHE_TTL = get_env_int('ANSWER_CACHE_TTL', 3600)
+    ANSWER_CACHE_MAX_ENTRIES = get_env_int('ANSWER_CACHE_MAX_ENTRIES', 1000)
+    
+    # ========== 请求合并配置 ==========
+    # 同一时间相同的问题（知识库版本、检索范围和对话历史也相同）只检索和生成一次，事件分发给所有请求
+    CHAT_COALESCE_ENABLED = get_env_bool('CHAT_COALESCE_ENABLED', True)
 
 
 class DevelopmentConfig(Config):
@@ -161,6 +380,7 @@ class TestingConfig(Config):
     """测试环境配置"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    INGEST_AUTOSTART = False
 
 
 # 配置字典
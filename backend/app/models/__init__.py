@@ -3,6 +3,10 @@
 """
 from app.models.user import User
 from app.models.conversation import Conversation, Message
+from app.models.ingest_job import IngestJob
+from app.models.upload_session import UploadSession
+from app.models.knowledge_base import KBBlob, KBChunk, KBChunkText, KBDocument, KBRevision
+from app.models.team import Team, TeamMember
 
-__all__ = ['User', 'Conversation', 'Message']
-
+__all__ = ['User', 'Conversation', 'Message', 'IngestJob', 'UploadSession', 'KBBlob', 'KBChunk', 'KBChunkText',
+           'KBDocument', 'KBRevision', 'Team', 'TeamMember']
@@ -14,6 +14,10 @@ class Conversation(db.Model):
     title = db.Column(db.String(200), nullable=False)  # 对话标题（通常是第一条用户消息的摘要）
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
+    # 滚动摘要：滑出历史窗口的较早消息压缩成的摘要，覆盖到 (summary_until_at, summary_until_id) 为止（含）
+    summary = db.Column(db.Text)
+    summary_until_at = db.Column(db.DateTime)
+    summary_until_id = db.Column(db.Integer)
     
     # 关系
     user = db.relationship('User', backref=db.backref('conversations', lazy=True, cascade='all, delete-orphan'))
@@ -50,6 +54,10 @@ class Conversation(db.Model):
 class Message(db.Model):
     """消息模型"""
     __tablename__ = 'messages'
+    __table_args__ = (
+        # 历史窗口按 (created_at, id) 从新到旧分页读取（keyset）
+        db.Index('ix_messages_conversation_created_id', 'conversation_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id', ondelete='CASCADE'), nullable=False, index=True)
@@ -0,0 +1,66 @@
+"""
+文档入库任务模型
+"""
+from datetime import datetime
+from app.extensions import db
+
+
+class IngestJob(db.Model):
+    """文档入库任务模型（持久化任务队列）"""
+    __tablename__ = 'ingest_jobs'
+    __table_args__ = (
+        # 领取任务时按 (status, id) 扫描
+        db.Index('ix_ingest_jobs_status_id', 'status', 'id'),
+    )
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(1024), nullable=False)
+    file_type = db.Column(db.String(16))  # 扩展名，Blob 文件本身不带扩展名
+    blob_sha256 = db.Column(db.String(64), index=True)  # 入库内容的摘要，同一内容在每个命名空间只入库一次
+    namespace = db.Column(db.String(64), nullable=False)  # 写入的知识库命名空间（索引分片）
+    status = db.Column(db.String(20), default=STATUS_PENDING, nullable=False)
+    stage = db.Column(db.String(20))  # 当前阶段：load（加载与切分）/ embed / write
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    chunk_count = db.Column(db.Integer, default=0, nullable=False)
+    vector_count = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # 最近一次进度更新时间，用于回收超时任务
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        """
+        转换为字典（用于 API 返回）
+
+        Returns:
+            dict: 任务信息字典
+        """
+        def _iso(value):
+            return (value.isoformat() + 'Z') if value else None
+
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'sha256': self.blob_sha256,
+            'namespace': self.namespace,
+            'status': self.status,
+            'stage': self.stage,
+            'attempts': self.attempts,
+            'chunk_count': self.chunk_count,
+            'vector_count': self.vector_count,
+            'error': self.error,
+            'created_at': _iso(self.created_at),
+            'started_at': _iso(self.started_at),
+            'finished_at': _iso(self.finished_at)
+        }
+
+    def __repr__(self):
+        return f'<IngestJob {self.id}: {self.filename} {self.status}>'
@@ -0,0 +1,189 @@
+"""
+知识库目录模型
+文件内容按 SHA-256 存储为 Blob，各命名空间（个人、团队、共享知识库）中的
+文件名通过 KBDocument 映射到 Blob，Blob 切分后的切片按内容哈希记录在 KBChunk 中
+（向量以切片哈希为 ID，写入文件所在命名空间的索引分片）
+"""
+from datetime import datetime
+from app.extensions import db
+
+
+class KBBlob(db.Model):
+    """内容寻址的文件内容（同一内容只存储一次，每个命名空间只入库一次）"""
+    __tablename__ = 'kb_blobs'
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    file_type = db.Column(db.String(16), nullable=False)  # 首次上传时的扩展名，决定使用的加载器
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    documents = db.relationship('KBDocument', backref='blob', lazy=True)
+
+    def __repr__(self):
+        return f'<KBBlob {self.sha256[:12]}>'
+
+
+class KBChunk(db.Model):
+    """Blob 的切片清单（按顺序记录切片内容哈希）"""
+    __tablename__ = 'kb_chunks'
+    __table_args__ = (
+        db.UniqueConstraint('blob_sha256', 'seq', name='uq_kb_chunks_blob_seq'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    blob_sha256 = db.Column(db.String(64), nullable=False, index=True)
+    seq = db.Column(db.Integer, nullable=False)  # 切片在文件中的顺序
+    chunk_hash = db.Column(db.String(32), nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<KBChunk {self.blob_sha256[:12]}#{self.seq} {self.chunk_hash}>'
+
+
+class KBChunkText(db.Model):
+    """切片正文（按切片哈希去重存储，与向量同时写入、删除）"""
+    __tablename__ = 'kb_chunk_texts'
+
+    chunk_hash = db.Column(db.String(32), primary_key=True)
+    text = db.Column(db.Text, nullable=False)
+
+    def __repr__(self):
+        return f'<KBChunkText {self.chunk_hash}>'
+
+
+class KBDocument(db.Model):
+    """
+    知识库文件目录（命名空间 + 文件名 → Blob），同时作为增量重建索引的清单
+
+    入库状态和切片、向量数记录的是 Blob 在该命名空间索引分片中的状态，同一命名空间
+    中引用同一 Blob 的目录项在同一事务中一起更新；知识库文件列表按索引筛选、分页，
+    不需要关联查询或扫描上传目录。
+    """
+    __tablename__ = 'kb_documents'
+    __table_args__ = (
+        db.UniqueConstraint('namespace', 'filename', name='uq_kb_documents_namespace_filename'),
+        # 按状态、类型筛选后按文件名分页
+        db.Index('ix_kb_documents_namespace_status_filename', 'namespace', 'status', 'filename'),
+        db.Index('ix_kb_documents_namespace_type_filename', 'namespace', 'file_type', 'filename'),
+    )
+
+    STATUS_PENDING = 'pending'
+    STATUS_INDEXED = 'indexed'
+    STATUS_FAILED = 'failed'
+
+    ORIGIN_UPLOAD = 'upload'
+    ORIGIN_SYNC = 'sync'  # 从 KB_SOURCE_FOLDER 同步，filename 为相对路径
+
+    id = db.Column(db.Integer, primary_key=True)
+    namespace = db.Column(db.String(64), nullable=False)  # user:<id> / team:<id> / shared
+    filename = db.Column(db.String(512), nullable=False, index=True)
+    blob_sha256 = db.Column(db.String(64), db.ForeignKey('kb_blobs.sha256'), nullable=False, index=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    file_type = db.Column(db.String(16), nullable=False)
+    origin = db.Column(db.String(20), default=ORIGIN_UPLOAD, nullable=False, index=True)
+    status = db.Column(db.String(20), default=STATUS_PENDING, nullable=False)
+    chunk_count = db.Column(db.Integer, default=0, nullable=False)
+    vector_count = db.Column(db.Integer, default=0, nullable=False)  # 与同一命名空间中同内容的文件共享
+    source_mtime_ns = db.Column(db.BigInteger)  # 同步文件的修改时间，与 size 一起用于跳过未变化的文件
+    uploaded_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        """
+        转换为字典（用于 API 返回）
+
+        Returns:
+            dict: 文件信息字典
+        """
+        return {
+            'name': self.filename,
+            'namespace': self.namespace,
+            'size': f"{self.size / 1024:.1f} KB",
+            'size_bytes': self.size,
+            'type': self.file_type,
+            'sha256': self.blob_sha256,
+            'origin': self.origin,
+            'status': self.status,
+            'chunk_count': self.chunk_count,
+            'vector_count': self.vector_count,
+            'updated_at': self.updated_at.isoformat() + 'Z' if self.updated_at else None
+        }
+
+    @classmethod
+    def set_index_state(cls, namespace, blob_sha256, status, chunk_count=None, vector_count=None):
+        """更新命名空间中引用该 Blob 的全部目录项的入库状态（由调用方提交事务）"""
+        values = {cls.status: status}
+        if chunk_count is not None:
+            values[cls.chunk_count] = chunk_count
+        if vector_count is not None:
+            values[cls.vector_count] = vector_count
+        cls.query.filter_by(namespace=namespace, blob_sha256=blob_sha256)\
+            .update(values, synchronize_session='evaluate')
+
+    def __repr__(self):
+        return f'<KBDocument {self.namespace}/{self.filename} -> {self.blob_sha256[:12]}>'
+
+
+class KBRevision(db.Model):
+    """
+    知识库版本号（每个命名空间一行）
+
+    命名空间的目录或切片内容变化时在同一事务中递增该命名空间的版本号，依赖知识库
+    内容的缓存（如语义答案缓存、请求合并）以检索范围内各命名空间的版本号区分新旧
+    内容：一个命名空间的变化不影响其他命名空间，多个工作进程无需互相通知。
+    """
+    __tablename__ = 'kb_revisions'
+
+    namespace = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    @classmethod
+    def current(cls, namespaces):
+        """
+        各命名空间当前的版本号
+
+        Returns:
+            dict: {命名空间: 版本号}（尚未有任何变化的命名空间为 0）
+        """
+        namespaces = sorted(set(namespaces))
+        if not namespaces:
+            return {}
+        versions = dict(
+            db.session.query(cls.namespace, cls.version).filter(cls.namespace.in_(namespaces))
+        )
+        return {namespace: versions.get(namespace, 0) for namespace in namespaces}
+
+    @classmethod
+    def bump(cls, namespace):
+        """递增命名空间的版本号（由调用方提交事务）；首次变化时插入，并发插入不会冲突"""
+        now = datetime.utcnow()
+        stmt = _upsert(cls.__table__, db.session.get_bind().dialect.name)
+        if stmt is not None:
+            stmt = stmt.values(namespace=namespace, version=1, updated_at=now).on_conflict_do_update(
+                index_elements=[cls.namespace],
+                set_={'version': cls.__table__.c.version + 1, 'updated_at': now}
+            )
+            db.session.execute(stmt)
+            return
+        # 不支持 upsert 的数据库：先更新，没有该行时插入
+        updated = cls.query.filter_by(namespace=namespace).update(
+            {cls.version: cls.version + 1, cls.updated_at: now}, synchronize_session=False
+        )
+        if not updated:
+            db.session.add(cls(namespace=namespace, version=1, updated_at=now))
+            db.session.flush()
+
+    def __repr__(self):
+        return f'<KBRevision {self.namespace}: {self.version}>'
+
+
+def _upsert(table, dialect):
+    """支持 INSERT ... ON CONFLICT DO UPDATE 的数据库返回对应的 insert 语句，否则返回 None"""
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert(table)
@@ -0,0 +1,55 @@
+"""
+团队模型
+团队成员可以读写团队知识库（命名空间 team:<id>）
+"""
+from datetime import datetime
+from app.extensions import db
+
+
+class Team(db.Model):
+    """团队模型"""
+    __tablename__ = 'teams'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    members = db.relationship('TeamMember', backref='team', lazy=True, cascade='all, delete-orphan')
+
+    def to_dict(self):
+        """
+        转换为字典（用于 API 返回）
+
+        Returns:
+            dict: 团队信息字典
+        """
+        return {
+            'id': self.id,
+            'name': self.name,
+            'created_by': self.created_by,
+            'created_at': (self.created_at.isoformat() + 'Z') if self.created_at else None
+        }
+
+    def __repr__(self):
+        return f'<Team {self.id}: {self.name}>'
+
+
+class TeamMember(db.Model):
+    """团队成员模型"""
+    __tablename__ = 'team_members'
+    __table_args__ = (
+        db.UniqueConstraint('team_id', 'user_id', name='uq_team_members_team_user'),
+    )
+
+    ROLE_OWNER = 'owner'
+    ROLE_MEMBER = 'member'
+
+    id = db.Column(db.Integer, primary_key=True)
+    team_id = db.Column(db.Integer, db.ForeignKey('teams.id', ondelete='CASCADE'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    role = db.Column(db.String(20), default=ROLE_MEMBER, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<TeamMember team={self.team_id} user={self.user_id} {self.role}>'
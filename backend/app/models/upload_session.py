@@ -0,0 +1,46 @@
+"""
+分片上传会话模型
+"""
+from datetime import datetime
+from app.extensions import db
+
+
+class UploadSession(db.Model):
+    """分片上传会话模型"""
+    __tablename__ = 'upload_sessions'
+
+    STATUS_UPLOADING = 'uploading'
+    STATUS_COMPLETED = 'completed'
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    namespace = db.Column(db.String(64), nullable=False)  # 完成后登记到的知识库命名空间
+    filename = db.Column(db.String(255), nullable=False)  # 已经过 secure_filename 处理
+    total_size = db.Column(db.BigInteger, nullable=False)
+    received_size = db.Column(db.BigInteger, default=0, nullable=False)  # 已落盘的字节数，即续传偏移
+    sha256 = db.Column(db.String(64))  # 完成后的内容摘要
+    status = db.Column(db.String(20), default=STATUS_UPLOADING, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
+
+    def to_dict(self):
+        """
+        转换为字典（用于 API 返回）
+
+        Returns:
+            dict: 上传会话信息字典
+        """
+        return {
+            'upload_id': self.id,
+            'namespace': self.namespace,
+            'filename': self.filename,
+            'total_size': self.total_size,
+            'received_size': self.received_size,
+            'sha256': self.sha256,
+            'status': self.status,
+            'created_at': (self.created_at.isoformat() + 'Z') if self.created_at else None,
+            'updated_at': (self.updated_at.isoformat() + 'Z') if self.updated_at else None
+        }
+
+    def __repr__(self):
+        return f'<UploadSession {self.id}: {self.filename} {self.received_size}/{self.total_size}>'
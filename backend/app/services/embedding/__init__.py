@@ -0,0 +1,16 @@
+"""
+嵌入服务
+"""
+from .backends import (
+    EmbeddingBackend, EmbeddingError, HashEmbeddingBackend, OpenAIEmbeddingBackend, create_backend
+)
+from .cache import EmbeddingCache
+from .service import EmbeddingService
+
+# 全局嵌入服务，在应用工厂中通过 init_app 绑定
+embedding_service = EmbeddingService()
+
+__all__ = [
+    'EmbeddingBackend', 'EmbeddingCache', 'EmbeddingError', 'HashEmbeddingBackend', 'OpenAIEmbeddingBackend',
+    'EmbeddingService', 'create_backend', 'embedding_service'
+]
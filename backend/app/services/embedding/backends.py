@@ -0,0 +1,128 @@
+"""
+嵌入模型后端
+
+所有后端返回 L2 归一化的 float32 矩阵，形状为 (len(texts), dimension)。
+"""
+import zlib
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.services.ingestion.splitter import tokenize
+
+
+class EmbeddingError(Exception):
+    """嵌入服务调用失败"""
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+class EmbeddingBackend:
+    """嵌入后端基类"""
+
+    model_id = 'base'
+    dimension = 0
+
+    def embed_batch(self, texts):
+        """
+        批量计算嵌入
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            np.ndarray: (len(texts), dimension) 的 float32 矩阵
+        """
+        raise NotImplementedError
+
+
+class HashEmbeddingBackend(EmbeddingBackend):
+    """
+    确定性的本地哈希嵌入（特征哈希）
+
+    以 token 及相邻 token 二元组为特征，用 CRC32 映射到固定维度并带符号累加。
+    结果与进程、机器无关，词汇重叠越多相似度越高，用于离线开发和测试。
+    """
+
+    def __init__(self, dimension=384):
+        self.dimension = dimension
+        self.model_id = f'hash-{dimension}'
+
+    def embed_batch(self, texts):
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        rows, cols, signs = [], [], []
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            features = tokens + [a + b for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                h = zlib.crc32(feature.encode('utf-8'))
+                rows.append(row)
+                cols.append(h % self.dimension)
+                signs.append(1.0 if h & 0x80000000 else -1.0)
+        if rows:
+            np.add.at(matrix, (np.array(rows), np.array(cols)), np.array(signs, dtype=np.float32))
+        return _normalize(matrix)
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """OpenAI 兼容的 /embeddings 接口（复用 keep-alive 连接）"""
+
+    def __init__(self, api_base, model, api_key='', dimension=0, timeout=30, pool_size=8):
+        self.url = api_base.rstrip('/') + '/embeddings'
+        self.model_id = model
+        self.dimension = dimension
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if api_key:
+            self.session.headers['Authorization'] = f'Bearer {api_key}'
+
+    def embed_batch(self, texts):
+        try:
+            response = self.session.post(
+                self.url,
+                json={'model': self.model_id, 'input': list(texts)},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            items = sorted(response.json()['data'], key=lambda item: item['index'])
+        except (requests.RequestException, KeyError, ValueError) as e:
+            raise EmbeddingError(f"调用嵌入接口失败: {str(e)}") from e
+
+        matrix = np.asarray([item['embedding'] for item in items], dtype=np.float32)
+        if matrix.shape[0] != len(texts):
+            raise EmbeddingError("嵌入接口返回的数量与输入不一致")
+        self.dimension = matrix.shape[1]
+        return _normalize(matrix)
+
+
+def create_backend(config):
+    """
+    根据配置创建嵌入后端
+
+    Args:
+        config: 应用配置
+
+    Returns:
+        EmbeddingBackend: 嵌入后端
+    """
+    name = config.get('EMBEDDING_BACKEND', 'hash')
+    if name == 'hash':
+        return HashEmbeddingBackend(config.get('EMBEDDING_DIM', 384))
+    if name == 'openai':
+        return OpenAIEmbeddingBackend(
+            api_base=config['EMBEDDING_API_BASE'],
+            model=config['EMBEDDING_MODEL'],
+            api_key=config.get('EMBEDDING_API_KEY', ''),
+            dimension=config.get('EMBEDDING_DIM', 0),
+            timeout=config.get('EMBEDDING_TIMEOUT', 30),
+            pool_size=config.get('EMBEDDING_WORKERS', 1) * 2
+        )
+    raise ValueError(f"未知的嵌入后端: {name}")
@@ -0,0 +1,280 @@
+"""
+持久化嵌入缓存
+
+以（模型 ID，规范化文本哈希）为键缓存向量，重复入库、改名文件和重复出现的
+模板段落都不会被二次向量化。
+- 向量以 float16 存放在按模型划分的内存映射文件中，每条记录占一个固定槽位；
+- SQLite 索引记录 键 → 槽位 及最近使用时间，条目数超过上限时按 LRU 淘汰，
+  释放的槽位被复用，文件大小不会无限增长；
+- 槽位分配和淘汰在 SQLite 写事务中完成，多个工作进程可以共享同一缓存目录。
+"""
+import os
+import re
+import time
+import sqlite3
+import threading
+
+import numpy as np
+
+# 单次 SQL 中 IN 子句的最大参数个数
+_IN_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    model TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (model, text_hash)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_entries_model_last_used ON entries (model, last_used);
+CREATE TABLE IF NOT EXISTS models (
+    model TEXT PRIMARY KEY,
+    dimension INTEGER NOT NULL,
+    next_slot INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS free_slots (
+    model TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    PRIMARY KEY (model, slot)
+) WITHOUT ROWID;
+"""
+
+
+class EmbeddingCache:
+    """float16 内存映射 + SQLite 索引的嵌入缓存"""
+
+    def __init__(self, root, max_entries=200000, evict_fraction=0.05):
+        """
+        Args:
+            root: 缓存目录
+            max_entries: 每个模型最多缓存的向量条数
+            evict_fraction: 达到上限时一次淘汰的比例（批量淘汰减少写事务）
+        """
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_entries = max_entries
+        self.evict_batch = max(1, int(max_entries * evict_fraction))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(root, 'index.sqlite'),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        self._maps = {}  # model -> np.memmap
+        self._stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['EMBEDDING_CACHE_PATH'], config.get('EMBEDDING_CACHE_MAX_ENTRIES', 200000))
+
+    # ========== 读写接口 ==========
+
+    def get_many(self, model, text_hashes):
+        """
+        批量查询缓存
+
+        Args:
+            model: 模型 ID
+            text_hashes: 规范化文本哈希列表
+
+        Returns:
+            dict: text_hash -> float32 向量（只包含命中的条目）
+        """
+        keys = list(dict.fromkeys(text_hashes))
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            rows = []
+            for i in range(0, len(keys), _IN_BATCH):
+                batch = keys[i:i + _IN_BATCH]
+                rows.extend(self._conn.execute(
+                    f"SELECT text_hash, slot FROM entries WHERE model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch]
+                ))
+            if rows:
+                vectors = self._map(model, max(slot for _, slot in rows))
+                if vectors is not None:
+                    slots = np.fromiter((slot for _, slot in rows), dtype=np.int64, count=len(rows))
+                    matrix = np.asarray(vectors[slots], dtype=np.float32)
+                    found = {text_hash: matrix[i] for i, (text_hash, _) in enumerate(rows)}
+                    # 只更新最近使用时间，不需要强一致
+                    now = time.time()
+                    try:
+                        self._conn.execute('BEGIN')
+                        self._conn.executemany(
+                            "UPDATE entries SET last_used = ? WHERE model = ? AND text_hash = ?",
+                            [(now, model, text_hash) for text_hash in found]
+                        )
+                        self._conn.execute('COMMIT')
+                    except sqlite3.OperationalError:
+                        # 其他进程长时间持有写锁时放弃本次更新
+                        if self._conn.in_transaction:
+                            self._conn.execute('ROLLBACK')
+            self._stats['hits'] += len(found)
+            self._stats['misses'] += len(keys) - len(found)
+        return found
+
+    def put_many(self, model, text_hashes, matrix):
+        """
+        写入一批向量（已存在的键保持不变）
+
+        Args:
+            model: 模型 ID
+            text_hashes: 规范化文本哈希列表
+            matrix: (len(text_hashes), dimension) 向量矩阵
+        """
+        items = {}
+        for text_hash, vector in zip(text_hashes, matrix):
+            items.setdefault(text_hash, vector)
+        if not items:
+            return
+        dimension = matrix.shape[1]
+
+        with self._lock:
+            conn = self._conn
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._ensure_model(model, dimension)
+                existing = set()
+                keys = list(items)
+                for i in range(0, len(keys), _IN_BATCH):
+                    batch = keys[i:i + _IN_BATCH]
+                    existing.update(row[0] for row in conn.execute(
+                        f"SELECT text_hash FROM entries WHERE model = ? "
+                        f"AND text_hash IN ({','.join('?' * len(batch))})",
+                        [model, *batch]
+                    ))
+                # 单批超过容量时只保留最后 max_entries 条
+                new_keys = [key for key in keys if key not in existing][-self.max_entries:]
+                if not new_keys:
+                    conn.execute('COMMIT')
+                    return
+
+                slots = self._allocate(model, len(new_keys))
+                vectors = self._map(model, max(slots), grow=True)
+                vectors[np.asarray(slots)] = np.asarray([items[key] for key in new_keys], dtype=np.float16)
+                vectors.flush()
+
+                now = time.time()
+                conn.executemany(
+                    "INSERT INTO entries (model, text_hash, slot, last_used) VALUES (?, ?, ?, ?)",
+                    [(model, key, slot, now) for key, slot in zip(new_keys, slots)]
+                )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            self._stats['writes'] += len(new_keys)
+
+    def stats(self):
+        """命中统计与容量"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0
+        stats['size_bytes'] = sum(
+            os.path.getsize(os.path.join(self.root, name))
+            for name in os.listdir(self.root)
+            if os.path.isfile(os.path.join(self.root, name))
+        )
+        stats['max_entries'] = self.max_entries
+        return stats
+
+    def close(self):
+        with self._lock:
+            for vectors in self._maps.values():
+                vectors.flush()
+            self._maps.clear()
+            self._conn.close()
+
+    # ========== 槽位管理（调用方持有写事务） ==========
+
+    def _ensure_model(self, model, dimension):
+        row = self._conn.execute('SELECT dimension FROM models WHERE model = ?', (model,)).fetchone()
+        if row is None:
+            self._conn.execute('INSERT INTO models (model, dimension) VALUES (?, ?)', (model, dimension))
+        elif row[0] != dimension:
+            raise ValueError(f"模型 {model} 的向量维度由 {row[0]} 变为 {dimension}")
+
+    def _allocate(self, model, count):
+        """分配 count 个槽位：优先复用空闲槽位，其次在文件末尾追加，超出上限时淘汰最久未使用的条目"""
+        conn = self._conn
+        used = conn.execute('SELECT COUNT(*) FROM entries WHERE model = ?', (model,)).fetchone()[0]
+        overflow = used + count - self.max_entries
+        if overflow > 0:
+            self._evict(model, max(overflow, min(self.evict_batch, used)))
+
+        slots = [row[0] for row in conn.execute(
+            'SELECT slot FROM free_slots WHERE model = ? ORDER BY slot LIMIT ?', (model, count)
+        )]
+        if slots:
+            conn.executemany('DELETE FROM free_slots WHERE model = ? AND slot = ?', [(model, s) for s in slots])
+        remaining = count - len(slots)
+        if remaining:
+            next_slot = conn.execute('SELECT next_slot FROM models WHERE model = ?', (model,)).fetchone()[0]
+            slots.extend(range(next_slot, next_slot + remaining))
+            conn.execute('UPDATE models SET next_slot = ? WHERE model = ?', (next_slot + remaining, model))
+        return slots
+
+    def _evict(self, model, count):
+        rows = self._conn.execute(
+            'SELECT text_hash, slot FROM entries WHERE model = ? ORDER BY last_used LIMIT ?', (model, count)
+        ).fetchall()
+        if not rows:
+            return
+        self._conn.executemany(
+            'DELETE FROM entries WHERE model = ? AND text_hash = ?', [(model, h) for h, _ in rows]
+        )
+        self._conn.executemany(
+            'INSERT OR IGNORE INTO free_slots (model, slot) VALUES (?, ?)', [(model, s) for _, s in rows]
+        )
+        self._stats['evictions'] += len(rows)
+
+    # ========== 内存映射文件 ==========
+
+    def _vector_path(self, model):
+        safe = re.sub(r'[^A-Za-z0-9_.-]', '_', model)
+        return os.path.join(self.root, f'{safe}.f16')
+
+    def _map(self, model, max_slot, grow=False):
+        """
+        返回能容纳 max_slot 的内存映射
+
+        其他进程可能已扩容文件，已映射的容量不足时重新映射。只有持有写事务
+        时才允许扩容（grow=True，容量按 2 的幂增长），避免并发截断文件。
+        """
+        vectors = self._maps.get(model)
+        if vectors is not None and max_slot < vectors.shape[0]:
+            return vectors
+
+        row = self._conn.execute('SELECT dimension FROM models WHERE model = ?', (model,)).fetchone()
+        if row is None:
+            return None
+        dimension = row[0]
+        path = self._vector_path(model)
+        row_bytes = dimension * 2
+        current = os.path.getsize(path) // row_bytes if os.path.exists(path) else 0
+        capacity = current
+        if grow:
+            capacity = max(capacity, 1024)
+            while capacity <= max_slot:
+                capacity *= 2
+            if capacity > current:
+                with open(path, 'ab') as f:
+                    f.truncate(capacity * row_bytes)
+        if max_slot >= capacity:
+            return None
+
+        if vectors is not None:
+            vectors.flush()
+        vectors = np.memmap(path, dtype=np.float16, mode='r+', shape=(capacity, dimension))
+        self._maps[model] = vectors
+        return vectors
@@ -0,0 +1,222 @@
+"""
+跨请求微批处理的嵌入服务
+
+入库线程和并发的聊天请求都把文本提交到同一个队列，后台线程在达到
+最大批大小或等待超过最大等待时间时，把来自不同调用方的文本合并成一批
+调用模型，再把结果分发回各调用方。聊天请求使用优先队列，不会排在
+大批量入库文本之后。
+
+启用持久化缓存时，先按（模型 ID，规范化文本哈希）查缓存，只有未命中的
+文本进入批处理队列，同一次调用中重复的文本只计算一次。
+"""
+import time
+import sqlite3
+import threading
+from collections import deque
+
+import numpy as np
+
+from app.services.ingestion.stages import hash_chunk
+from .backends import EmbeddingError, create_backend
+from .cache import EmbeddingCache
+
+
+class _Request:
+    """一次 embed 调用（可能被拆分到多个批次）"""
+
+    __slots__ = ('vectors', 'pending', 'error', 'done')
+
+    def __init__(self, count):
+        self.vectors = [None] * count
+        self.pending = count
+        self.error = None
+        self.done = threading.Event()
+
+
+class EmbeddingService:
+    """微批处理嵌入服务"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.backend = None
+        self.cache = None
+        self.max_batch_size = 64
+        self.max_wait = 0.01
+        self._worker_count = 1
+        self._workers = []
+        self._cond = threading.Condition()
+        self._priority = deque()  # (request, index, text, enqueued_at)
+        self._bulk = deque()
+        self._stats = {'batches': 0, 'texts': 0, 'errors': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        绑定 Flask 应用并创建嵌入后端
+
+        Args:
+            app: Flask 应用实例
+        """
+        self.app = app
+        app.extensions['embedding'] = self
+        self.backend = create_backend(app.config)
+        self.max_batch_size = app.config.get('EMBEDDING_BATCH_SIZE', 64)
+        self.max_wait = app.config.get('EMBEDDING_MAX_WAIT_MS', 10) / 1000
+        self._worker_count = app.config.get('EMBEDDING_WORKERS', 1)
+        if app.config.get('EMBEDDING_CACHE_ENABLED', True):
+            self.cache = EmbeddingCache.from_config(app.config)
+
+    @property
+    def model_id(self):
+        return self.backend.model_id
+
+    # ========== 调用接口 ==========
+
+    def embed(self, texts, priority=False, timeout=None):
+        """
+        计算一组文本的嵌入（阻塞直到结果返回）
+
+        Args:
+            texts: 文本列表
+            priority: 是否为交互请求（优先调度）
+            timeout: 最长等待秒数
+
+        Returns:
+            np.ndarray: (len(texts), dimension) 的 float32 矩阵
+
+        Raises:
+            EmbeddingError: 后端调用失败或超时
+        """
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.backend.dimension), dtype=np.float32)
+        if self.cache is None:
+            return self._embed_uncached(texts, priority, timeout)
+
+        model = self.model_id
+        hashes = [hash_chunk(text) for text in texts]
+        found = self._cache_get(model, hashes)
+        missing = {}
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in found:
+                missing.setdefault(text_hash, text)
+        if missing:
+            keys = list(missing)
+            vectors = self._embed_uncached([missing[key] for key in keys], priority, timeout)
+            self._cache_put(model, keys, vectors)
+            found.update(zip(keys, vectors))
+        return np.vstack([found[text_hash] for text_hash in hashes])
+
+    def embed_query(self, text, timeout=None):
+        """计算单条查询的嵌入（优先调度）"""
+        return self.embed([text], priority=True, timeout=timeout)[0]
+
+    def _embed_uncached(self, texts, priority, timeout):
+        request = _Request(len(texts))
+        now = time.monotonic()
+        queue = self._priority if priority else self._bulk
+        self._ensure_workers()
+        with self._cond:
+            queue.extend((request, i, text, now) for i, text in enumerate(texts))
+            self._cond.notify()
+
+        if not request.done.wait(timeout):
+            raise EmbeddingError("嵌入请求超时")
+        if request.error is not None:
+            raise EmbeddingError(str(request.error)) from request.error
+        return np.vstack(request.vectors)
+
+    # 缓存读写失败（磁盘满、文件被占用）只降级为重新计算，不影响调用方
+
+    def _cache_get(self, model, hashes):
+        try:
+            return self.cache.get_many(model, hashes)
+        except (sqlite3.Error, OSError, ValueError) as e:
+            self.app.logger.warning(f"读取嵌入缓存失败: {str(e)}")
+            return {}
+
+    def _cache_put(self, model, hashes, vectors):
+        try:
+            self.cache.put_many(model, hashes, vectors)
+        except (sqlite3.Error, OSError, ValueError) as e:
+            self.app.logger.warning(f"写入嵌入缓存失败: {str(e)}")
+
+    def cache_stats(self):
+        """持久化缓存的命中统计，未启用时返回 None"""
+        if self.cache is None:
+            return None
+        return self.cache.stats()
+
+    def stats(self):
+        """批处理统计"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['queued'] = len(self._priority) + len(self._bulk)
+        stats['avg_batch_size'] = round(stats['texts'] / stats['batches'], 2) if stats['batches'] else 0
+        stats['model'] = self.model_id
+        return stats
+
+    # ========== 批处理线程 ==========
+
+    def _ensure_workers(self):
+        if self._workers:
+            return
+        with self._cond:
+            if self._workers:
+                return
+            for i in range(self._worker_count):
+                worker = threading.Thread(target=self._run, name=f'embedding-batcher-{i}', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _take_batch(self):
+        """等待并取出一批文本：攒够 max_batch_size 或最早的文本等待超过 max_wait"""
+        with self._cond:
+            while not self._priority and not self._bulk:
+                self._cond.wait()
+            while True:
+                queued = len(self._priority) + len(self._bulk)
+                if queued >= self.max_batch_size:
+                    break
+                oldest = min(q[0][3] for q in (self._priority, self._bulk) if q)
+                remaining = oldest + self.max_wait - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = []
+            for queue in (self._priority, self._bulk):
+                while queue and len(batch) < self.max_batch_size:
+                    batch.append(queue.popleft())
+            if self._priority or self._bulk:
+                # 还有剩余文本，唤醒其他批处理线程
+                self._cond.notify()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                vectors = self.backend.embed_batch([item[2] for item in batch])
+                error = None
+            except Exception as e:  # noqa: BLE001 错误需要传递给等待的调用方
+                vectors = None
+                error = e
+
+            # 同一次调用可能被拆到多个批次、由不同线程处理，计数需要加锁
+            with self._cond:
+                self._stats['batches'] += 1
+                self._stats['texts'] += len(batch)
+                if error is not None:
+                    self._stats['errors'] += 1
+
+                for i, (request, index, _, _) in enumerate(batch):
+                    if error is not None:
+                        request.error = error
+                        request.done.set()
+                        continue
+                    request.vectors[index] = vectors[i]
+                    request.pending -= 1
+                    if request.pending == 0:
+                        request.done.set()
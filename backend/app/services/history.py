@@ -0,0 +1,173 @@
+"""
+对话历史窗口
+
+发送给大模型的历史消息受 token 预算限制，构建提示词的开销与对话长度无关：
+- 从当前消息往前按 (created_at, id) 分页读取（keyset 分页，走
+  (conversation_id, created_at, id) 索引），放满 HISTORY_MAX_TOKENS 即停止；
+- 滑出窗口的较早消息折叠进保存在 Conversation 上的滚动摘要，摘要记录覆盖到的
+  位置，之后只折叠新滑出窗口的消息，窗口也不再回到摘要之前；
+- 摘要为抽取式（每条消息保留开头 HISTORY_SUMMARY_LINE_TOKENS 个 token），总长
+  不超过 HISTORY_SUMMARY_MAX_TOKENS，超出时丢弃最早的内容，不额外调用大模型。
+"""
+from itertools import chain
+from dataclasses import dataclass, field
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from app.extensions import db
+from app.models import Message
+from app.services.rag import get_tokenizer
+
+# 每条消息的格式开销（角色、分隔符）按固定 token 数计入预算
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_ROLE_LABELS = {'user': '用户', 'assistant': '助手'}
+
+
+@dataclass
+class History:
+    """提示词中的历史部分"""
+    # 窗口内的消息（按时间顺序，OpenAI 兼容格式）
+    messages: list = field(default_factory=list)
+    # 窗口之前的对话摘要
+    summary: str = ''
+
+
+class HistoryBuilder:
+    """按 token 预算构建历史窗口并维护滚动摘要"""
+
+    def __init__(self, tokenizer, max_tokens=1500, summary_max_tokens=500, line_tokens=60, page_size=20):
+        """
+        Args:
+            tokenizer: token 计数器（见 app.services.rag.tokens）
+            max_tokens: 历史窗口的 token 预算
+            summary_max_tokens: 滚动摘要的 token 上限
+            line_tokens: 每条消息在摘要中保留的 token 数
+            page_size: 每次读取的消息数
+        """
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.line_tokens = line_tokens
+        self.page_size = max(1, page_size)
+
+    @classmethod
+    def from_config(cls, config, tokenizer):
+        return cls(
+            tokenizer,
+            max_tokens=config.get('HISTORY_MAX_TOKENS', 1500),
+            summary_max_tokens=config.get('HISTORY_SUMMARY_MAX_TOKENS', 500),
+            line_tokens=config.get('HISTORY_SUMMARY_LINE_TOKENS', 60),
+            page_size=config.get('HISTORY_PAGE_SIZE', 20)
+        )
+
+    def build(self, conversation, before):
+        """
+        构建 before 之前的历史（不含 before），需要时更新并提交对话的滚动摘要
+
+        Args:
+            conversation: Conversation
+            before: 当前用户消息（Message，已 flush）
+
+        Returns:
+            History: 历史窗口与摘要
+        """
+        if self.max_tokens <= 0:
+            return History()
+        floor = None
+        if conversation.summary_until_id is not None:
+            floor = (conversation.summary_until_at, conversation.summary_until_id)
+
+        window = []
+        used = 0
+        overflow = None
+        for row in self._rows_before(conversation.id, (before.created_at, before.id), floor):
+            tokens = self.tokenizer.count(row.content) + MESSAGE_OVERHEAD_TOKENS
+            if used + tokens > self.max_tokens:
+                overflow = row
+                break
+            window.append(row)
+            used += tokens
+
+        if overflow is not None:
+            self._fold(conversation, overflow, floor)
+        window.reverse()
+        return History(
+            messages=[{'role': row.role, 'content': row.content} for row in window],
+            summary=conversation.summary or ''
+        )
+
+    def _fold(self, conversation, newest, floor):
+        """把 floor 之后到 newest（含）的消息折叠进滚动摘要"""
+        # 从新到旧生成摘要行，放满预算后停止读取（更早的消息不会出现在摘要中）
+        lines = []
+        budget = self.summary_max_tokens
+        older = self._rows_before(conversation.id, (newest.created_at, newest.id), floor)
+        for row in chain([newest], older):
+            line = self._line(row)
+            tokens = self.tokenizer.count_uncached(line)
+            if tokens > budget:
+                budget = 0
+                break
+            lines.append(line)
+            budget -= tokens
+        lines.reverse()
+
+        # 旧摘要在前，超出剩余预算时丢弃最早的行
+        kept = []
+        for line in reversed((conversation.summary or '').splitlines()):
+            tokens = self.tokenizer.count_uncached(line)
+            if tokens > budget:
+                break
+            kept.append(line)
+            budget -= tokens
+        kept.reverse()
+
+        conversation.summary = '\n'.join(kept + lines)
+        conversation.summary_until_at = newest.created_at
+        conversation.summary_until_id = newest.id
+        try:
+            db.session.commit()
+        except Exception as e:
+            # 摘要只是缓存，保存失败时下次请求重新折叠
+            db.session.rollback()
+            current_app.logger.warning(f"保存对话摘要失败: conversation_id={conversation.id}, {str(e)}")
+
+    def _rows_before(self, conversation_id, cursor, floor):
+        """逐页读取 cursor 之前、floor 之后的消息（从新到旧，按需读取下一页）"""
+        while True:
+            page = self._page(conversation_id, cursor, floor, self.page_size)
+            yield from page
+            if len(page) < self.page_size:
+                return
+            cursor = (page[-1].created_at, page[-1].id)
+
+    def _line(self, row):
+        content = ' '.join(row.content.split())
+        short = self.tokenizer.truncate(content, self.line_tokens)
+        if len(short) < len(content):
+            short += '…'
+        return f"{_ROLE_LABELS.get(row.role, row.role)}：{short}"
+
+    @staticmethod
+    def _page(conversation_id, cursor, floor, limit):
+        """cursor 之前、floor 之后的消息，从新到旧"""
+        created_at, message_id = cursor
+        query = Message.query.with_entities(
+            Message.id, Message.created_at, Message.role, Message.content
+        ).filter(
+            Message.conversation_id == conversation_id,
+            or_(Message.created_at < created_at, and_(Message.created_at == created_at, Message.id < message_id))
+        )
+        if floor is not None:
+            floor_at, floor_id = floor
+            query = query.filter(
+                or_(Message.created_at > floor_at, and_(Message.created_at == floor_at, Message.id > floor_id))
+            )
+        return query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit).all()
+
+
+def build_history(conversation, before):
+    """按当前应用配置构建 before 之前的对话历史"""
+    return HistoryBuilder.from_config(current_app.config, get_tokenizer()).build(conversation, before)
@@ -0,0 +1,10 @@
+"""
+文档入库服务
+"""
+from . import stages
+from .manager import IngestionManager
+
+# 全局入库任务管理器，在应用工厂中通过 init_app 绑定
+ingestion_manager = IngestionManager()
+
+__all__ = ['IngestionManager', 'ingestion_manager', 'stages']
@@ -0,0 +1,94 @@
+"""
+切片清单维护
+
+向量以切片内容哈希为 ID，同一命名空间中相同内容的切片只向量化一次。
+重新入库时对比新旧切片哈希：只有分片中尚不存在的哈希需要向量化，
+分片中不再被任何已入库文件引用的哈希对应的向量需要删除；
+不再被任何 Blob 引用的哈希对应的正文需要删除。
+"""
+from app.extensions import db
+from app.models import KBChunk, KBDocument
+
+# SQL IN 子句每批的参数数量（SQLite 默认上限 999）
+IN_CLAUSE_BATCH = 500
+
+
+def existing_hashes(chunk_hashes, namespace=None):
+    """
+    查询仍被引用的切片哈希
+
+    Args:
+        chunk_hashes: 切片哈希集合
+        namespace: 为空时查询被任意 Blob 引用的哈希（正文仍需保留）；否则查询被该
+            命名空间中已入库文件引用的哈希（分片中已有向量）
+
+    Returns:
+        set: 仍被引用的哈希
+    """
+    found = set()
+    hashes = list(chunk_hashes)
+    for i in range(0, len(hashes), IN_CLAUSE_BATCH):
+        batch = hashes[i:i + IN_CLAUSE_BATCH]
+        query = db.session.query(KBChunk.chunk_hash).filter(KBChunk.chunk_hash.in_(batch))
+        if namespace is not None:
+            query = query.join(KBDocument, KBDocument.blob_sha256 == KBChunk.blob_sha256)\
+                .filter(KBDocument.namespace == namespace, KBDocument.status == KBDocument.STATUS_INDEXED)
+        found.update(row[0] for row in query.distinct())
+    return found
+
+
+def blob_hashes(blob_sha256):
+    """Blob 当前的切片哈希集合"""
+    return {
+        row[0] for row in db.session.query(KBChunk.chunk_hash)
+        .filter(KBChunk.blob_sha256 == blob_sha256)
+        .distinct()
+    }
+
+
+def plan_chunks(chunks, namespace):
+    """
+    计算需要写入命名空间分片的切片
+
+    Args:
+        chunks: [(chunk_hash, text), ...]，按文件中的顺序
+        namespace: 命名空间
+
+    Returns:
+        list: 需要向量化的 [(chunk_hash, text), ...]（去重，保持顺序）
+    """
+    unique = {}
+    for chunk_hash, text in chunks:
+        unique.setdefault(chunk_hash, text)
+    known = existing_hashes(unique.keys(), namespace)
+    return [(h, text) for h, text in unique.items() if h not in known]
+
+
+def replace_blob_chunks(blob_sha256, chunk_hashes):
+    """
+    用新的切片哈希序列替换 Blob 的切片清单（由调用方提交事务）
+
+    Args:
+        blob_sha256: Blob 摘要
+        chunk_hashes: 按顺序排列的切片哈希
+
+    Returns:
+        set: 从该 Blob 中消失的哈希（是否仍被其他 Blob 或文件引用由调用方判断）
+    """
+    old_hashes = blob_hashes(blob_sha256)
+    KBChunk.query.filter_by(blob_sha256=blob_sha256).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(KBChunk, [
+        {'blob_sha256': blob_sha256, 'seq': seq, 'chunk_hash': chunk_hash}
+        for seq, chunk_hash in enumerate(chunk_hashes)
+    ])
+    return old_hashes - set(chunk_hashes)
+
+
+def release_blob_chunks(blob_sha256):
+    """
+    删除 Blob 的切片清单（由调用方提交事务）
+
+    Returns:
+        set: 该 Blob 原有的哈希
+    """
+    return replace_blob_chunks(blob_sha256, [])
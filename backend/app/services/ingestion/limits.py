@@ -0,0 +1,104 @@
+"""
+入库子进程的单任务资源限制
+
+进程池的每个子进程同一时刻只执行一个任务，任务开始时收紧本进程的限制，
+结束后恢复：
+- 内存：把地址空间上限（RLIMIT_AS）设为当前占用 + memory_mb，超出时分配
+  失败抛出 MemoryError，转换为 LoadLimitExceeded，子进程本身不受影响；
+- 时间：到期时 SIGALRM 在任务中抛出 LoadLimitExceeded；长时间停在 C 扩展中
+  无法响应信号时，CPU 时间上限（RLIMIT_CPU，超时时间的两倍）由内核终止子进程，
+  进程池随后重建。
+Windows 等没有 resource / setitimer 的平台上对应的限制不生效。
+"""
+import signal
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class LoadLimitExceeded(Exception):
+    """加载或切分超出单任务的时间或内存限制（重试也会失败，不再重试）"""
+
+
+def _address_space():
+    """当前进程的虚拟地址空间大小（字节），无法获取时为 None"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmSize:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _limit_memory(memory_mb):
+    """收紧地址空间上限，返回恢复函数（不支持时为 None）"""
+    current = _address_space() if resource is not None else None
+    if current is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = current + memory_mb * 1024 * 1024
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    return lambda: resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+def _limit_time(timeout):
+    """设置 SIGALRM 定时器和 CPU 时间上限，返回恢复函数（不支持时为 None）"""
+    # 信号处理函数只能在主线程设置；进程池子进程在主线程执行任务
+    if not hasattr(signal, 'setitimer') or threading.current_thread() is not threading.main_thread():
+        return None
+
+    def on_timeout(signum, frame):
+        raise LoadLimitExceeded(f"加载超时（{timeout} 秒）")
+
+    previous = signal.signal(signal.SIGALRM, on_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    restore_cpu = None
+    if resource is not None:
+        soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        limit = int(usage.ru_utime + usage.ru_stime + timeout * 2) + 1
+        if hard == resource.RLIM_INFINITY or limit < hard:
+            resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+            restore_cpu = lambda: resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))  # noqa: E731
+
+    def restore():
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+        if restore_cpu is not None:
+            restore_cpu()
+    return restore
+
+
+@contextmanager
+def task_limits(timeout=0, memory_mb=0):
+    """
+    在上下文中限制本进程的执行时间和新增内存
+
+    Args:
+        timeout: 最长执行秒数，0 表示不限制
+        memory_mb: 最多新增的内存（MB），0 表示不限制
+
+    Raises:
+        LoadLimitExceeded: 超时或超出内存限制
+    """
+    restores = []
+    if memory_mb > 0:
+        restores.append(_limit_memory(memory_mb))
+    if timeout > 0:
+        restores.append(_limit_time(timeout))
+    try:
+        yield
+    except MemoryError as e:
+        raise LoadLimitExceeded(f"加载超出内存限制（{memory_mb} MB）") from e
+    finally:
+        for restore in reversed(restores):
+            if restore is not None:
+                restore()
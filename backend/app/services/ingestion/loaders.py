@@ -0,0 +1,208 @@
+"""
+文档加载器
+
+每种格式一个流式加载器，按扩展名注册，产出文本块流交给切分器：
+- txt / md：按固定大小的块读取；
+- csv：逐行读取，每行渲染为 “列名: 值” 形式的一段文本；
+- txt / md / csv 的编码依次尝试 UTF-8（可带 BOM）和 GB18030（兼容 GBK / GB2312），
+  都无法解码时按 UTF-8 替换解码，替换字符过多视为无法识别编码，入库失败且不重试；
+- pdf：逐页提取文本（需要安装 pypdf），同一时刻只解析一页；任一页面损坏时视为
+  无法解析，入库失败且不重试；
+- docx：直接解析压缩包中的 word/document.xml，按段落增量产出，
+  解析过的段落元素随即释放，不构建整个文档对象。
+加载器在入库进程池的子进程中执行，只依赖文件路径。
+"""
+import io
+import csv
+import codecs
+import zipfile
+from xml.etree import ElementTree
+
+from .limits import LoadLimitExceeded
+
+# 读取文件时的块大小
+READ_BLOCK_SIZE = 64 * 1024
+
+# csv 每产出一个文本块包含的行数
+CSV_ROWS_PER_BLOCK = 64
+
+# docx 正文的 XML 命名空间
+_WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+# 文本文件依次尝试的编码
+TEXT_ENCODINGS = ('utf-8-sig', 'gb18030')
+
+# 无法识别编码时替换字符的最大占比
+MAX_REPLACEMENT_RATIO = 0.01
+
+# 扩展名 -> 加载函数
+LOADERS = {}
+
+
+class UnsupportedDocumentError(ValueError):
+    """不支持的文档格式（或解析所需的依赖未安装）"""
+
+
+def register_loader(*extensions):
+    """注册加载器：被装饰的函数接收文件路径，产出文本块"""
+    def decorator(func):
+        for ext in extensions:
+            LOADERS[ext] = func
+        return func
+    return decorator
+
+
+def get_loader(ext):
+    """
+    获取扩展名对应的加载器
+
+    Raises:
+        UnsupportedDocumentError: 没有注册的加载器
+    """
+    loader = LOADERS.get(ext.lower())
+    if loader is None:
+        raise UnsupportedDocumentError(f"暂不支持解析 {ext} 格式的文件")
+    return loader
+
+
+def detect_encoding(file_path):
+    """
+    检测文本文件的编码（逐块增量解码整个文件，不整体读入内存）
+
+    Returns:
+        str: 编码名称
+
+    Raises:
+        UnsupportedDocumentError: 无法识别编码（按 UTF-8 解码时替换字符过多）
+    """
+    for encoding in TEXT_ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            for _ in _decode_blocks(file_path, decoder):
+                pass
+        except UnicodeDecodeError:
+            continue
+        return encoding
+
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    chars = replaced = 0
+    for text in _decode_blocks(file_path, decoder):
+        chars += len(text)
+        replaced += text.count('\ufffd')
+    if chars and replaced / chars > MAX_REPLACEMENT_RATIO:
+        raise UnsupportedDocumentError("无法识别文件编码（支持 UTF-8、GBK / GB18030）")
+    return 'utf-8'
+
+
+def _decode_blocks(file_path, decoder):
+    """用增量解码器逐块解码文件，产出各块的文本"""
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(READ_BLOCK_SIZE)
+            yield decoder.decode(block, final=not block)
+            if not block:
+                return
+
+
+@register_loader('txt', 'md')
+def load_text(file_path):
+    encoding = detect_encoding(file_path)
+    with open(file_path, 'r', encoding=encoding, errors='replace') as f:
+        while True:
+            block = f.read(READ_BLOCK_SIZE)
+            if not block:
+                break
+            yield block
+
+
+@register_loader('csv')
+def load_csv(file_path):
+    # newline='' 让 csv 模块正确处理字段中的换行；utf-8-sig 去掉 Excel 导出的 BOM
+    encoding = detect_encoding(file_path)
+    with open(file_path, 'r', encoding=encoding, errors='replace', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [name.strip() for name in header]
+        lines = []
+        for row in reader:
+            # 字段内的换行折叠为空格
+            fields = [
+                f"{header[i] if i < len(header) and header[i] else f'列{i + 1}'}: {' '.join(value.split())}"
+                for i, value in enumerate(row) if value.strip()
+            ]
+            if not fields:
+                continue
+            # 每行以换行结尾，切分器把一行视为一个句子，不会把两行拼进同一句
+            lines.append('; '.join(fields) + '\n')
+            if len(lines) >= CSV_ROWS_PER_BLOCK:
+                yield ''.join(lines)
+                lines = []
+        if lines:
+            yield ''.join(lines)
+
+
+@register_loader('pdf')
+def load_pdf(file_path):
+    try:
+        from pypdf import PdfReader
+        from pypdf.errors import PdfReadError
+    except ImportError as e:
+        raise UnsupportedDocumentError("解析 pdf 文件需要安装 pypdf") from e
+
+    with open(file_path, 'rb') as f:
+        try:
+            reader = PdfReader(f)
+            page_count = len(reader.pages)
+        except PdfReadError as e:
+            raise UnsupportedDocumentError(f"无法解析 pdf 文件: {str(e)}") from e
+        for i in range(page_count):
+            # 逐页取出并提取文本，不保留已处理页面的解析结果
+            try:
+                text = reader.pages[i].extract_text() or ''
+            except (MemoryError, LoadLimitExceeded):
+                raise
+            except Exception as e:  # noqa: BLE001 损坏页面抛出的异常类型不固定（PdfReadError、KeyError、ValueError 等）
+                raise UnsupportedDocumentError(f"无法解析 pdf 第 {i + 1} 页: {str(e)}") from e
+            if text.strip():
+                yield text if text.endswith('\n') else text + '\n'
+
+
+@register_loader('docx')
+def load_docx(file_path):
+    try:
+        archive = zipfile.ZipFile(file_path)
+    except zipfile.BadZipFile as e:
+        raise UnsupportedDocumentError("无法解析 docx 文件：不是有效的压缩包") from e
+    with archive:
+        try:
+            document = archive.open('word/document.xml')
+        except KeyError as e:
+            raise UnsupportedDocumentError("无法解析 docx 文件：缺少 word/document.xml") from e
+        with document:
+            yield from _docx_paragraphs(io.BufferedReader(document, READ_BLOCK_SIZE))
+
+
+def _docx_paragraphs(stream):
+    """增量解析 document.xml，每个段落（含表格单元格中的段落）产出一行"""
+    parts = []
+    try:
+        for _, element in ElementTree.iterparse(stream, events=('end',)):
+            tag = element.tag
+            if tag == f'{_WORD_NS}t':
+                parts.append(element.text or '')
+            elif tag == f'{_WORD_NS}tab':
+                parts.append('\t')
+            elif tag in (f'{_WORD_NS}br', f'{_WORD_NS}cr'):
+                parts.append('\n')
+            elif tag == f'{_WORD_NS}p':
+                text = ''.join(parts).strip()
+                parts = []
+                if text:
+                    yield text + '\n'
+                element.clear()
+            elif tag == f'{_WORD_NS}tbl':
+                element.clear()
+    except ElementTree.ParseError as e:
+        raise UnsupportedDocumentError(f"无法解析 docx 文件: {str(e)}") from e
@@ -0,0 +1,439 @@
+"""
+文档入库任务管理器
+
+任务持久化在数据库的 ingest_jobs 表中，上传接口只负责入队。
+调度线程从队列中领取任务，加载和切分交给进程池并行执行，
+完成后由线程池在主进程中执行向量化和写入，并更新任务状态。
+多个 Web 进程可同时运行调度线程，任务通过条件更新原子领取。
+子进程被内核终止（超出 CPU 时间或内存上限）导致进程池损坏时，只让触发的任务失败：
+- 尚未开始执行的任务重新入队，不计入重试次数；
+- 进程池中只有一个任务已开始执行时，该任务失败且不重试；
+- 有多个任务已开始执行时，这些任务重新入队（不计入重试次数），之后各自在单独的
+  进程池中执行，再次损坏即可确定是该任务导致；
+- 没有任务开始执行（如子进程启动失败）时按普通失败处理，计入重试次数。
+"""
+import os
+import shutil
+import atexit
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.extensions import db
+from app.models import IngestJob, KBDocument, KBRevision
+from . import stages
+from . import chunks as chunk_index
+
+
+class IngestionManager:
+    """文档入库任务管理器"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._process_pool = None
+        self._thread_pool = None
+        self._dispatcher = None
+        self._pool_lock = threading.Lock()
+        self._inflight_lock = threading.Lock()
+        self._inflight = 0
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        # 已提交到进程池的任务：job_id -> (进程池, 标记文件)（_pool_lock 保护）
+        self._tasks = {}
+        # 损坏的进程池中已开始执行的任务，每个进程池在第一次处理时记录
+        self._broken_started = {}
+        # 需要在单独的进程池中执行的任务（进程池损坏时与其他任务同时执行）
+        self._isolated = set()
+        self._marker_dir = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        绑定 Flask 应用，并按配置启动后台调度
+
+        Args:
+            app: Flask 应用实例
+        """
+        self.app = app
+        app.extensions['ingestion'] = self
+
+        # 在处理第一个请求时启动，避免 debug 模式下 reloader 的监控进程也创建进程池
+        if app.config.get('INGEST_AUTOSTART', True):
+            app.before_request(self.start)
+
+    # ========== 队列操作（在请求上下文中调用） ==========
+
+    def enqueue(self, filename, file_path, namespace, user_id=None, blob_sha256=None, file_type=None):
+        """
+        创建入库任务（由调用方提交事务）
+
+        Args:
+            filename: 文件名
+            file_path: 文件保存路径
+            namespace: 写入的命名空间
+            user_id: 上传用户 ID
+            blob_sha256: 内容摘要
+            file_type: 扩展名
+
+        Returns:
+            IngestJob: 新建的任务
+        """
+        job = IngestJob(
+            user_id=user_id,
+            filename=filename,
+            file_path=file_path,
+            file_type=file_type,
+            blob_sha256=blob_sha256,
+            namespace=namespace,
+            status=IngestJob.STATUS_PENDING
+        )
+        db.session.add(job)
+        return job
+
+    def notify(self):
+        """通知调度线程有新任务"""
+        self._wakeup.set()
+
+    # ========== 生命周期 ==========
+
+    def start(self):
+        """启动进程池和调度线程（重复调用无副作用）"""
+        if self._dispatcher is not None:
+            return
+        with self._pool_lock:
+            if self._dispatcher is not None:
+                return
+            self._start()
+
+    def _start(self):
+        config = self.app.config
+        self._workers = config.get('INGEST_WORKERS') or os.cpu_count() or 1
+        self._max_inflight = self._workers * 2
+        self._process_pool = self._create_process_pool()
+        self._marker_dir = tempfile.mkdtemp(prefix='ingest-tasks-')
+        self._thread_pool = ThreadPoolExecutor(
+            max_workers=config.get('INGEST_WRITER_THREADS', 2),
+            thread_name_prefix='ingest-writer'
+        )
+        self._stopping.clear()
+        self._dispatcher = threading.Thread(
+            target=self._dispatch_loop,
+            name='ingest-dispatcher',
+            daemon=True
+        )
+        self._dispatcher.start()
+        atexit.register(self.stop)
+        self.app.logger.info(f"入库任务调度已启动，进程数: {self._workers}")
+
+    def stop(self):
+        """停止调度；未完成的任务在租约到期后由其他进程重新领取"""
+        if self._dispatcher is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._dispatcher.join(timeout=5)
+        self._dispatcher = None
+        self._thread_pool.shutdown(wait=False, cancel_futures=True)
+        self._process_pool.shutdown(wait=False, cancel_futures=True)
+        shutil.rmtree(self._marker_dir, ignore_errors=True)
+
+    def _create_process_pool(self, workers=None):
+        # 使用 spawn，避免在多线程进程中 fork
+        return ProcessPoolExecutor(
+            max_workers=workers or self._workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+
+    # ========== 调度 ==========
+
+    def _dispatch_loop(self):
+        """调度线程主循环"""
+        poll_interval = self.app.config.get('INGEST_POLL_INTERVAL', 2)
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            claimed = []
+            try:
+                with self.app.app_context():
+                    self._requeue_expired()
+                    capacity = self._max_inflight - self._inflight
+                    if capacity > 0:
+                        claimed = self._claim(capacity)
+            except SQLAlchemyError as e:
+                self.app.logger.error(f"领取入库任务失败: {str(e)}")
+
+            for job_id, file_path, file_type in claimed:
+                self._submit(job_id, file_path, file_type)
+
+            if not claimed:
+                self._wakeup.wait(poll_interval)
+
+    def _claim(self, limit):
+        """
+        原子领取待处理任务
+
+        Returns:
+            list[tuple]: (job_id, file_path, file_type) 列表
+        """
+        candidates = IngestJob.query\
+            .with_entities(IngestJob.id, IngestJob.file_path, IngestJob.file_type)\
+            .filter_by(status=IngestJob.STATUS_PENDING)\
+            .order_by(IngestJob.id)\
+            .limit(limit)\
+            .all()
+
+        claimed = []
+        now = datetime.utcnow()
+        for job_id, file_path, file_type in candidates:
+            # 条件更新保证同一任务只会被一个进程领取
+            updated = IngestJob.query\
+                .filter_by(id=job_id, status=IngestJob.STATUS_PENDING)\
+                .update({
+                    'status': IngestJob.STATUS_RUNNING,
+                    'stage': 'load',
+                    'attempts': IngestJob.attempts + 1,
+                    'started_at': now,
+                    'heartbeat_at': now,
+                    'error': None
+                }, synchronize_session=False)
+            if updated:
+                claimed.append((job_id, file_path, file_type))
+        db.session.commit()
+        return claimed
+
+    def _requeue_expired(self):
+        """将租约过期的运行中任务（进程崩溃等）放回队列"""
+        lease = timedelta(seconds=self.app.config.get('INGEST_JOB_LEASE_SECONDS', 600))
+        IngestJob.query\
+            .filter(IngestJob.status == IngestJob.STATUS_RUNNING)\
+            .filter(IngestJob.heartbeat_at < datetime.utcnow() - lease)\
+            .update({'status': IngestJob.STATUS_PENDING}, synchronize_session=False)
+        db.session.commit()
+
+    def _submit(self, job_id, file_path, file_type):
+        """提交加载/切分阶段到进程池"""
+        config = self.app.config
+        with self._inflight_lock:
+            self._inflight += 1
+        marker = os.path.join(self._marker_dir, str(job_id))
+        with self._pool_lock:
+            # 进程池损坏时与其他任务同时执行的任务，在单独的进程池中执行
+            pool = self._create_process_pool(1) if job_id in self._isolated else self._process_pool
+            self._tasks[job_id] = (pool, marker)
+        try:
+            future = pool.submit(
+                stages.load_and_split,
+                file_path,
+                file_type,
+                config.get('CHUNK_SIZE', 500),
+                config.get('CHUNK_OVERLAP', 50),
+                config.get('INGEST_TASK_TIMEOUT', 300),
+                config.get('INGEST_TASK_MEMORY_MB', 1024),
+                marker
+            )
+        except (BrokenProcessPool, RuntimeError) as e:
+            self._reset_process_pool(pool)
+            self._thread_pool.submit(self._finish, job_id, None, e)
+            return
+        future.add_done_callback(lambda f: self._on_loaded(job_id, f, pool))
+
+    def _on_loaded(self, job_id, future, pool):
+        """子进程阶段完成后，将后续阶段交给写入线程"""
+        try:
+            self._thread_pool.submit(self._finish, job_id, future, None, pool)
+        except RuntimeError:
+            # 解释器或线程池正在关闭，任务在租约到期后重新执行
+            with self._inflight_lock:
+                self._inflight -= 1
+
+    def _reset_process_pool(self, broken_pool):
+        """子进程异常退出后重建进程池（同一个损坏的进程池只重建一次）"""
+        with self._pool_lock:
+            if self._stopping.is_set() or self._process_pool is not broken_pool:
+                return
+            self._process_pool = self._create_process_pool()
+        broken_pool.shutdown(wait=False, cancel_futures=True)
+
+    def _release_task(self, job_id):
+        """任务的子进程阶段已结束：删除标记文件，关闭单独的进程池"""
+        with self._pool_lock:
+            pool, marker = self._tasks.pop(job_id, (None, None))
+            if pool is not None and not any(other is pool for other, _ in self._tasks.values()):
+                # 该进程池的任务都已处理
+                self._broken_started.pop(pool, None)
+        if marker is not None:
+            stages.remove_marker(marker)
+        if pool is not None and pool is not self._process_pool and job_id in self._isolated:
+            pool.shutdown(wait=False)
+
+    def _on_pool_broken(self, job_id):
+        """
+        进程池损坏时判断任务是否为触发者（在释放任务之前调用）
+
+        Returns:
+            str: 'culprit'（失败且不重试）/ 'suspect'（单独重新执行）/ 'collateral'（重新入队）/
+                'unknown'（没有任务开始执行，如子进程启动失败：按普通失败计入重试次数）
+        """
+        with self._pool_lock:
+            pool, _ = self._tasks.get(job_id, (None, None))
+            started = self._broken_started.get(pool)
+            if started is None:
+                # 标记文件在任务结束时删除，被终止的子进程中的任务保留标记；
+                # 第一个处理的任务记录快照，同一进程池的其他任务此时都还未释放
+                started = {
+                    other for other, (other_pool, marker) in self._tasks.items()
+                    if other_pool is pool and os.path.exists(marker)
+                }
+                self._broken_started[pool] = started
+            if not started and job_id not in self._isolated:
+                verdict = 'unknown'
+            elif job_id in self._isolated or (job_id in started and len(started) == 1):
+                verdict = 'culprit'
+            elif job_id in started:
+                verdict = 'suspect'
+            else:
+                verdict = 'collateral'
+        return verdict
+
+    # ========== 主进程阶段：向量化与写入 ==========
+
+    def _finish(self, job_id, future, submit_error, pool=None):
+        """执行向量化、写入阶段并更新任务状态"""
+        broken = isinstance(submit_error, BrokenProcessPool) or (
+            future is not None and not future.cancelled() and isinstance(future.exception(), BrokenProcessPool)
+        )
+        # 提交时进程池已损坏的任务没有执行过
+        verdict = self._on_pool_broken(job_id) if broken and future is not None else 'collateral'
+        isolated = job_id in self._isolated
+        self._release_task(job_id)
+        with self._pool_lock:
+            if verdict == 'suspect':
+                self._isolated.add(job_id)
+            else:
+                self._isolated.discard(job_id)
+        try:
+            with self.app.app_context():
+                try:
+                    if submit_error is not None:
+                        raise submit_error
+                    chunks = future.result()
+
+                    job = db.session.get(IngestJob, job_id)
+                    if job.blob_sha256 and KBDocument.query.filter_by(
+                            namespace=job.namespace, blob_sha256=job.blob_sha256).first() is None:
+                        # 入库期间文件已从命名空间删除，不再写入分片
+                        self._skip(job)
+                        return
+
+                    # 只向量化命名空间分片中尚不存在的切片
+                    self._set_stage(job, 'embed')
+                    new_chunks = chunk_index.plan_chunks(chunks, job.namespace)
+                    vectors = stages.embed_chunks([text for _, text in new_chunks]) if new_chunks else []
+
+                    self._set_stage(job, 'write')
+                    vector_count = stages.write_vectors(job.namespace, new_chunks, vectors)
+                    vanished = chunk_index.replace_blob_chunks(job.blob_sha256, [h for h, _ in chunks])
+                    self._release_vanished(job, vanished)
+
+                    job.status = IngestJob.STATUS_SUCCEEDED
+                    job.stage = None
+                    job.chunk_count = len(chunks)
+                    job.vector_count = vector_count
+                    job.finished_at = datetime.utcnow()
+                    KBDocument.set_index_state(
+                        job.namespace, job.blob_sha256, KBDocument.STATUS_INDEXED,
+                        chunk_count=len(chunks), vector_count=len({h for h, _ in chunks})
+                    )
+                    KBRevision.bump(job.namespace)
+                    db.session.commit()
+                    self.app.logger.info(
+                        f"文件入库完成: {job.filename}, 切片数: {len(chunks)}, 新向量: {vector_count}"
+                    )
+                except Exception as e:  # noqa: BLE001 任务失败不能影响调度线程
+                    db.session.rollback()
+                    if broken:
+                        if pool is not None and not isolated:
+                            self._reset_process_pool(pool)
+                        if verdict == 'culprit':
+                            self._fail(job_id, stages.LoadLimitExceeded(
+                                "加载子进程被终止（超出 CPU 时间或内存上限）"
+                            ))
+                        elif verdict == 'unknown':
+                            # 找不到触发者时不退还重试次数，避免子进程持续启动失败时无限重新入队
+                            self._fail(job_id, e)
+                        else:
+                            self._requeue(job_id, e)
+                        return
+                    self._fail(job_id, e)
+        finally:
+            with self._inflight_lock:
+                self._inflight -= 1
+            self._wakeup.set()
+
+    def _skip(self, job):
+        job.status = IngestJob.STATUS_SUCCEEDED
+        job.stage = None
+        job.chunk_count = 0
+        job.vector_count = 0
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        self.app.logger.info(f"文件已删除，跳过入库: {job.filename}")
+
+    def _set_stage(self, job, stage):
+        job.stage = stage
+        job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+
+    def _fail(self, job_id, error):
+        """记录失败；未超过重试次数的任务重新入队"""
+        job = db.session.get(IngestJob, job_id)
+        if job is None:
+            return
+        max_attempts = self.app.config.get('INGEST_MAX_ATTEMPTS', 3)
+        retryable = not isinstance(
+            error, (stages.UnsupportedDocumentError, stages.LoadLimitExceeded, FileNotFoundError)
+        )
+        job.error = str(error)
+        if retryable and job.attempts < max_attempts:
+            job.status = IngestJob.STATUS_PENDING
+        else:
+            job.status = IngestJob.STATUS_FAILED
+            job.finished_at = datetime.utcnow()
+            if job.blob_sha256:
+                KBDocument.set_index_state(job.namespace, job.blob_sha256, KBDocument.STATUS_FAILED)
+        db.session.commit()
+        self.app.logger.error(f"文件入库失败: {job.filename}, 错误: {str(error)}")
+
+    def _requeue(self, job_id, error):
+        """进程池损坏时受牵连的任务重新入队，不计入重试次数"""
+        job = db.session.get(IngestJob, job_id)
+        if job is None:
+            return
+        job.status = IngestJob.STATUS_PENDING
+        job.stage = None
+        job.attempts = max(job.attempts - 1, 0)
+        job.error = str(error)
+        db.session.commit()
+        self.app.logger.warning(f"入库进程池损坏，任务重新入队: {job.filename}")
+
+    @staticmethod
+    def _release_vanished(job, vanished):
+        """
+        重新切分后从 Blob 中消失的切片：从引用该 Blob 的各命名空间分片中删除不再被
+        引用的向量，不再被任何 Blob 引用的正文一并删除
+        """
+        if not vanished:
+            return
+        namespaces = {
+            row[0] for row in db.session.query(KBDocument.namespace)
+            .filter_by(blob_sha256=job.blob_sha256).distinct()
+        }
+        namespaces.add(job.namespace)
+        for namespace in namespaces:
+            stages.delete_vectors(namespace, vanished - chunk_index.existing_hashes(vanished, namespace))
+        stages.delete_texts(vanished - chunk_index.existing_hashes(vanished))
@@ -0,0 +1,142 @@
+"""
+流式文本切分器
+
+按 token 预算切分文本块流，切片惰性产出，内存占用与文档大小无关。
+- 句子边界和 token 都用预编译正则在 C 层扫描，不逐字符循环；
+- 中文等 CJK 字符每个字计 1 个 token，不依赖空格分词；
+- 相邻切片按 token 数保留整句重叠，超长句子按 token 硬切分。
+"""
+import re
+from collections import deque
+
+# CJK 统一表意文字、扩展 A、兼容表意文字、日文假名、韩文音节
+CJK_CHARS = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af'
+
+# 单个 token：一个 CJK 字 / 一段连续的非 CJK 单词字符 / 一个标点符号
+TOKEN_PATTERN = f'[{CJK_CHARS}]|[^\\W{CJK_CHARS}]+|[^\\w\\s]'
+_TOKEN_RE = re.compile(TOKEN_PATTERN)
+
+# 句子结束位置：中英文句末标点（含其后的引号、括号）、英文句点后跟空白、换行
+_SENTENCE_END_RE = re.compile(
+    r'[。！？；!?;…]+[”’」』）)\]"\']*'
+    r'|\.(?=\s)'
+    r'|\n+'
+)
+
+
+def count_tokens(text):
+    """估算文本的 token 数"""
+    return len(_TOKEN_RE.findall(text))
+
+
+def tokenize(text):
+    """按与 count_tokens 相同的规则切分 token（英文转为小写）"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+class TextSplitter:
+    """按 token 预算切分的流式切分器"""
+
+    def __init__(self, chunk_size=500, chunk_overlap=50, token_counter=None, max_sentence_chars=None):
+        """
+        Args:
+            chunk_size: 每个切片的 token 上限
+            chunk_overlap: 相邻切片的重叠 token 数（按整句保留）
+            token_counter: 自定义 token 计数函数，默认使用 count_tokens
+            max_sentence_chars: 没有句子边界时缓冲的最大字符数
+        """
+        if chunk_size <= 0:
+            raise ValueError("chunk_size 必须大于 0")
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError("chunk_overlap 必须小于 chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.count_tokens = token_counter or count_tokens
+        self.max_sentence_chars = max_sentence_chars or chunk_size * 16
+        # 一次匹配最多 chunk_size 个 token（用于硬切分超长句子）
+        self._piece_re = re.compile(f'(?:(?:{TOKEN_PATTERN})\\s*){{1,{chunk_size}}}', re.S)
+
+    def split(self, blocks):
+        """
+        切分文本块流
+
+        Args:
+            blocks: 文本块迭代器（可以是生成器）
+
+        Yields:
+            str: 文本切片
+        """
+        return self._pack(self._sentences(blocks))
+
+    def split_text(self, text):
+        """切分单个字符串"""
+        return list(self.split([text]))
+
+    def _sentences(self, blocks):
+        """将文本块流重新切分为句子流，跨块的句子会被拼接"""
+        carry = ''
+        for block in blocks:
+            text = carry + block if carry else block
+            last = 0
+            for match in _SENTENCE_END_RE.finditer(text):
+                end = match.end()
+                if end > last:
+                    yield text[last:end]
+                last = end
+            carry = text[last:]
+            # 长时间没有句子边界（如表格、代码），不再继续缓冲
+            if len(carry) > self.max_sentence_chars:
+                yield carry
+                carry = ''
+        if carry:
+            yield carry
+
+    def _pieces(self, sentence):
+        """将超过预算的句子按 token 硬切分"""
+        if self.count_tokens is count_tokens:
+            for match in self._piece_re.finditer(sentence):
+                piece = match.group()
+                yield piece, count_tokens(piece)
+            return
+        # 自定义计数函数：按字符比例近似切分
+        total = max(self.count_tokens(sentence), 1)
+        step = max(len(sentence) * self.chunk_size // total, 1)
+        for i in range(0, len(sentence), step):
+            piece = sentence[i:i + step]
+            yield piece, self.count_tokens(piece)
+
+    def _pack(self, sentences):
+        """将句子装入切片，保留整句重叠"""
+        window = deque()  # (句子, token 数)
+        window_tokens = 0
+        fresh = False  # 窗口中是否有尚未输出过的句子
+
+        for sentence in sentences:
+            tokens = self.count_tokens(sentence)
+            if tokens == 0:
+                # 纯空白：只在已有内容时保留，维持原文排版
+                if window:
+                    window.append((sentence, 0))
+                continue
+
+            parts = self._pieces(sentence) if tokens > self.chunk_size else ((sentence, tokens),)
+            for part, part_tokens in parts:
+                if window_tokens + part_tokens > self.chunk_size and fresh:
+                    chunk = ''.join(s for s, _ in window).strip()
+                    if chunk:
+                        yield chunk
+                    fresh = False
+                    # 丢弃窗口头部，直到剩余部分不超过重叠预算且能放下新句子
+                    while window and (
+                        window_tokens > self.chunk_overlap
+                        or window_tokens + part_tokens > self.chunk_size
+                    ):
+                        window_tokens -= window.popleft()[1]
+                window.append((part, part_tokens))
+                window_tokens += part_tokens
+                fresh = True
+
+        if fresh:
+            chunk = ''.join(s for s, _ in window).strip()
+            if chunk:
+                yield chunk
@@ -0,0 +1,175 @@
+"""
+文档入库流水线各阶段
+
+加载（Loader）和切分（Splitter）在子进程中执行，只依赖文件路径和参数，
+受单任务的时间和内存限制；向量化（Embedder）和写入（Vector Store）在主进程中执行。
+"""
+import os
+import hashlib
+
+from app.extensions import db
+from app.models import KBChunkText
+from app.services.vectorstore import get_vector_store
+from .chunks import IN_CLAUSE_BATCH
+from .limits import task_limits, LoadLimitExceeded
+from .loaders import get_loader, UnsupportedDocumentError
+from .splitter import TextSplitter
+
+
+def load_document(file_path, file_type=None):
+    """
+    加载阶段：按扩展名选择加载器，流式读取文档文本
+
+    Args:
+        file_path: 文件路径
+        file_type: 扩展名，为空时从路径推断
+
+    Yields:
+        str: 文本块
+
+    Raises:
+        UnsupportedDocumentError: 文件格式暂不支持
+    """
+    ext = file_type or os.path.splitext(file_path)[1].lstrip('.')
+    return get_loader(ext)(file_path)
+
+
+def hash_chunk(text):
+    """
+    切片内容哈希（向量 ID）
+
+    忽略首尾空白和连续空白的差异，使仅排版不同的切片共享向量
+    """
+    normalized = ' '.join(text.split())
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def load_and_split(file_path, file_type, chunk_size, chunk_overlap, timeout=0, memory_mb=0, marker=None):
+    """
+    子进程入口：加载并切分文档
+
+    Args:
+        file_path: 文件路径
+        file_type: 扩展名
+        chunk_size: 每个切片的 token 上限
+        chunk_overlap: 相邻切片的重叠 token 数
+        timeout: 最长执行秒数，0 表示不限制
+        memory_mb: 最多新增的内存（MB），0 表示不限制
+        marker: 任务标记文件路径，执行期间存在；子进程被内核终止时保留，
+            主进程据此判断进程池损坏时哪些任务已开始执行
+
+    Returns:
+        list[tuple]: 按顺序排列的 (chunk_hash, text)
+
+    Raises:
+        UnsupportedDocumentError: 文件格式暂不支持或无法解析
+        LoadLimitExceeded: 超出时间或内存限制
+    """
+    if marker is not None:
+        open(marker, 'w').close()
+    try:
+        splitter = TextSplitter(chunk_size, chunk_overlap)
+        with task_limits(timeout, memory_mb):
+            blocks = load_document(file_path, file_type)
+            return [(hash_chunk(chunk), chunk) for chunk in splitter.split(blocks)]
+    finally:
+        if marker is not None:
+            remove_marker(marker)
+
+
+def remove_marker(marker):
+    try:
+        os.remove(marker)
+    except OSError:
+        pass
+
+
+def embed_chunks(texts):
+    """
+    向量化阶段
+
+    通过嵌入服务批量计算，与其他任务、查询请求的文本合并成批。
+
+    Args:
+        texts: 需要向量化的文本列表
+
+    Returns:
+        np.ndarray: 与 texts 对应的向量矩阵
+    """
+    from app.services.embedding import embedding_service
+    return embedding_service.embed(texts)
+
+
+def _keyword_index(namespace):
+    # 关键词分词复用切分器的字符集定义，在函数内导入避免循环导入
+    from app.services.keyword import get_keyword_index
+    return get_keyword_index(namespace)
+
+
+def write_vectors(namespace, chunks, vectors):
+    """
+    写入阶段：将新切片的向量写入命名空间的向量库分片，正文写入 kb_chunk_texts
+    （由调用方提交事务），并加入该命名空间的关键词索引分片
+
+    Args:
+        namespace: 命名空间
+        chunks: [(chunk_hash, text), ...]
+        vectors: 与 chunks 对应的向量矩阵
+
+    Returns:
+        int: 写入的向量数量
+    """
+    if not chunks:
+        return 0
+    get_vector_store(namespace).add([h for h, _ in chunks], vectors)
+
+    # 并发任务可能刚写入相同切片，跳过已存在的正文
+    hashes = [h for h, _ in chunks]
+    stored = set()
+    for i in range(0, len(hashes), IN_CLAUSE_BATCH):
+        batch = hashes[i:i + IN_CLAUSE_BATCH]
+        stored.update(row[0] for row in db.session.query(KBChunkText.chunk_hash).filter(
+            KBChunkText.chunk_hash.in_(batch)
+        ))
+    db.session.bulk_insert_mappings(KBChunkText, [
+        {'chunk_hash': h, 'text': text} for h, text in chunks if h not in stored
+    ])
+
+    keyword_index = _keyword_index(namespace)
+    if keyword_index is not None:
+        keyword_index.add(chunks)
+    return len(chunks)
+
+
+def delete_vectors(namespace, chunk_hashes):
+    """
+    从命名空间的向量库和关键词索引分片删除不再被引用的切片
+
+    Args:
+        namespace: 命名空间
+        chunk_hashes: 切片哈希集合
+
+    Returns:
+        int: 删除的向量数量
+    """
+    hashes = list(chunk_hashes)
+    if not hashes:
+        return 0
+    keyword_index = _keyword_index(namespace)
+    if keyword_index is not None:
+        keyword_index.delete(hashes)
+    return get_vector_store(namespace).delete(hashes)
+
+
+def delete_texts(chunk_hashes):
+    """
+    删除不再被任何 Blob 引用的切片正文（由调用方提交事务）
+
+    Args:
+        chunk_hashes: 切片哈希集合
+    """
+    hashes = list(chunk_hashes)
+    for i in range(0, len(hashes), IN_CLAUSE_BATCH):
+        KBChunkText.query.filter(
+            KBChunkText.chunk_hash.in_(hashes[i:i + IN_CLAUSE_BATCH])
+        ).delete(synchronize_session=False)
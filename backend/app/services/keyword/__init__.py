@@ -0,0 +1,37 @@
+"""
+关键词检索服务
+
+每个知识库命名空间有独立的关键词索引分片（KEYWORD_INDEX_PATH/<分片名>/），
+按进程懒加载，空闲后移除。
+"""
+from flask import current_app
+
+from app.services.namespaces import shard_name
+from app.services.shards import ShardRegistry
+from .index import KeywordIndex
+from .tokenizer import tokenize, tokenize_query
+
+
+def get_keyword_index_shards():
+    """获取当前应用的关键词索引分片注册表（KEYWORD_INDEX_ENABLED 关闭时为 None）"""
+    config = current_app.config
+    if not config.get('KEYWORD_INDEX_ENABLED', True):
+        return None
+    registry = current_app.extensions.get('keyword_index_shards')
+    if registry is None:
+        registry = ShardRegistry(
+            lambda namespace: KeywordIndex.from_config(config, shard_name(namespace)),
+            idle_seconds=config.get('KB_SHARD_IDLE_SECONDS', 600),
+            max_open=config.get('KB_SHARD_MAX_OPEN', 64)
+        )
+        current_app.extensions['keyword_index_shards'] = registry
+    return registry
+
+
+def get_keyword_index(namespace):
+    """获取命名空间的关键词索引分片（按进程懒加载，KEYWORD_INDEX_ENABLED 关闭时为 None）"""
+    registry = get_keyword_index_shards()
+    return registry.get(namespace) if registry is not None else None
+
+
+__all__ = ['KeywordIndex', 'tokenize', 'tokenize_query', 'get_keyword_index', 'get_keyword_index_shards']
@@ -0,0 +1,525 @@
+"""
+磁盘倒排索引与 BM25 打分
+
+索引由若干不可变的段（segment）和一个 manifest.json 组成：
+- 每批入库的切片写成一个新段，段内文档按写入顺序编号；
+- 倒排表按词项连续存放，文档编号差分编码后按最大差值选择 1/2/4 字节宽度，
+  词频按 1/2 字节存放，解码只需 np.frombuffer + cumsum；
+- 删除只写入新版本的删除位图，不改动段文件；段数量超过上限或删除比例过高时，
+  把小段和删除较多的段合并为一个新段；
+- 写入通过文件锁串行化，提交时原子替换 manifest.json，读取方每次检索前读取
+  manifest，各进程按段编号缓存已打开的段（段文件不可变，不需要失效）。
+"""
+import os
+import json
+import threading
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+
+from .tokenizer import tokenize, tokenize_query
+
+try:
+    import fcntl
+except ImportError:  # Windows：仅支持单进程写入
+    fcntl = None
+
+_ID_BYTES = 16
+_UINT = {1: np.uint8, 2: np.uint16, 4: np.uint32}
+
+# 已打开的段：词典（词项 -> [偏移, 文档频率, 编号宽度, 词频宽度]）、倒排文件映射、
+# 按文档编号拼接的 16 字节切片哈希、文档长度
+_Segment = namedtuple('_Segment', ['terms', 'postings', 'docs', 'lengths'])
+
+
+def _width(max_value):
+    """能容纳 max_value 的最小无符号整数字节宽度"""
+    for width in (1, 2, 4):
+        if max_value < 1 << (8 * width):
+            return width
+    raise ValueError("倒排表编号超出 uint32 范围")
+
+
+class KeywordIndex:
+    """分段倒排索引 + BM25 检索"""
+
+    def __init__(self, root, k1=1.2, b=0.75, max_segments=8, merge_deleted_ratio=0.3):
+        """
+        Args:
+            root: 索引目录
+            k1: BM25 词频饱和参数
+            b: BM25 文档长度归一化参数
+            max_segments: 段数量上限，超过后合并最小的段
+            merge_deleted_ratio: 段内已删除文档超过此比例时参与合并
+        """
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max(2, max_segments)
+        self.merge_deleted_ratio = merge_deleted_ratio
+        self._manifest_path = os.path.join(root, 'manifest.json')
+        self._lock_path = os.path.join(root, 'write.lock')
+
+        # 读取方缓存（self._lock 保护）
+        self._lock = threading.Lock()
+        self._segments = {}  # 段编号 -> _Segment
+        self._masks = {}  # (段编号, 删除版本) -> 有效文档掩码
+        self._norms = {}  # 段编号 -> ((段编号, manifest 版本), 长度归一化项)
+
+        # 写入方状态（self._write_mutex 保护）
+        self._write_mutex = threading.Lock()
+        self._live = None  # 已索引的切片哈希（bytes）-> (段编号, 文档编号)
+        self._live_generation = None
+
+    @classmethod
+    def from_config(cls, config, shard):
+        return cls(
+            os.path.join(config['KEYWORD_INDEX_PATH'], shard),
+            k1=config.get('BM25_K1', 1.2),
+            b=config.get('BM25_B', 0.75),
+            max_segments=config.get('KEYWORD_MAX_SEGMENTS', 8)
+        )
+
+    # ========== 文件 ==========
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'generation': 0, 'next_segment': 1, 'segments': [], 'docs': 0, 'total_length': 0}
+
+    def _path(self, seg_id, suffix):
+        return os.path.join(self.root, f'seg-{seg_id}.{suffix}')
+
+    def _segment_files(self, info):
+        files = [self._path(info['id'], suffix) for suffix in ('terms.json', 'post', 'docs', 'lens')]
+        if info['del_version']:
+            files.append(self._path(info['id'], f"del-{info['del_version']}"))
+        return files
+
+    # ========== 写入 ==========
+
+    def add(self, docs):
+        """
+        索引一批切片（已索引的切片哈希跳过）
+
+        Args:
+            docs: [(chunk_hash, text), ...]
+
+        Returns:
+            int: 新索引的切片数量
+        """
+        with self._write_lock() as manifest:
+            live = self._load_live(manifest)
+            batch = {}
+            for chunk_hash, text in docs:
+                key = bytes.fromhex(chunk_hash)
+                if key not in live and key not in batch:
+                    batch[key] = text
+            if not batch:
+                return 0
+
+            seg_id = manifest['next_segment']
+            manifest['next_segment'] += 1
+            hashes = list(batch)
+            lengths = np.zeros(len(hashes), dtype=np.uint32)
+            postings = {}
+            for doc, key in enumerate(hashes):
+                terms = tokenize(batch[key])
+                lengths[doc] = len(terms)
+                for term, tf in Counter(terms).items():
+                    entry = postings.get(term)
+                    if entry is None:
+                        postings[term] = entry = ([], [])
+                    entry[0].append(doc)
+                    entry[1].append(tf)
+            self._write_segment(seg_id, hashes, lengths, {
+                term: (np.asarray(ids, dtype=np.int64), np.asarray(tfs, dtype=np.int64))
+                for term, (ids, tfs) in postings.items()
+            })
+            manifest['segments'].append({
+                'id': seg_id, 'docs': len(hashes), 'length': int(lengths.sum()),
+                'deleted': 0, 'deleted_length': 0, 'del_version': 0
+            })
+            for doc, key in enumerate(hashes):
+                live[key] = (seg_id, doc)
+            self._merge_if_needed(manifest)
+            self._commit(manifest)
+            return len(hashes)
+
+    def delete(self, chunk_hashes):
+        """
+        从索引中删除切片
+
+        Args:
+            chunk_hashes: 切片哈希列表
+
+        Returns:
+            int: 删除的切片数量
+        """
+        with self._write_lock() as manifest:
+            live = self._load_live(manifest)
+            by_segment = {}
+            for chunk_hash in set(chunk_hashes):
+                location = live.pop(bytes.fromhex(chunk_hash), None)
+                if location is not None:
+                    by_segment.setdefault(location[0], []).append(location[1])
+            if not by_segment:
+                return 0
+
+            for info in manifest['segments']:
+                docs = by_segment.get(info['id'])
+                if not docs:
+                    continue
+                mask = self._mask(info)
+                mask = np.ones(info['docs'], dtype=bool) if mask is None else mask.copy()
+                docs = np.asarray(docs, dtype=np.int64)
+                mask[docs] = False
+                info['deleted'] += len(docs)
+                info['deleted_length'] += int(self._open_segment(info['id']).lengths[docs].sum())
+                self._write_mask(info, mask)
+            self._merge_if_needed(manifest)
+            self._commit(manifest)
+            return sum(len(docs) for docs in by_segment.values())
+
+    def indexed(self, chunk_hashes):
+        """返回 chunk_hashes 中已索引的切片哈希"""
+        with self._write_lock() as manifest:
+            live = self._load_live(manifest)
+            return {h for h in chunk_hashes if bytes.fromhex(h) in live}
+
+    @contextmanager
+    def _write_lock(self):
+        """进程内互斥 + 跨进程文件锁，产出从磁盘读取的最新 manifest"""
+        with self._write_mutex:
+            with open(self._lock_path, 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    try:
+                        yield self._read_manifest()
+                    except BaseException:
+                        self._live = None
+                        raise
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_live(self, manifest):
+        """写入方的 切片哈希 → (段编号, 文档编号) 映射（其他进程写入后重建）"""
+        if self._live is None or self._live_generation != manifest['generation']:
+            live = {}
+            for info in manifest['segments']:
+                docs = self._open_segment(info['id']).docs
+                mask = self._mask(info)
+                for doc in (range(info['docs']) if mask is None else np.flatnonzero(mask).tolist()):
+                    live[docs[doc * _ID_BYTES:(doc + 1) * _ID_BYTES]] = (info['id'], doc)
+            self._live = live
+            self._live_generation = manifest['generation']
+        return self._live
+
+    def _write_segment(self, seg_id, hashes, lengths, postings):
+        """
+        写入一个段的全部文件
+
+        Args:
+            seg_id: 段编号
+            hashes: 文档编号顺序的切片哈希（bytes）
+            lengths: 文档长度（词项数）
+            postings: 词项 -> (升序文档编号, 词频)
+        """
+        terms = {}
+        offset = 0
+        with open(self._path(seg_id, 'post'), 'wb') as f:
+            for term in sorted(postings):
+                ids, tfs = postings[term]
+                tfs = tfs.astype(np.int64, copy=False)
+                deltas = np.diff(ids, prepend=0)
+                id_width = _width(int(deltas.max()))
+                tf_width = 1 if tfs.max() < 256 else 2
+                # 每个块按宽度对齐，解码时得到对齐的数组
+                pad = -offset % id_width
+                f.write(b'\0' * pad)
+                offset += pad
+                terms[term] = [offset, len(ids), id_width, tf_width]
+                f.write(deltas.astype(_UINT[id_width]).tobytes())
+                offset += len(ids) * id_width
+                pad = -offset % tf_width
+                f.write(b'\0' * pad + np.minimum(tfs, 65535).astype(_UINT[tf_width]).tobytes())
+                offset += pad + len(ids) * tf_width
+        with open(self._path(seg_id, 'docs'), 'wb') as f:
+            f.write(b''.join(hashes))
+        with open(self._path(seg_id, 'lens'), 'wb') as f:
+            f.write(lengths.astype(np.uint32).tobytes())
+        with open(self._path(seg_id, 'terms.json'), 'w', encoding='utf-8') as f:
+            json.dump(terms, f, ensure_ascii=False, separators=(',', ':'))
+
+    def _write_mask(self, info, mask):
+        """写入新版本的删除位图；保留上一个版本供正在检索的请求使用"""
+        version = info['del_version'] + 1
+        path = self._path(info['id'], f'del-{version}')
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(np.packbits(~mask).tobytes())
+        os.replace(tmp_path, path)
+        stale = self._path(info['id'], f'del-{version - 2}')
+        if os.path.exists(stale):
+            os.remove(stale)
+        info['del_version'] = version
+
+    def _merge_if_needed(self, manifest):
+        """段数量超过上限时合并最小的段，删除比例过高的段一并重写"""
+        segments = manifest['segments']
+        selected = {
+            info['id'] for info in segments
+            if info['deleted'] and info['deleted'] >= info['docs'] * self.merge_deleted_ratio
+        }
+        if len(segments) > self.max_segments:
+            by_size = sorted(segments, key=lambda info: info['docs'] - info['deleted'])
+            selected.update(info['id'] for info in by_size[:len(segments) - self.max_segments // 2 + 1])
+        if not selected:
+            return
+
+        merged = [info for info in segments if info['id'] in selected]
+        hashes, lengths, opened = [], [], []
+        remaps = []
+        total = 0
+        for info in merged:
+            segment = self._open_segment(info['id'])
+            mask = self._mask(info)
+            keep = np.ones(info['docs'], dtype=bool) if mask is None else mask
+            remap = np.full(info['docs'], -1, dtype=np.int64)
+            remap[keep] = np.arange(total, total + int(keep.sum()))
+            total += int(keep.sum())
+            hashes.extend(
+                segment.docs[doc * _ID_BYTES:(doc + 1) * _ID_BYTES] for doc in np.flatnonzero(keep).tolist()
+            )
+            lengths.append(segment.lengths[keep])
+            remaps.append(remap)
+            opened.append(segment)
+
+        postings = {}
+        for segment, remap in zip(opened, remaps):
+            for term, entry in segment.terms.items():
+                ids, tfs = self._decode(segment, entry)
+                ids = remap[ids]
+                keep = ids >= 0
+                if not keep.any():
+                    continue
+                postings.setdefault(term, []).append((ids[keep], tfs[keep]))
+        postings = {
+            term: (np.concatenate([ids for ids, _ in parts]), np.concatenate([tfs for _, tfs in parts]))
+            for term, parts in postings.items()
+        }
+
+        remaining = [info for info in segments if info['id'] not in selected]
+        if hashes:
+            seg_id = manifest['next_segment']
+            manifest['next_segment'] += 1
+            lengths = np.concatenate(lengths)
+            self._write_segment(seg_id, hashes, lengths, postings)
+            remaining.append({
+                'id': seg_id, 'docs': len(hashes), 'length': int(lengths.sum()),
+                'deleted': 0, 'deleted_length': 0, 'del_version': 0
+            })
+            for doc, key in enumerate(hashes):
+                self._live[key] = (seg_id, doc)
+        manifest['segments'] = remaining
+        manifest['removed'] = merged
+
+    def _commit(self, manifest):
+        """原子替换 manifest.json，再删除被合并掉的段文件"""
+        removed = manifest.pop('removed', [])
+        manifest['docs'] = sum(info['docs'] - info['deleted'] for info in manifest['segments'])
+        manifest['total_length'] = sum(info['length'] - info['deleted_length'] for info in manifest['segments'])
+        manifest['generation'] += 1
+        self._live_generation = manifest['generation']
+        tmp_path = f'{self._manifest_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._manifest_path)
+
+        # 已打开这些段的读取方仍可通过内存映射读完当前查询
+        for info in removed:
+            with self._lock:
+                self._segments.pop(info['id'], None)
+                self._norms.pop(info['id'], None)
+                for key in [key for key in self._masks if key[0] == info['id']]:
+                    del self._masks[key]
+            for path in self._segment_files(info):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    # ========== 读取 ==========
+
+    def _open_segment(self, seg_id):
+        with self._lock:
+            segment = self._segments.get(seg_id)
+        if segment is not None:
+            return segment
+        with open(self._path(seg_id, 'terms.json'), encoding='utf-8') as f:
+            terms = json.load(f)
+        post_path = self._path(seg_id, 'post')
+        if os.path.getsize(post_path):
+            # 转为普通 ndarray 视图，切片时不经过 np.memmap 子类的额外开销
+            postings = np.memmap(post_path, dtype=np.uint8, mode='r').view(np.ndarray)
+        else:
+            postings = np.zeros(0, dtype=np.uint8)
+        segment = _Segment(
+            terms,
+            postings,
+            self._read_bytes(self._path(seg_id, 'docs')),
+            np.fromfile(self._path(seg_id, 'lens'), dtype=np.uint32)
+        )
+        with self._lock:
+            return self._segments.setdefault(seg_id, segment)
+
+    @staticmethod
+    def _read_bytes(path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _mask(self, info):
+        """段内有效文档掩码（没有删除时为 None）"""
+        if not info['deleted']:
+            return None
+        key = (info['id'], info['del_version'])
+        with self._lock:
+            mask = self._masks.get(key)
+        if mask is None:
+            bits = np.fromfile(self._path(info['id'], f"del-{info['del_version']}"), dtype=np.uint8)
+            mask = ~np.unpackbits(bits, count=info['docs']).astype(bool)
+            with self._lock:
+                # 只保留每个段的最新版本
+                for stale in [k for k in self._masks if k[0] == info['id']]:
+                    del self._masks[stale]
+                self._masks[key] = mask
+        return mask
+
+    def _length_norm(self, generation, seg_id, segment, avg_length):
+        """段内每个文档的 BM25 长度归一化项 k1 * (1 - b + b * dl / avgdl)（平均长度变化前复用）"""
+        key = (seg_id, generation)
+        with self._lock:
+            norm = self._norms.get(seg_id)
+        if norm is not None and norm[0] == key:
+            return norm[1]
+        values = self.k1 * (1 - self.b + self.b * segment.lengths.astype(np.float32) / np.float32(avg_length))
+        with self._lock:
+            self._norms[seg_id] = (key, values)
+        return values
+
+    @staticmethod
+    def _decode(segment, entry):
+        """解码一个词项的倒排表，返回 (文档编号, 词频)"""
+        offset, df, id_width, tf_width = entry
+        end = offset + df * id_width
+        ids = segment.postings[offset:end].view(_UINT[id_width]).cumsum(dtype=np.int64)
+        start = end + (-end % tf_width)
+        tfs = segment.postings[start:start + df * tf_width].view(_UINT[tf_width])
+        return ids, tfs
+
+    def search(self, query, k):
+        """
+        BM25 检索
+
+        Args:
+            query: 查询文本
+            k: 返回数量
+
+        Returns:
+            list[tuple]: 按得分降序排列的 (切片哈希, 得分)
+        """
+        terms = tokenize_query(query)
+        if not terms or k <= 0:
+            return []
+        try:
+            return self._search(self._read_manifest(), terms, k)
+        except FileNotFoundError:
+            # 读取 manifest 后段被其他进程合并删除，按新的 manifest 重试一次
+            return self._search(self._read_manifest(), terms, k)
+
+    def _search(self, manifest, terms, k):
+        live_docs = manifest['docs']
+        if live_docs == 0:
+            return []
+        avg_length = manifest['total_length'] / live_docs or 1.0
+        opened = [(info, self._open_segment(info['id'])) for info in manifest['segments']]
+
+        # 文档频率按全部段汇总（已删除但未合并的文档也计入，合并后恢复精确）
+        df = Counter()
+        for _, segment in opened:
+            for term in terms:
+                entry = segment.terms.get(term)
+                if entry is not None:
+                    df[term] += entry[1]
+        if not df:
+            return []
+        idf = {
+            term: float(np.log1p((live_docs - min(n, live_docs) + 0.5) / (min(n, live_docs) + 0.5)))
+            for term, n in df.items()
+        }
+
+        k1 = self.k1
+        segment_parts, ids_parts, score_parts = [], [], []
+        for position, (info, segment) in enumerate(opened):
+            entries = [(term, segment.terms[term]) for term in df if term in segment.terms]
+            if not entries:
+                continue
+            norm = self._length_norm(manifest['generation'], info['id'], segment, avg_length)
+            if len(entries) == 1:
+                term, entry = entries[0]
+                ids, tfs = self._decode(segment, entry)
+                tfs = tfs.astype(np.float32)
+                scores = (idf[term] * (k1 + 1)) * tfs / (tfs + norm[ids])
+            else:
+                # 段内按文档编号稠密累加（同一词项的文档编号不重复），不需要排序去重
+                scores = np.zeros(info['docs'], dtype=np.float32)
+                for term, entry in entries:
+                    ids, tfs = self._decode(segment, entry)
+                    tfs = tfs.astype(np.float32)
+                    scores[ids] += (idf[term] * (k1 + 1)) * tfs / (tfs + norm[ids])
+                ids = np.flatnonzero(scores)
+                scores = scores[ids]
+            mask = self._mask(info)
+            if mask is not None:
+                keep = mask[ids]
+                ids, scores = ids[keep], scores[keep]
+            segment_parts.append(np.full(len(ids), position, dtype=np.int32))
+            ids_parts.append(ids)
+            score_parts.append(scores)
+
+        if not ids_parts:
+            return []
+        positions = np.concatenate(segment_parts)
+        ids = np.concatenate(ids_parts)
+        scores = np.concatenate(score_parts)
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        results = []
+        for i in top.tolist():
+            docs = opened[positions[i]][1].docs
+            doc = int(ids[i])
+            results.append((docs[doc * _ID_BYTES:(doc + 1) * _ID_BYTES].hex(), float(scores[i])))
+        return results
+
+    def count(self):
+        """已索引的切片数量"""
+        return self._read_manifest()['docs']
+
+    def stats(self):
+        manifest = self._read_manifest()
+        size = 0
+        for info in manifest['segments']:
+            size += sum(os.path.getsize(path) for path in self._segment_files(info) if os.path.exists(path))
+        return {
+            'count': manifest['docs'],
+            'segments': len(manifest['segments']),
+            'deleted': sum(info['deleted'] for info in manifest['segments']),
+            'size_bytes': size
+        }
@@ -0,0 +1,58 @@
+"""
+关键词检索分词
+
+- 中文等 CJK 连续文本切为单字和相邻二元组（不依赖词典，“报销流程”可以被“报销”“流程”命中）；
+- 英文、数字按单词切分并转为小写；
+- 由 - _ / . 连接的编号（如 PN-1234、GB/T-19001、v2.3.1）额外保留完整形式，
+  用户粘贴编号时可以精确命中。
+
+查询时长度不小于 2 的 CJK 片段只取二元组：单字的倒排表很长（“的”“是”几乎
+出现在每个切片中），区分度却低，二元组已能覆盖查询中的每个字。
+"""
+import re
+
+from app.services.ingestion.splitter import CJK_CHARS
+
+_CJK_RUN_RE = re.compile(f'[{CJK_CHARS}]+')
+_WORD_RE = re.compile(f'[^\\W{CJK_CHARS}_]+')
+_COMPOUND_RE = re.compile(f'[^\\W{CJK_CHARS}_]+(?:[-_/.][^\\W{CJK_CHARS}_]+)+')
+
+
+def tokenize(text):
+    """
+    将文本切分为索引词项
+
+    Args:
+        text: 文本
+
+    Returns:
+        list[str]: 词项（可重复，用于统计词频）
+    """
+    text = text.lower()
+    terms = _WORD_RE.findall(text)
+    terms.extend(_COMPOUND_RE.findall(text))
+    for run in _CJK_RUN_RE.findall(text):
+        terms.extend(run)
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def tokenize_query(text):
+    """
+    将查询切分为检索词项（去重，CJK 片段只在单字时使用单字词项）
+
+    Args:
+        text: 查询文本
+
+    Returns:
+        list[str]: 去重后的词项
+    """
+    text = text.lower()
+    terms = _WORD_RE.findall(text)
+    terms.extend(_COMPOUND_RE.findall(text))
+    for run in _CJK_RUN_RE.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return list(dict.fromkeys(terms))
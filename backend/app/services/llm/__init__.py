@@ -0,0 +1,38 @@
+"""
+大模型服务
+"""
+from flask import current_app
+
+from .backends import (
+    LLMBackend, LLMError, CancelToken, MockLLMBackend, OpenAIChatBackend, create_llm_backend
+)
+from .streaming import AnswerStream
+
+
+def get_llm_backend():
+    """获取当前应用的大模型后端（进程内共享连接池）"""
+    backend = current_app.extensions.get('llm_backend')
+    if backend is None:
+        backend = create_llm_backend(current_app.config)
+        current_app.extensions['llm_backend'] = backend
+    return backend
+
+
+def create_answer_stream(messages):
+    """按当前应用配置创建一次回答生成"""
+    config = current_app.config
+    return AnswerStream(
+        current_app._get_current_object(),
+        get_llm_backend(),
+        messages,
+        first_token_budget=config.get('LLM_FIRST_TOKEN_BUDGET_MS', 10000) / 1000,
+        total_budget=config.get('LLM_GENERATE_BUDGET_MS', 120000) / 1000,
+        flush_bytes=config.get('SSE_FLUSH_BYTES', 512),
+        flush_interval=config.get('SSE_FLUSH_INTERVAL_MS', 50) / 1000
+    )
+
+
+__all__ = [
+    'LLMBackend', 'LLMError', 'CancelToken', 'MockLLMBackend', 'OpenAIChatBackend', 'create_llm_backend',
+    'AnswerStream', 'get_llm_backend', 'create_answer_stream'
+]
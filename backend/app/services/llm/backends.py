@@ -0,0 +1,389 @@
+"""
+大模型（LLM）后端
+
+所有后端以片段流的形式返回回答，调用方通过 CancelToken 取消：取消后后端应尽快
+停止，HTTP 后端会立即关闭上游连接，让上游服务停止生成。
+异步服务模式下使用 astream_chat（异步生成器，任务被取消时同样关闭上游连接）。
+"""
+import json
+import asyncio
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.utils.aio import iterate_in_thread
+
+# 首个片段之前遇到这些状态码时重试
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """大模型调用失败"""
+
+
+class CancelToken:
+    """取消令牌：cancel() 时置位，并执行已注册的回调（如关闭上游连接）"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:  # noqa: BLE001 取消回调失败不影响调用方
+                pass
+
+    def is_cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, timeout):
+        """等待至多 timeout 秒，返回是否已取消（可替代 sleep）"""
+        return self._event.wait(timeout)
+
+    def on_cancel(self, callback):
+        """
+        注册取消回调（已取消时立即执行）
+
+        Returns:
+            callable: 注销函数
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+class LLMBackend:
+    """大模型后端基类"""
+
+    name = 'base'
+
+    def stream_chat(self, messages, cancel):
+        """
+        流式生成回答
+
+        Args:
+            messages: OpenAI 兼容格式的消息列表
+            cancel: CancelToken
+
+        Yields:
+            str: 回答片段
+
+        Raises:
+            LLMError: 调用失败
+        """
+        raise NotImplementedError
+
+    async def astream_chat(self, messages, cancel, executor=None):
+        """
+        异步流式生成回答（默认在线程池中执行 stream_chat，有原生异步实现的后端应覆盖）
+
+        Args:
+            messages: OpenAI 兼容格式的消息列表
+            cancel: CancelToken
+            executor: 执行阻塞调用的线程池
+
+        Yields:
+            str: 回答片段
+        """
+        async for piece in iterate_in_thread(executor, lambda: self.stream_chat(messages, cancel)):
+            yield piece
+
+
+class MockLLMBackend(LLMBackend):
+    """
+    固定回复的本地模拟后端（逐字符输出，字符间隔 delay 秒，模拟上游生成速度）
+
+    带参考资料（system 消息中有“参考资料”）时回复 rag_reply，否则回复 reply，用于离线开发。
+    """
+
+    name = 'mock'
+
+    def __init__(self, reply='测试回复：非RAG模式下的回复', rag_reply='测试回复：xxxxx', delay=0.0):
+        self.reply = reply
+        self.rag_reply = rag_reply
+        self.delay = delay
+
+    def _reply_for(self, messages):
+        with_context = any(
+            message['role'] == 'system' and '参考资料' in message['content'] for message in messages
+        )
+        return self.rag_reply if with_context else self.reply
+
+    def stream_chat(self, messages, cancel):
+        for char in self._reply_for(messages):
+            # 用 cancel.wait 代替 sleep，取消时立即返回
+            if self.delay and cancel.wait(self.delay):
+                return
+            if cancel.is_cancelled():
+                return
+            yield char
+
+    async def astream_chat(self, messages, cancel, executor=None):
+        for char in self._reply_for(messages):
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            if cancel.is_cancelled():
+                return
+            yield char
+
+
+class OpenAIChatBackend(LLMBackend):
+    """
+    OpenAI 兼容的 /chat/completions 流式接口
+
+    - 所有请求共享一个 keep-alive 连接池；
+    - 收到首个片段之前的连接错误、超时和可重试状态码按指数退避重试，
+      之后出错不再重试（已输出的内容无法撤回）；
+    - 取消时关闭响应，断开上游连接；
+    - 异步服务模式下使用 httpx.AsyncClient（需要安装 httpx），不占用线程。
+    """
+
+    name = 'openai'
+
+    def __init__(self, api_base, model, api_key='', timeout=60, connect_timeout=5, max_retries=2,
+                 retry_backoff=0.5, pool_size=32, temperature=None, max_tokens=None, async_pool_size=1024):
+        """
+        Args:
+            api_base: 接口地址（如 https://api.openai.com/v1）
+            model: 模型名
+            api_key: API Key
+            timeout: 两个片段之间的最长等待秒数
+            connect_timeout: 建立连接的最长等待秒数
+            max_retries: 首个片段之前的最大重试次数
+            retry_backoff: 首次重试前的等待秒数（之后每次翻倍）
+            pool_size: 连接池大小（同时进行的生成请求数）
+            temperature: 采样温度，为空时使用服务端默认值
+            max_tokens: 最大生成 token 数，为空时使用服务端默认值
+            async_pool_size: 异步模式下的最大连接数（同时进行的生成请求数）
+        """
+        self.url = api_base.rstrip('/') + '/chat/completions'
+        self.model = model
+        self.timeout = (connect_timeout, timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if api_key:
+            self.session.headers['Authorization'] = f'Bearer {api_key}'
+        # 异步客户端绑定到创建它的事件循环，首次使用时创建
+        self.async_pool_size = async_pool_size
+        self._async_client = None
+        self._async_loop = None
+
+    def _payload(self, messages):
+        payload = {'model': self.model, 'messages': messages, 'stream': True}
+        if self.temperature is not None:
+            payload['temperature'] = self.temperature
+        if self.max_tokens:
+            payload['max_tokens'] = self.max_tokens
+        return payload
+
+    def stream_chat(self, messages, cancel):
+        payload = self._payload(messages)
+        attempt = 0
+        while True:
+            started = False
+            try:
+                for piece in self._stream_once(payload, cancel):
+                    started = True
+                    yield piece
+                return
+            except _RetryableError as e:
+                if cancel.is_cancelled():
+                    return
+                if started or attempt >= self.max_retries:
+                    raise LLMError(f"调用大模型接口失败: {str(e)}") from e
+                # 退避期间被取消时直接返回
+                if cancel.wait(self.retry_backoff * (2 ** attempt)):
+                    return
+                attempt += 1
+
+    def _stream_once(self, payload, cancel):
+        """发送一次请求并解析 SSE 响应"""
+        try:
+            response = self.session.post(self.url, json=payload, stream=True, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise _RetryableError(str(e)) from e
+        except requests.RequestException as e:
+            raise LLMError(f"调用大模型接口失败: {str(e)}") from e
+
+        # 取消时关闭响应：阻塞在读取上的线程随即返回，连接不再放回连接池
+        unregister = cancel.on_cancel(response.close)
+        try:
+            if response.status_code in RETRYABLE_STATUS:
+                # 读完错误响应体，连接可以放回连接池供重试复用
+                response.content
+                raise _RetryableError(f"HTTP {response.status_code}")
+            if response.status_code >= 400:
+                raise LLMError(f"调用大模型接口失败: HTTP {response.status_code} {response.text[:200]}")
+            done = False
+            for line in response.iter_lines(chunk_size=None):
+                if cancel.is_cancelled():
+                    return
+                # [DONE] 之后继续读完响应体，连接才能放回连接池复用
+                if done:
+                    continue
+                piece = self._parse_line(line)
+                if piece is _DONE:
+                    done = True
+                elif piece:
+                    yield piece
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if cancel.is_cancelled():
+                return
+            raise _RetryableError(str(e)) from e
+        except (requests.RequestException, AttributeError, OSError, ValueError) as e:
+            # 取消时关闭响应，读取线程可能在已关闭的连接上看到各种异常
+            if cancel.is_cancelled():
+                return
+            raise LLMError(f"调用大模型接口失败: {str(e)}") from e
+        finally:
+            unregister()
+            response.close()
+
+    async def astream_chat(self, messages, cancel, executor=None):
+        payload = self._payload(messages)
+        client = self._get_async_client()
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async for piece in self._astream_once(client, payload, cancel):
+                    started = True
+                    yield piece
+                return
+            except _RetryableError as e:
+                if cancel.is_cancelled():
+                    return
+                if started or attempt >= self.max_retries:
+                    raise LLMError(f"调用大模型接口失败: {str(e)}") from e
+                await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+                attempt += 1
+
+    async def _astream_once(self, client, payload, cancel):
+        """发送一次请求并解析 SSE 响应（任务被取消时退出 async with，关闭上游连接）"""
+        import httpx
+
+        try:
+            async with client.stream('POST', self.url, json=payload) as response:
+                if response.status_code in RETRYABLE_STATUS:
+                    # 读完错误响应体，连接可以放回连接池供重试复用
+                    await response.aread()
+                    raise _RetryableError(f"HTTP {response.status_code}")
+                if response.status_code >= 400:
+                    body = (await response.aread()).decode('utf-8', errors='replace')
+                    raise LLMError(f"调用大模型接口失败: HTTP {response.status_code} {body[:200]}")
+                done = False
+                async for line in response.aiter_lines():
+                    if cancel.is_cancelled():
+                        return
+                    # [DONE] 之后继续读完响应体，连接才能放回连接池复用
+                    if done:
+                        continue
+                    piece = self._parse_line(line)
+                    if piece is _DONE:
+                        done = True
+                    elif piece:
+                        yield piece
+        except httpx.TransportError as e:
+            raise _RetryableError(str(e) or type(e).__name__) from e
+        except httpx.HTTPError as e:
+            raise LLMError(f"调用大模型接口失败: {str(e)}") from e
+
+    def _get_async_client(self):
+        try:
+            import httpx
+        except ImportError as e:
+            raise LLMError("异步服务模式调用大模型接口需要安装 httpx（pip install httpx）") from e
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            connect_timeout, read_timeout = self.timeout
+            self._async_client = httpx.AsyncClient(
+                headers={'Authorization': self.session.headers['Authorization']}
+                if 'Authorization' in self.session.headers else None,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.async_pool_size, max_keepalive_connections=self.async_pool_size
+                )
+            )
+            self._async_loop = loop
+        return self._async_client
+
+    @staticmethod
+    def _parse_line(line):
+        """解析一行 SSE 数据（bytes 或 str），返回回答片段、_DONE 或 None"""
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        if not line.startswith('data:'):
+            return None
+        data = line[5:].strip()
+        if data == '[DONE]':
+            return _DONE
+        try:
+            chunk = json.loads(data)
+        except ValueError as e:
+            raise LLMError(f"大模型接口返回了无法解析的数据: {data[:200]!r}") from e
+        if chunk.get('error'):
+            raise LLMError(f"大模型接口返回错误: {chunk['error']}")
+        choices = chunk.get('choices') or []
+        if not choices:
+            return None
+        return (choices[0].get('delta') or {}).get('content')
+
+
+class _RetryableError(Exception):
+    """首个片段之前可以重试的错误"""
+
+
+_DONE = object()
+
+
+def create_llm_backend(config):
+    """
+    根据 LLM_BACKEND 创建大模型后端
+
+    Args:
+        config: 应用配置
+
+    Returns:
+        LLMBackend: 大模型后端
+    """
+    name = config.get('LLM_BACKEND', 'mock')
+    if name == MockLLMBackend.name:
+        return MockLLMBackend(delay=config.get('LLM_MOCK_TOKEN_DELAY_MS', 0) / 1000)
+    if name == OpenAIChatBackend.name:
+        temperature = config.get('LLM_TEMPERATURE', -1)
+        return OpenAIChatBackend(
+            api_base=config['LLM_API_BASE'],
+            model=config['LLM_MODEL'],
+            api_key=config.get('LLM_API_KEY', ''),
+            timeout=config.get('LLM_TIMEOUT', 60),
+            connect_timeout=config.get('LLM_CONNECT_TIMEOUT', 5),
+            max_retries=config.get('LLM_MAX_RETRIES', 2),
+            pool_size=config.get('LLM_POOL_SIZE', 32),
+            temperature=temperature if temperature is not None and temperature >= 0 else None,
+            max_tokens=config.get('LLM_MAX_TOKENS') or None,
+            async_pool_size=config.get('LLM_ASYNC_POOL_SIZE', 1024)
+        )
+    raise ValueError(f"未知的大模型后端: {name}")
@@ -0,0 +1,240 @@
+"""
+回答流
+
+后端在独立线程中生成，首个片段和整体生成分别有时间预算，响应生成器被关闭
+（客户端断开）、超时或出错时取消后端请求。
+片段由生成线程写入共享的合并缓冲：首个片段立即发出，之后按字节数或时间间隔
+合并为一个 content 事件；响应生成器每帧只被唤醒一次，而不是每个片段一次。
+异步服务模式下（aevents）生成在事件循环上进行，不占用线程。
+"""
+import time
+import asyncio
+import threading
+
+from app.utils.sse import TokenCoalescer
+from .backends import CancelToken
+
+# 生成失败且没有任何输出时的回复
+FALLBACK_REPLY = '抱歉，暂时无法生成回答，请稍后重试。'
+
+# 阶段状态（与 RAG 流水线的 stage 事件一致）
+STATUS_OK = 'ok'
+STATUS_TIMEOUT = 'timeout'
+STATUS_ERROR = 'error'
+
+
+class AnswerStream:
+    """一次回答生成"""
+
+    def __init__(self, app, backend, messages, first_token_budget=10, total_budget=120, flush_bytes=512,
+                 flush_interval=0.05):
+        """
+        Args:
+            app: Flask 应用（生成线程中推入应用上下文）
+            backend: 大模型后端
+            messages: 对话消息
+            first_token_budget: 等待首个片段的最长秒数
+            total_budget: 整体生成的最长秒数
+            flush_bytes: 合并片段的字节数阈值
+            flush_interval: 合并片段的最长等待秒数
+        """
+        self.app = app
+        self.backend = backend
+        self.messages = messages
+        self.first_token_budget = first_token_budget
+        self.total_budget = total_budget
+        self.cancel = CancelToken()
+        # 生成结果：回答正文、是否完整生成
+        self.answer = ''
+        self.ok = False
+        # 生成线程与响应生成器共享的状态（_cond 保护）
+        self._cond = threading.Condition()
+        self._buffer = TokenCoalescer(flush_bytes, flush_interval)
+        self._finished = False
+        self._error = None
+
+    def events(self):
+        """
+        同步生成（生成线程 + 条件变量）
+
+        Yields:
+            dict: content 事件，最后是 generate 阶段的 stage 事件
+        """
+        started = time.monotonic()
+        worker = threading.Thread(target=self._produce, name='llm-stream', daemon=True)
+        worker.start()
+
+        state = _StreamState(started, self.first_token_budget, self.total_budget)
+        try:
+            while not state.done:
+                with self._cond:
+                    now = time.monotonic()
+                    if not self._deliverable(now, state.first):
+                        self._cond.wait(self._wait_timeout(now, state.limit))
+                    text, finished, failure = self._take(time.monotonic(), state.first)
+                if text:
+                    yield self._content(state, text)
+                state.advance(bool(text), finished, failure)
+        finally:
+            # 超时、出错或客户端断开（GeneratorExit）时取消后端请求；正常结束时无副作用
+            self.cancel.cancel()
+
+        with self._cond:
+            text = self._buffer.take()
+        yield from self._finish(state, text)
+
+    async def aevents(self, executor=None):
+        """
+        异步生成（在事件循环上读取后端的 astream_chat，不占用线程）
+
+        Args:
+            executor: 后端没有原生异步实现时执行阻塞调用的线程池
+
+        Yields:
+            dict: content 事件，最后是 generate 阶段的 stage 事件
+        """
+        started = time.monotonic()
+        wakeup = asyncio.Event()
+        producer = asyncio.ensure_future(self._aproduce(wakeup, executor))
+
+        state = _StreamState(started, self.first_token_budget, self.total_budget)
+        try:
+            while not state.done:
+                now = time.monotonic()
+                if not self._deliverable(now, state.first):
+                    wakeup.clear()
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), self._wait_timeout(now, state.limit))
+                    except asyncio.TimeoutError:
+                        pass
+                text, finished, failure = self._take(time.monotonic(), state.first)
+                if text:
+                    yield self._content(state, text)
+                state.advance(bool(text), finished, failure)
+        finally:
+            # 超时、出错或客户端断开（任务被取消）时取消后端请求
+            self.cancel.cancel()
+            producer.cancel()
+
+        for event in self._finish(state, self._buffer.take()):
+            yield event
+
+    def _deliverable(self, now, first):
+        """缓冲的片段是否应发出（首个片段、达到合并条件或生成已结束）"""
+        if not self._buffer:
+            return False
+        return first or self._finished or self._error is not None or self._buffer.ready(now)
+
+    def _wait_timeout(self, now, limit):
+        """等待生成线程的超时：不超过阶段截止时间，有缓冲时不超过其应发出的时刻"""
+        flush_wait = self._buffer.wait(now)
+        timeout = limit - now if flush_wait is None else min(limit - now, flush_wait)
+        return max(timeout, 0)
+
+    def _take(self, now, first):
+        """取出应发出的文本和生成状态"""
+        text = self._buffer.take() if self._deliverable(now, first) else ''
+        return text, self._finished, self._error
+
+    def _content(self, state, text):
+        if state.first:
+            state.first_token_ms = round((time.monotonic() - state.started) * 1000, 1)
+        self.answer += text
+        return {'type': 'content', 'content': text}
+
+    def _finish(self, state, pending):
+        """发出截止前已缓冲的片段（没有任何输出时发出提示信息）和 stage 事件"""
+        if pending:
+            self.answer += pending
+            yield {'type': 'content', 'content': pending}
+        if not self.answer and state.status != STATUS_OK:
+            self.answer = FALLBACK_REPLY
+            yield {'type': 'content', 'content': self.answer}
+        self.ok = state.status == STATUS_OK
+        event = {
+            'type': 'stage',
+            'stage': 'generate',
+            'status': state.status,
+            'elapsed_ms': round((time.monotonic() - state.started) * 1000, 1),
+            'first_token_ms': state.first_token_ms,
+            'backend': self.backend.name
+        }
+        if state.error is not None:
+            event['error'] = state.error
+        yield event
+
+    def _add(self, piece):
+        """
+        写入一个片段（调用方持有锁或在事件循环中）
+
+        Returns:
+            bool: 是否需要唤醒响应生成器（缓冲由空变为非空，或达到合并条件）
+        """
+        notify = not self._buffer
+        now = time.monotonic()
+        self._buffer.add(piece, now)
+        return notify or self._buffer.ready(now)
+
+    def _produce(self):
+        try:
+            with self.app.app_context():
+                for piece in self.backend.stream_chat(self.messages, self.cancel):
+                    if self.cancel.is_cancelled():
+                        return
+                    if not piece:
+                        continue
+                    with self._cond:
+                        if self._add(piece):
+                            self._cond.notify()
+            with self._cond:
+                self._finished = True
+                self._cond.notify()
+        except Exception as e:  # noqa: BLE001 由响应生成器转为 stage 事件
+            with self._cond:
+                self._error = e
+                self._cond.notify()
+
+    async def _aproduce(self, wakeup, executor):
+        try:
+            async for piece in self.backend.astream_chat(self.messages, self.cancel, executor):
+                if self.cancel.is_cancelled():
+                    return
+                if piece and self._add(piece):
+                    wakeup.set()
+            self._finished = True
+        except Exception as e:  # noqa: BLE001 由响应生成器转为 stage 事件
+            self._error = e
+        wakeup.set()
+
+
+class _StreamState:
+    """响应生成器一侧的状态：截止时间、首个片段耗时与结束原因"""
+
+    def __init__(self, started, first_token_budget, total_budget):
+        self.started = started
+        self.first_deadline = started + first_token_budget
+        self.deadline = started + total_budget
+        self.first_token_ms = None
+        self.status = STATUS_OK
+        self.error = None
+        self.done = False
+
+    @property
+    def first(self):
+        return self.first_token_ms is None
+
+    @property
+    def limit(self):
+        return self.first_deadline if self.first else self.deadline
+
+    def advance(self, delivered, finished, failure):
+        """根据本轮结果判断是否结束：出错、生成完成，或没有可发出的内容且已到截止时间"""
+        if failure is not None:
+            self.status = STATUS_ERROR
+            self.error = str(failure)
+            self.done = True
+        elif finished:
+            self.done = True
+        elif not delivered and time.monotonic() >= self.limit:
+            self.status = STATUS_TIMEOUT
+            self.done = True
@@ -0,0 +1,261 @@
+"""
+助手消息的后台写入（write-behind）
+
+聊天流结束（或客户端中途断开）时，助手消息放入有界队列后立即返回，由后台线程
+批量写入：
+- 一批最多 MESSAGE_WRITE_BATCH_SIZE 条，最早的消息等待不超过 MESSAGE_WRITE_INTERVAL_MS
+  毫秒；同一批的消息一次插入，涉及的对话的 updated_at 在同一个事务中更新；
+- 队列已满（超过 MESSAGE_WRITE_QUEUE_SIZE）时由调用方直接写入，不丢消息；
+- 进程退出时写完队列中剩余的消息；
+- 继续对话前等待该对话尚未写入的回答（wait）：本进程入队的消息按计数等待；
+  其他工作进程入队的消息在本进程不可见，改为查询数据库，对话最新的消息是还没有
+  回答的用户消息时轮询到回答写入。等待最多 MESSAGE_WRITE_WAIT_MS 毫秒（上一条
+  回答仍在生成、写入失败或没有任何输出时），超时后历史窗口中没有这条回答；查看
+  对话只等待本进程的写入队列，不轮询数据库。
+"""
+import time
+import queue
+import atexit
+import threading
+from datetime import datetime
+from dataclasses import dataclass
+
+from sqlalchemy import insert, update, select, bindparam
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.extensions import db
+from app.models import Conversation, Message
+
+_STOP = object()
+
+
+@dataclass
+class PendingMessage:
+    """等待写入的消息"""
+    conversation_id: int
+    role: str
+    content: str
+    # JSON 字符串（RAG 来源）
+    sources: str = None
+    created_at: datetime = None
+
+
+class MessageWriter:
+    """助手消息的后台批量写入"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._atexit_registered = False
+        # 各对话尚未写入的消息数（_pending_cond 保护）
+        self._pending = {}
+        self._pending_cond = threading.Condition()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        绑定 Flask 应用
+
+        Args:
+            app: Flask 应用实例
+        """
+        self.app = app
+        app.extensions['message_writer'] = self
+        config = app.config
+        self.enabled = config.get('MESSAGE_WRITE_BEHIND', True)
+        self.batch_size = max(1, config.get('MESSAGE_WRITE_BATCH_SIZE', 100))
+        self.interval = config.get('MESSAGE_WRITE_INTERVAL_MS', 50) / 1000
+        self._queue = queue.Queue(maxsize=max(1, config.get('MESSAGE_WRITE_QUEUE_SIZE', 10000)))
+        self.wait_timeout = config.get('MESSAGE_WRITE_WAIT_MS', 1000) / 1000
+
+    # ========== 写入 ==========
+
+    def submit(self, message):
+        """
+        放入写入队列（不阻塞）
+
+        Args:
+            message: PendingMessage
+
+        Returns:
+            bool: 是否已入队；未启用或队列已满时返回 False，由调用方调用 write() 直接写入
+        """
+        if not self.enabled or self._queue is None:
+            return False
+        self._start()
+        with self._pending_cond:
+            try:
+                self._queue.put_nowait(message)
+            except queue.Full:
+                self.app.logger.warning("消息写入队列已满，改为直接写入")
+                return False
+            self._pending[message.conversation_id] = self._pending.get(message.conversation_id, 0) + 1
+        return True
+
+    def write(self, messages):
+        """
+        在当前线程中写入一批消息（需要应用上下文）
+
+        Args:
+            messages: PendingMessage 列表
+        """
+        if not messages:
+            return
+        try:
+            self._insert(messages)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            if len(messages) == 1:
+                self.app.logger.error(f"保存助手消息失败: conversation_id={messages[0].conversation_id}, {str(e)}")
+                return
+            # 逐条重试，一条失败（如对话已删除）不影响同批的其他消息
+            self.app.logger.warning(f"批量保存 {len(messages)} 条消息失败，逐条重试: {str(e)}")
+            for message in messages:
+                self.write([message])
+
+    def wait(self, conversation_id, timeout=None, poll=True):
+        """
+        等待该对话尚未写入的回答（需要应用上下文）
+
+        先等待本进程已入队的消息；poll 为 True 时再检查数据库中对话最新的消息：是
+        用户消息时，它的回答可能在其他工作进程的写入队列中，轮询到回答写入或超时。
+
+        Args:
+            conversation_id: 对话 ID（调用方已校验归属）
+            timeout: 最长等待秒数，默认 MESSAGE_WRITE_WAIT_MS
+            poll: 是否轮询数据库等待其他工作进程写入的回答
+
+        Returns:
+            bool: 是否已全部写入（超时返回 False）
+        """
+        deadline = time.monotonic() + (self.wait_timeout if timeout is None else timeout)
+        with self._pending_cond:
+            while self._pending.get(conversation_id):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._pending_cond.wait(remaining)
+        if not self.enabled or not poll:
+            return True
+        while self._latest_role(conversation_id) == 'user':
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(max(self.interval, 0.01), remaining))
+        return True
+
+    @staticmethod
+    def _latest_role(conversation_id):
+        """对话最新一条消息的角色（使用单独的连接读取，看到其他进程的写入，不影响请求的会话）"""
+        stmt = select(Message.role)\
+            .where(Message.conversation_id == conversation_id)\
+            .order_by(Message.created_at.desc(), Message.id.desc())\
+            .limit(1)
+        with db.engine.connect() as conn:
+            return conn.execute(stmt).scalar()
+
+    def _insert(self, messages):
+        now = datetime.utcnow()
+        db.session.execute(insert(Message), [
+            {
+                'conversation_id': message.conversation_id,
+                'role': message.role,
+                'content': message.content,
+                'sources': message.sources,
+                'created_at': message.created_at or now
+            }
+            for message in messages
+        ])
+        # 每个对话只更新一次，取该对话最新消息的时间
+        updated = {}
+        for message in messages:
+            created_at = message.created_at or now
+            updated[message.conversation_id] = max(updated.get(message.conversation_id, created_at), created_at)
+        table = Conversation.__table__
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('conversation_id')).values(updated_at=bindparam('updated_at')),
+            [{'conversation_id': cid, 'updated_at': at} for cid, at in updated.items()]
+        )
+        db.session.commit()
+
+    # ========== 后台线程 ==========
+
+    def _start(self):
+        """在第一次入队时启动写入线程（重复调用无副作用）"""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='message-writer', daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def stop(self, timeout=10):
+        """写完队列中剩余的消息后停止写入线程"""
+        thread = self._thread
+        if thread is None:
+            return
+        # 队列已满时 put 会等待写入线程腾出空间
+        self._queue.put(_STOP)
+        thread.join(timeout=timeout)
+        self._thread = None
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.interval
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+            if stopping:
+                # 停止标记之后仍可能有消息入队（入队与停止并发）
+                batch.extend(self._drain())
+            self._flush(batch)
+
+    def _drain(self):
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return items
+            if item is not _STOP:
+                items.append(item)
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        try:
+            with self.app.app_context():
+                self.write(batch)
+        except Exception as e:  # noqa: BLE001 写入线程不能退出
+            self.app.logger.error(f"后台写入消息失败: {str(e)}")
+        finally:
+            with self._pending_cond:
+                for message in batch:
+                    count = self._pending.get(message.conversation_id, 0) - 1
+                    if count > 0:
+                        self._pending[message.conversation_id] = count
+                    else:
+                        self._pending.pop(message.conversation_id, None)
+                self._pending_cond.notify_all()
+
+
+# 全局写入器，在应用工厂中通过 init_app 绑定
+message_writer = MessageWriter()
@@ -0,0 +1,86 @@
+"""
+知识库命名空间
+
+每个用户有个人知识库（user:<用户 ID>），团队成员共享团队知识库（team:<团队 ID>），
+所有用户都可以检索共享知识库（shared，KB_SOURCE_FOLDER 同步的文件，管理员可上传）。
+每个命名空间有独立的目录项和索引分片，检索只访问调用方可读的分片。
+"""
+from app.models import User, TeamMember
+from app.utils.exceptions import AuthorizationError, ValidationError
+
+SHARED = 'shared'
+
+_USER_PREFIX = 'user:'
+_TEAM_PREFIX = 'team:'
+
+
+def user_namespace(user_id):
+    return f'{_USER_PREFIX}{int(user_id)}'
+
+
+def team_namespace(team_id):
+    return f'{_TEAM_PREFIX}{int(team_id)}'
+
+
+def shard_name(namespace):
+    """命名空间对应的分片目录名（可用作文件名和集合名）"""
+    return namespace.replace(':', '-')
+
+
+def _team_ids(user_id):
+    return [row[0] for row in TeamMember.query.with_entities(TeamMember.team_id).filter_by(user_id=int(user_id))]
+
+
+def readable_namespaces(user_id):
+    """
+    用户可读的命名空间（个人、所在团队、共享）
+
+    Returns:
+        list[str]: 命名空间列表
+    """
+    return [user_namespace(user_id)] + [team_namespace(team_id) for team_id in _team_ids(user_id)] + [SHARED]
+
+
+def can_write(user_id, namespace):
+    """用户能否在命名空间中上传、删除文件"""
+    if namespace == user_namespace(user_id):
+        return True
+    if namespace == SHARED:
+        user = User.query.get(int(user_id))
+        return bool(user and user.is_admin)
+    if namespace.startswith(_TEAM_PREFIX) and namespace[len(_TEAM_PREFIX):].isdigit():
+        return TeamMember.query.filter_by(
+            team_id=int(namespace[len(_TEAM_PREFIX):]), user_id=int(user_id)
+        ).first() is not None
+    return False
+
+
+def resolve_writable(user_id, namespace=None):
+    """
+    校验写入的命名空间，未指定时为个人知识库
+
+    Raises:
+        AuthorizationError: 无权写入
+    """
+    namespace = namespace or user_namespace(user_id)
+    if not can_write(user_id, namespace):
+        raise AuthorizationError(f"无权修改知识库 {namespace}")
+    return namespace
+
+
+def resolve_readable(user_id, namespace=None):
+    """
+    校验读取的命名空间，未指定时为全部可读的命名空间
+
+    Returns:
+        list[str]: 命名空间列表
+
+    Raises:
+        ValidationError: 无权读取或命名空间不存在
+    """
+    namespaces = readable_namespaces(user_id)
+    if not namespace:
+        return namespaces
+    if namespace not in namespaces:
+        raise ValidationError(f"知识库 {namespace} 不存在或无权访问")
+    return [namespace]
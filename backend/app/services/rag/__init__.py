@@ -0,0 +1,94 @@
+"""
+RAG 检索服务
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from app.services.llm import get_llm_backend
+
+from .retriever import retrieve, fuse_rankings, load_chunks, to_sources
+from .answer_cache import SemanticAnswerCache, CachedAnswer
+from .rerank import Reranker, Scorer, LexicalScorer, CrossEncoderScorer, RerankError, create_scorer
+from .tokens import Tokenizer, SimpleTokenizer, TiktokenTokenizer, create_tokenizer
+from .context import ContextPacker, PackedContext, mmr_order, merge_overlap
+from .generation import build_messages
+from .pipeline import RagPipeline, StageRunner
+
+
+def get_answer_cache():
+    """获取当前进程的语义答案缓存（ANSWER_CACHE_ENABLED 关闭时为 None）"""
+    if not current_app.config.get('ANSWER_CACHE_ENABLED', True):
+        return None
+    cache = current_app.extensions.get('answer_cache')
+    if cache is None:
+        cache = SemanticAnswerCache.from_config(current_app.config)
+        current_app.extensions['answer_cache'] = cache
+    return cache
+
+
+def get_reranker():
+    """获取当前应用的重排序阶段（RERANK_ENABLED 关闭时为 None）"""
+    if not current_app.config.get('RERANK_ENABLED', True):
+        return None
+    reranker = current_app.extensions.get('reranker')
+    if reranker is None:
+        reranker = Reranker.from_config(current_app.config)
+        current_app.extensions['reranker'] = reranker
+    return reranker
+
+
+def get_tokenizer():
+    """获取当前进程的 token 计数器（带 LRU 缓存）"""
+    tokenizer = current_app.extensions.get('tokenizer')
+    if tokenizer is None:
+        tokenizer = create_tokenizer(current_app.config)
+        current_app.extensions['tokenizer'] = tokenizer
+    return tokenizer
+
+
+def get_context_packer():
+    """获取当前应用的上下文组装器"""
+    packer = current_app.extensions.get('context_packer')
+    if packer is None:
+        packer = ContextPacker.from_config(current_app.config, get_tokenizer())
+        current_app.extensions['context_packer'] = packer
+    return packer
+
+
+def get_stage_executor():
+    """获取执行 RAG 流水线阶段的线程池（当前进程共享）"""
+    executor = current_app.extensions.get('rag_stage_executor')
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=current_app.config.get('RAG_STAGE_WORKERS', 16),
+            thread_name_prefix='rag-stage'
+        )
+        current_app.extensions['rag_stage_executor'] = executor
+    return executor
+
+
+def create_rag_pipeline(query, namespaces, history=None):
+    """按当前应用配置创建一次 RAG 回答的流水线"""
+    return RagPipeline(
+        current_app._get_current_object(),
+        get_stage_executor(),
+        get_llm_backend(),
+        query,
+        namespaces,
+        reranker=get_reranker(),
+        packer=get_context_packer(),
+        answer_cache=get_answer_cache(),
+        history=history
+    )
+
+
+__all__ = [
+    'retrieve', 'fuse_rankings', 'load_chunks', 'to_sources',
+    'SemanticAnswerCache', 'CachedAnswer', 'get_answer_cache',
+    'Reranker', 'Scorer', 'LexicalScorer', 'CrossEncoderScorer', 'RerankError', 'create_scorer', 'get_reranker',
+    'Tokenizer', 'SimpleTokenizer', 'TiktokenTokenizer', 'create_tokenizer', 'get_tokenizer',
+    'ContextPacker', 'PackedContext', 'mmr_order', 'merge_overlap', 'get_context_packer',
+    'build_messages',
+    'RagPipeline', 'StageRunner', 'get_stage_executor', 'create_rag_pipeline'
+]
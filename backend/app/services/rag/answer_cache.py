@@ -0,0 +1,207 @@
+"""
+语义答案缓存
+
+以问题的查询向量为键缓存 RAG 回答和引用来源：新问题与某条缓存问题的余弦相似度
+达到阈值、检索范围（可读的命名空间）相同且范围内各命名空间的版本号未变化，即直接
+重放缓存的回答，跳过检索和生成。
+- 缓存条目的向量按槽位存放在一个矩阵中，查找是一次矩阵向量乘法；
+- 条目超过 ttl 秒后失效，条目数达到上限时淘汰最久未命中的条目（LRU）；
+- 某个命名空间的版本号变化时只清除检索范围包含该命名空间的条目；多个工作进程
+  各自维护缓存，通过数据库中的版本号判断失效，不需要互相通知。
+"""
+import time
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+# 缓存的回答：回答正文、引用来源、写入时间
+CachedAnswer = namedtuple('CachedAnswer', ['answer', 'sources', 'created_at'])
+
+
+class SemanticAnswerCache:
+    """按查询向量相似度命中的进程内答案缓存"""
+
+    def __init__(self, threshold=0.95, ttl=3600, max_entries=1000):
+        """
+        Args:
+            threshold: 命中所需的最小余弦相似度
+            ttl: 条目有效期（秒），0 表示不过期
+            max_entries: 最多缓存的条目数
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold 必须在 (0, 1] 之间")
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._versions = {}  # 命名空间 -> 已见过的最新版本号
+        self._vectors = None  # (max_entries, dimension) 归一化查询向量
+        self._entries = [None] * self.max_entries
+        self._last_used = np.zeros(self.max_entries, dtype=np.float64)
+        self._scope_ids = np.full(self.max_entries, -1, dtype=np.int64)  # 各槽位的检索范围编号
+        self._scopes = {}  # 检索范围 -> 编号
+        self._size = 0  # 已使用的最大槽位数
+        self._free = []  # 过期、淘汰后空出的槽位
+        self._stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0, 'expired': 0, 'invalidations': 0}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            threshold=config.get('ANSWER_CACHE_THRESHOLD', 0.95),
+            ttl=config.get('ANSWER_CACHE_TTL', 3600),
+            max_entries=config.get('ANSWER_CACHE_MAX_ENTRIES', 1000)
+        )
+
+    def lookup(self, vector, kb_versions, scope=()):
+        """
+        查找相似问题的缓存回答
+
+        Args:
+            vector: 查询向量
+            kb_versions: 检索范围内各命名空间当前的版本号 {命名空间: 版本号}
+            scope: 检索范围（命名空间元组），只命中相同范围的条目
+
+        Returns:
+            CachedAnswer | None
+        """
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            self._check_versions(kb_versions)
+            scope_id = self._scopes.get(tuple(scope))
+            if self._size == 0 or scope_id is None or self._vectors.shape[1] != len(query):
+                self._stats['misses'] += 1
+                return None
+            scores = self._vectors[:self._size] @ query
+            scores[self._scope_ids[:self._size] != scope_id] = -np.inf
+            slot = int(np.argmax(scores))
+            entry = self._entries[slot]
+            if entry is None or scores[slot] < self.threshold:
+                self._stats['misses'] += 1
+                return None
+            if self._expired(entry, now):
+                self._remove(slot)
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._last_used[slot] = now
+            self._stats['hits'] += 1
+            return entry
+
+    def store(self, vector, kb_versions, answer, sources, scope=()):
+        """
+        缓存一条回答
+
+        Args:
+            vector: 查询向量
+            kb_versions: 生成回答时检索范围内各命名空间的版本号
+            scope: 检索范围（命名空间元组）
+            answer: 回答正文
+            sources: 引用来源列表
+        """
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            if not self._check_versions(kb_versions):
+                # 生成期间检索范围内的知识库已变化，回答可能基于旧内容
+                return
+            if self._vectors is None or self._vectors.shape[1] != len(query):
+                self._vectors = np.zeros((self.max_entries, len(query)), dtype=np.float32)
+                self._clear()
+            slot = self._free_slot(now)
+            self._vectors[slot] = query
+            self._scope_ids[slot] = self._scopes.setdefault(tuple(scope), len(self._scopes))
+            self._entries[slot] = CachedAnswer(answer, sources, now)
+            self._last_used[slot] = now
+            self._stats['writes'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        """命中统计与容量"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = sum(entry is not None for entry in self._entries[:self._size])
+            stats['namespaces'] = len(self._versions)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0
+        stats['max_entries'] = self.max_entries
+        stats['threshold'] = self.threshold
+        stats['ttl'] = self.ttl
+        return stats
+
+    # ========== 内部方法（调用方持有 self._lock） ==========
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_versions(self, kb_versions):
+        """
+        命名空间版本号变化（只会增大）时清除检索范围包含该命名空间的条目；
+        落后的版本号不影响已缓存的新版本条目
+
+        Returns:
+            bool: 给定的版本号是否都不落后于已见过的版本号
+        """
+        current = True
+        for namespace, version in kb_versions.items():
+            seen = self._versions.get(namespace)
+            if seen is not None and version < seen:
+                current = False
+                continue
+            if seen is not None and version > seen:
+                self._invalidate(namespace)
+            self._versions[namespace] = version
+        return current
+
+    def _invalidate(self, namespace):
+        """清除检索范围包含该命名空间的条目"""
+        scope_ids = [scope_id for scope, scope_id in self._scopes.items() if namespace in scope]
+        if not scope_ids or not self._size:
+            return
+        slots = np.flatnonzero(np.isin(self._scope_ids[:self._size], scope_ids))
+        for slot in slots:
+            if self._entries[slot] is not None:
+                self._remove(int(slot))
+        if len(slots):
+            self._stats['invalidations'] += 1
+
+    def _clear(self):
+        self._entries = [None] * self.max_entries
+        self._last_used[:] = 0
+        self._scope_ids[:] = -1
+        self._scopes = {}
+        self._size = 0
+        self._free = []
+
+    def _expired(self, entry, now):
+        return self.ttl > 0 and now - entry.created_at > self.ttl
+
+    def _remove(self, slot):
+        self._entries[slot] = None
+        self._vectors[slot] = 0
+        self._last_used[slot] = 0
+        self._scope_ids[slot] = -1
+        self._free.append(slot)
+
+    def _free_slot(self, now):
+        """空闲槽位；已满时先清理过期条目，仍然没有空位则淘汰最久未命中的条目"""
+        if self._free:
+            return self._free.pop()
+        if self._size < self.max_entries:
+            self._size += 1
+            return self._size - 1
+        expired = [slot for slot, entry in enumerate(self._entries) if self._expired(entry, now)]
+        for slot in expired:
+            self._remove(slot)
+        self._stats['expired'] += len(expired)
+        if not expired:
+            self._remove(int(np.argmin(self._last_used)))
+            self._stats['evictions'] += 1
+        return self._free.pop()
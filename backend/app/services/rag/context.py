@@ -0,0 +1,232 @@
+"""
+上下文组装
+
+把检索（及重排序）得到的候选切片组装为提示词中的参考资料：
+1. MMR 选择：候选向量两两相似度一次矩阵乘法算出，每轮用向量化的
+   “相关性 − 与已选切片的最大相似度” 选出下一个切片，去掉近似重复的内容；
+   相关性取上游给出的顺序（检索融合或重排序的结果），不再重新计算；
+2. 合并相邻切片：同一文件中序号相邻的已选切片合并为一段，并去掉切分时
+   相邻切片之间的重叠文本；
+3. 按 token 预算打包：按段的选择顺序依次放入，放不下的段在 token 边界处截断，
+   最终文本的 token 数（按所用 tokenizer 精确计算）不超过预算。
+返回的 sources 与参考资料中的段一一对应，用于前端展示和 Message.sources。
+"""
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# 组装结果：参考资料文本、来源列表、token 数、计时与统计信息
+PackedContext = namedtuple('PackedContext', ['text', 'sources', 'tokens', 'stats'])
+
+# 段之间的分隔符
+_SEPARATOR = '\n\n'
+
+# 检测相邻切片重叠时用于定位的前缀长度（字符）
+_OVERLAP_PROBE = 16
+
+
+def mmr_order(similarity, relevance, lambda_mult=0.5, k=None):
+    """
+    最大边际相关性（MMR）选择顺序
+
+    Args:
+        similarity: (n, n) 候选两两相似度矩阵
+        relevance: (n,) 候选与查询的相关性
+        lambda_mult: 相关性权重，越小越强调多样性
+        k: 选择数量，默认全部
+
+    Returns:
+        list[int]: 按选择顺序排列的候选下标
+    """
+    n = len(relevance)
+    k = n if k is None else min(k, n)
+    if k <= 0:
+        return []
+    relevance = np.asarray(relevance, dtype=np.float32)
+    # 与已选集合的最大相似度，每轮只需和新选中的一行取最大值
+    redundancy = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    order = []
+    for _ in range(k):
+        penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * penalty
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        order.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return order
+
+
+def merge_overlap(left, right, max_overlap=None):
+    """
+    拼接前后相邻的两个切片，去掉 left 结尾与 right 开头重复的部分
+
+    Args:
+        left: 前一个切片
+        right: 后一个切片
+        max_overlap: 检测的最大重叠字符数，默认 right 的长度
+
+    Returns:
+        str: 拼接后的文本
+    """
+    probe = right[:_OVERLAP_PROBE]
+    if probe:
+        limit = len(right) if max_overlap is None else max_overlap
+        start = max(0, len(left) - limit)
+        position = left.find(probe, start)
+        while position != -1:
+            if right.startswith(left[position:]):
+                return left[:position] + right
+            position = left.find(probe, position + 1)
+    separator = '' if left.endswith(('\n', ' ')) or right.startswith(('\n', ' ')) else '\n'
+    return left + separator + right
+
+
+class ContextPacker:
+    """MMR 去重 + 相邻切片合并 + token 预算打包"""
+
+    def __init__(self, tokenizer, max_tokens=2000, max_chunks=5, lambda_mult=0.5, min_truncate_tokens=32):
+        """
+        Args:
+            tokenizer: token 计数器（见 tokens.py）
+            max_tokens: 参考资料的 token 预算
+            max_chunks: 最多选择的切片数
+            lambda_mult: MMR 相关性权重
+            min_truncate_tokens: 剩余预算少于此值时不再截断放入新段
+        """
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.max_chunks = max_chunks
+        self.lambda_mult = lambda_mult
+        self.min_truncate_tokens = min_truncate_tokens
+
+    @classmethod
+    def from_config(cls, config, tokenizer):
+        return cls(
+            tokenizer,
+            max_tokens=config.get('CONTEXT_MAX_TOKENS', 2000),
+            max_chunks=config.get('RAG_TOP_K', 5),
+            lambda_mult=config.get('MMR_LAMBDA', 0.5),
+            min_truncate_tokens=config.get('CONTEXT_MIN_TRUNCATE_TOKENS', 32)
+        )
+
+    def pack(self, chunks, vectors=None, max_tokens=None):
+        """
+        组装参考资料
+
+        Args:
+            chunks: 按相关性降序排列的候选切片（见 retriever.load_chunks）
+            vectors: 与 chunks 对应的向量矩阵，为空时跳过 MMR 按原顺序选择
+            max_tokens: token 预算，默认 max_tokens
+
+        Returns:
+            PackedContext
+        """
+        started = time.monotonic()
+        budget = self.max_tokens if max_tokens is None else max_tokens
+        if vectors is not None and len(chunks) > 1:
+            matrix = np.asarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix = matrix / norms
+            relevance = 1.0 - np.arange(len(chunks), dtype=np.float32) / len(chunks)
+            order = mmr_order(matrix @ matrix.T, relevance, self.lambda_mult, self.max_chunks)
+        else:
+            order = list(range(min(len(chunks), self.max_chunks)))
+        selected = [(rank, chunks[i]) for rank, i in enumerate(order)]
+
+        sections = self._merge_adjacent(selected)
+        text, sources, tokens, truncated = self._fit(sections, budget)
+        stats = {
+            'pack_ms': round((time.monotonic() - started) * 1000, 1),
+            'candidates': len(chunks),
+            'selected': len(selected),
+            'sections': len(sources),
+            'context_tokens': tokens,
+            'truncated': truncated
+        }
+        return PackedContext(text, sources, tokens, stats)
+
+    @staticmethod
+    def _merge_adjacent(selected):
+        """
+        合并同一文件中序号相邻的已选切片
+
+        Returns:
+            list[dict]: 按段内最靠前的选择顺序排列的段
+        """
+        by_file = {}
+        for rank, chunk in selected:
+            by_file.setdefault(chunk['filename'], []).append((rank, chunk))
+
+        sections = []
+        for filename, items in by_file.items():
+            items.sort(key=lambda item: item[1]['seq'])
+            current = None
+            for rank, chunk in items:
+                if current is not None and chunk['seq'] == current['last_seq'] + 1:
+                    current['text'] = merge_overlap(current['text'], chunk['text'])
+                    current['last_seq'] = chunk['seq']
+                    current['rank'] = min(current['rank'], rank)
+                    current['score'] = max(current['score'], chunk['score'])
+                    continue
+                current = {
+                    'filename': filename,
+                    'page': chunk.get('page'),
+                    'first_seq': chunk['seq'],
+                    'last_seq': chunk['seq'],
+                    'text': chunk['text'],
+                    'rank': rank,
+                    'score': chunk['score']
+                }
+                sections.append(current)
+        sections.sort(key=lambda section: section['rank'])
+        return sections
+
+    def _fit(self, sections, budget):
+        """按预算放入各段，返回 (文本, 来源, token 数, 是否截断)"""
+        count = self.tokenizer.count
+        measure = self.tokenizer.count_uncached
+        parts = []
+        sources = []
+        used = 0
+        truncated = False
+        for section in sections:
+            header = f"[{len(parts) + 1}] {section['filename']}\n"
+            prefix = _SEPARATOR if parts else ''
+            remaining = budget - used - measure(prefix + header)
+            if remaining <= 0:
+                break
+            body = section['text']
+            if count(body) > remaining:
+                if remaining < self.min_truncate_tokens:
+                    # 剩余预算太少，留给后面较短的段
+                    continue
+                body = self.tokenizer.truncate(body, remaining)
+                truncated = True
+            part = prefix + header + body
+            # 拼接处的 token 可能与分别计数时不同（如 BPE 合并），以整体计数为准
+            text = ''.join(parts) + part
+            while body and measure(text) > budget:
+                body = self.tokenizer.truncate(body, measure(body) - 1)
+                part = prefix + header + body
+                text = ''.join(parts) + part
+                truncated = True
+            if not body:
+                break
+            parts.append(part)
+            used = measure(text)
+            source = {
+                'filename': section['filename'],
+                'page': section['page'],
+                'chunk': section['first_seq'] + 1,
+                'score': round(section['score'], 4)
+            }
+            if section['last_seq'] != section['first_seq']:
+                source['chunk_end'] = section['last_seq'] + 1
+            sources.append(source)
+            if truncated:
+                break
+        return ''.join(parts), sources, used, truncated
@@ -0,0 +1,32 @@
+"""
+回答生成的提示词
+
+生成本身由大模型后端完成（见 app.services.llm）。
+"""
+
+
+def build_messages(query, context='', history=None, summary=''):
+    """
+    构建对话消息（OpenAI 兼容的 messages 格式）
+
+    Args:
+        query: 用户问题
+        context: 参考资料，为空时直接回答
+        history: 历史窗口内的消息（按时间顺序，见 app.services.history）
+        summary: 历史窗口之前的对话摘要
+
+    Returns:
+        list[dict]: 消息列表
+    """
+    instructions = []
+    if context:
+        instructions.append(
+            '请根据以下参考资料回答用户的问题；参考资料中没有相关内容时，请说明无法从知识库中找到答案。\n\n'
+            f'参考资料：\n{context}'
+        )
+    if summary:
+        instructions.append(f'以下是本次对话较早内容的摘要：\n{summary}')
+    messages = [{'role': 'system', 'content': '\n\n'.join(instructions)}] if instructions else []
+    messages.extend(history or [])
+    messages.append({'role': 'user', 'content': query})
+    return messages
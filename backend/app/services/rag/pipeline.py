@@ -0,0 +1,305 @@
+"""
+分阶段执行的 RAG 流水线
+
+一次 RAG 回答依次经过：查询向量化（embed）→ 检索（retrieve）→ 重排序（rerank）
+→ 上下文组装（pack）→ 生成（generate）。
+- 每个阶段有自己的时间预算，生成之前的阶段还共享一个总预算（RAG_TTFT_BUDGET_MS），
+  保证首个回答片段的等待时间有上限；
+- 阶段在线程池中执行，超过预算时不再等待（未开始的直接取消，已开始的阶段按传入的
+  截止时间自行结束），改用该阶段的降级结果：查询向量化失败时只用关键词检索，
+  检索失败时不带参考资料回答，重排序失败时保持检索顺序，组装时跳过 MMR；
+- 生成阶段由大模型后端流式输出，首个片段和整体生成分别有预算，客户端断开或
+  超时后取消上游请求；
+- 每个阶段结束时产出一个 stage 事件（状态与耗时），由路由转为 SSE 事件。
+"""
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from app.models import KBRevision
+from app.services.embedding import embedding_service
+from app.services.llm import AnswerStream
+from app.utils.aio import iterate_in_thread
+from .generation import build_messages
+from .retriever import retrieve
+
+# 阶段状态
+STAGE_OK = 'ok'
+STAGE_TIMEOUT = 'timeout'
+STAGE_ERROR = 'error'
+STAGE_SKIPPED = 'skipped'
+
+
+class StageRunner:
+    """按预算执行流水线阶段"""
+
+    def __init__(self, app, executor, deadline, grace=0.05):
+        """
+        Args:
+            app: Flask 应用（阶段在线程池中执行，需要推入应用上下文）
+            executor: 执行阶段的线程池
+            deadline: 生成前各阶段的总截止时间（time.monotonic() 时刻）
+            grace: 阶段到达截止时间后额外等待的秒数（阶段按截止时间自行结束时的收尾时间）
+        """
+        self.app = app
+        self.executor = executor
+        self.deadline = deadline
+        self.grace = grace
+
+    def run(self, name, func, budget, fallback):
+        """
+        执行一个阶段
+
+        Args:
+            name: 阶段名称
+            func: func(deadline) -> 结果，deadline 为本阶段截止时间，阶段内的
+                外部调用应以此为超时
+            budget: 本阶段预算（秒），不超过剩余的总预算
+            fallback: fallback(error) -> 降级结果，超时时 error 为 None
+
+        Returns:
+            tuple: (结果, stage 事件 dict)
+        """
+        started = time.monotonic()
+        remaining = min(budget, self.deadline - started)
+        error = None
+        if remaining <= 0:
+            status = STAGE_SKIPPED
+            result = fallback(None)
+        else:
+            future = self.executor.submit(self._call, func, started + remaining)
+            try:
+                result = future.result(timeout=remaining + self.grace)
+                status = STAGE_OK
+            except FutureTimeoutError:
+                future.cancel()
+                status = STAGE_TIMEOUT
+                result = fallback(None)
+            except Exception as e:  # noqa: BLE001 阶段失败时降级，不中断回答
+                status = STAGE_ERROR
+                error = str(e)
+                result = fallback(e)
+        event = {
+            'type': 'stage',
+            'stage': name,
+            'status': status,
+            'elapsed_ms': round((time.monotonic() - started) * 1000, 1),
+            'budget_ms': round(max(remaining, 0) * 1000)
+        }
+        if error is not None:
+            event['error'] = error
+        return result, event
+
+    def _call(self, func, deadline):
+        with self.app.app_context():
+            return func(deadline)
+
+
+class RagPipeline:
+    """一次 RAG 回答的流水线"""
+
+    def __init__(self, app, executor, llm_backend, query, namespaces, reranker=None, packer=None,
+                 answer_cache=None, history=None):
+        """
+        Args:
+            app: Flask 应用
+            executor: 执行阶段的线程池
+            llm_backend: 大模型后端（见 app.services.llm）
+            query: 用户问题
+            namespaces: 检索的命名空间列表
+            reranker: 重排序阶段，为空时跳过
+            packer: 上下文组装器
+            answer_cache: 语义答案缓存，为空时不使用
+            history: 对话历史（见 app.services.history.History），为空时不带历史
+        """
+        self.app = app
+        self.config = app.config
+        self.executor = executor
+        self.llm_backend = llm_backend
+        self.query = query
+        self.namespaces = namespaces
+        self.reranker = reranker
+        self.packer = packer
+        self.answer_cache = answer_cache
+        self.history = history
+        # 运行结果：回答正文、引用来源、各阶段耗时
+        self.answer = ''
+        self.sources = []
+        self.timing = {}
+        # prepare() 的结果：生成用的消息（命中答案缓存时为 None）与写入答案缓存所需的信息
+        self.messages = None
+        self._cache_entry = None
+
+    def _budget(self, key, default_ms):
+        return self.config.get(key, default_ms) / 1000
+
+    def events(self):
+        """
+        执行流水线（同步）
+
+        Yields:
+            dict: stage / searching_end / content 事件
+        """
+        yield from self.prepare()
+        if self.messages is None:
+            return
+        stream = self._answer_stream()
+        for event in stream.events():
+            yield self._on_generate(event)
+        self._store(stream.ok)
+
+    async def aevents(self, executor=None):
+        """
+        执行流水线（异步）：生成之前的阶段在 executor 的线程中执行（受总预算限制），
+        生成在事件循环上进行，不占用线程
+
+        Yields:
+            dict: stage / searching_end / content 事件
+        """
+        async for event in iterate_in_thread(executor, self.prepare, self.app):
+            yield event
+        if self.messages is None:
+            return
+        stream = self._answer_stream()
+        async for event in stream.aevents(executor):
+            yield self._on_generate(event)
+        self._store(stream.ok)
+
+    def prepare(self):
+        """
+        生成之前的阶段：查询向量化、答案缓存、检索、重排序、上下文组装，结束时设置
+        self.messages；命中答案缓存时直接重放回答，self.messages 保持为 None
+
+        Yields:
+            dict: stage / searching_end 事件（命中缓存时还有 content 事件）
+        """
+        started = time.monotonic()
+        runner = StageRunner(
+            self.app, self.executor,
+            deadline=started + self._budget('RAG_TTFT_BUDGET_MS', 5000),
+            grace=self._budget('RAG_STAGE_GRACE_MS', 50)
+        )
+        scope = tuple(self.namespaces)
+        history = self.history
+        # 带对话历史的问题（如追问）的回答依赖上文，不查询也不写入答案缓存
+        answer_cache = None if history and (history.messages or history.summary) else self.answer_cache
+
+        # --- 查询向量化（失败时只用关键词检索，不使用答案缓存） ---
+        kb_versions = KBRevision.current(self.namespaces) if answer_cache is not None else None
+        vector, event = runner.run(
+            'embed',
+            lambda deadline: embedding_service.embed_query(self.query, timeout=deadline - time.monotonic()),
+            self._budget('RAG_EMBED_BUDGET_MS', 2000),
+            lambda error: None
+        )
+        yield self._record(event)
+
+        if vector is not None and answer_cache is not None:
+            cached = answer_cache.lookup(vector, kb_versions, scope)
+            if cached is not None:
+                yield from self._replay(cached)
+                return
+
+        # --- 检索（失败时不带参考资料回答） ---
+        top_k = self.config.get('RAG_TOP_K', 5)
+        candidates = max(top_k, self.config.get('RERANK_CANDIDATES', 20)) if self.reranker else top_k
+        chunks, event = runner.run(
+            'retrieve',
+            lambda deadline: retrieve(
+                self.query, self.namespaces, top_k=candidates,
+                timeout=max(deadline - time.monotonic(), 0.001),
+                vector=vector, vector_search=vector is not None
+            ),
+            self._budget('RAG_RETRIEVE_BUDGET_MS', 2000),
+            lambda error: None
+        )
+        retrieved = chunks is not None
+        chunks = chunks or []
+        event['candidates'] = len(chunks)
+        yield self._record(event)
+
+        # --- 重排序（失败或超时时保持检索顺序） ---
+        if self.reranker is not None and chunks:
+            retrieved_chunks = list(chunks)
+            (chunks, rerank_stats), event = runner.run(
+                'rerank',
+                lambda deadline: self.reranker.rerank(self.query, retrieved_chunks, deadline=deadline),
+                self.reranker.budget_ms / 1000,
+                lambda error: (retrieved_chunks, {})
+            )
+            event.update(rerank_stats)
+            yield self._record(event)
+
+        # --- 上下文组装（候选向量用于 MMR 去重，超时时按候选顺序组装） ---
+        context = ''
+        if chunks:
+            packed, event = runner.run(
+                'pack',
+                lambda deadline: self._pack(chunks, deadline),
+                self._budget('RAG_PACK_BUDGET_MS', 1000),
+                lambda error: self.packer.pack(chunks, None)
+            )
+            context = packed.text
+            self.sources = packed.sources
+            event.update(packed.stats)
+            yield self._record(event)
+
+        yield {'type': 'searching_end', 'sources': self.sources, 'timing': dict(self.timing)}
+
+        self.messages = build_messages(
+            self.query, context,
+            history=history.messages if history else None,
+            summary=history.summary if history else ''
+        )
+        # 只缓存检索成功的回答（完整生成后由 _store 写入）
+        if retrieved and vector is not None and answer_cache is not None:
+            self._cache_entry = (vector, kb_versions, scope)
+
+    def _record(self, event):
+        self.timing[f"{event['stage']}_ms"] = event['elapsed_ms']
+        if event['status'] != STAGE_OK:
+            self.timing[f"{event['stage']}_status"] = event['status']
+            detail = f": {event['error']}" if 'error' in event else ''
+            self.app.logger.warning(f"RAG 阶段 {event['stage']} {event['status']}，已降级{detail}")
+        return event
+
+    def _pack(self, chunks, deadline):
+        """组装参考资料：候选向量化失败或超时时跳过 MMR"""
+        try:
+            vectors = embedding_service.embed(
+                [chunk['text'] for chunk in chunks],
+                priority=True,
+                timeout=max(deadline - time.monotonic(), 0.001)
+            )
+        except Exception as e:  # noqa: BLE001
+            self.app.logger.warning(f"候选切片向量化失败，跳过 MMR 去重: {str(e)}")
+            vectors = None
+        return self.packer.pack(chunks, vectors)
+
+    def _replay(self, cached):
+        """重放缓存的回答（一次输出，打字机效果由前端完成）"""
+        self.answer = cached.answer
+        self.sources = cached.sources
+        yield {'type': 'searching_end', 'sources': self.sources, 'cached': True}
+        yield {'type': 'content', 'content': self.answer}
+
+    def _answer_stream(self):
+        """生成阶段：由大模型后端流式生成（见 app.services.llm.AnswerStream）"""
+        return AnswerStream(
+            self.app, self.llm_backend, self.messages,
+            first_token_budget=self._budget('LLM_FIRST_TOKEN_BUDGET_MS', 10000),
+            total_budget=self._budget('LLM_GENERATE_BUDGET_MS', 120000),
+            flush_bytes=self.config.get('SSE_FLUSH_BYTES', 512),
+            flush_interval=self._budget('SSE_FLUSH_INTERVAL_MS', 50)
+        )
+
+    def _on_generate(self, event):
+        if event['type'] == 'stage':
+            return self._record(event)
+        self.answer += event['content']
+        return event
+
+    def _store(self, generated):
+        """缓存完整生成的回答（客户端中途断开时不会执行到这里）"""
+        if generated and self._cache_entry is not None:
+            vector, kb_versions, scope = self._cache_entry
+            self.answer_cache.store(vector, kb_versions, self.answer, self.sources, scope)
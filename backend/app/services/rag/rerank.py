@@ -0,0 +1,192 @@
+"""
+检索结果重排序
+
+在检索和构建提示词之间，用更精细的打分器对候选切片重新排序：
+- 打分器可替换：交叉编码器（调用 /rerank 接口）或基于词项重叠的本地打分器
+  （无需模型，用于离线开发和测试）；
+- 候选按批打分，每批开始前检查剩余预算：按已完成批次的耗时估计下一批会超过
+  截止时间时停止，单次接口调用的超时也不超过剩余预算；已打分的部分按重排序
+  得分排列，未打分的尾部保持检索顺序。候选再多，这一阶段的耗时也受预算约束。
+"""
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.services.keyword import tokenize, tokenize_query
+
+
+class RerankError(Exception):
+    """重排序打分失败"""
+
+
+class Scorer:
+    """重排序打分器基类"""
+
+    name = 'base'
+
+    def score(self, query, texts, timeout=None):
+        """
+        计算查询与每段文本的相关性得分
+
+        Args:
+            query: 查询
+            texts: 候选文本列表
+            timeout: 本次调用的最长耗时（秒），超时抛出 RerankError
+
+        Returns:
+            list[float]: 与 texts 对应的得分（越大越相关）
+        """
+        raise NotImplementedError
+
+
+class LexicalScorer(Scorer):
+    """
+    词项重叠打分
+
+    得分为查询词项在文本中出现的比例，按词项在查询中的长度加权（编号、二元组
+    比单字更能说明相关性）。
+    """
+
+    name = 'lexical'
+
+    def score(self, query, texts, timeout=None):
+        terms = tokenize_query(query)
+        if not terms:
+            return [0.0] * len(texts)
+        weights = {term: len(term) for term in terms}
+        total = sum(weights.values())
+        scores = []
+        for text in texts:
+            present = set(tokenize(text))
+            scores.append(sum(w for term, w in weights.items() if term in present) / total)
+        return scores
+
+
+class CrossEncoderScorer(Scorer):
+    """
+    交叉编码器打分：调用 Cohere / Jina 兼容的 /rerank 接口
+
+    （bge-reranker 等模型可通过 text-embeddings-inference、vLLM、Xinference 部署）
+    """
+
+    name = 'cross-encoder'
+
+    def __init__(self, api_base, model, api_key='', timeout=10, pool_size=8):
+        self.url = api_base.rstrip('/') + '/rerank'
+        self.model = model
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if api_key:
+            self.session.headers['Authorization'] = f'Bearer {api_key}'
+
+    def score(self, query, texts, timeout=None):
+        try:
+            response = self.session.post(
+                self.url,
+                json={'model': self.model, 'query': query, 'documents': list(texts)},
+                timeout=min(self.timeout, timeout) if timeout is not None else self.timeout
+            )
+            response.raise_for_status()
+            results = response.json()['results']
+            scores = [0.0] * len(texts)
+            for item in results:
+                scores[item['index']] = float(item['relevance_score'])
+        except (requests.RequestException, KeyError, IndexError, TypeError, ValueError) as e:
+            raise RerankError(f"调用重排序接口失败: {str(e)}") from e
+        return scores
+
+
+def create_scorer(config):
+    """根据 RERANK_SCORER 创建打分器"""
+    name = config.get('RERANK_SCORER', 'lexical')
+    if name == LexicalScorer.name:
+        return LexicalScorer()
+    if name == CrossEncoderScorer.name:
+        return CrossEncoderScorer(
+            api_base=config['RERANK_API_BASE'],
+            model=config['RERANK_MODEL'],
+            api_key=config.get('RERANK_API_KEY', ''),
+            timeout=config.get('RERANK_TIMEOUT', 10)
+        )
+    raise ValueError(f"未知的重排序打分器: {name}")
+
+
+class Reranker:
+    """按批打分、受截止时间约束的重排序阶段"""
+
+    def __init__(self, scorer, batch_size=8, budget_ms=300):
+        """
+        Args:
+            scorer: 打分器
+            batch_size: 每批打分的候选数
+            budget_ms: 默认的单次重排序预算（毫秒）
+        """
+        self.scorer = scorer
+        self.batch_size = max(1, batch_size)
+        self.budget_ms = budget_ms
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            create_scorer(config),
+            batch_size=config.get('RERANK_BATCH_SIZE', 8),
+            budget_ms=config.get('RERANK_BUDGET_MS', 300)
+        )
+
+    def rerank(self, query, chunks, top_k=None, deadline=None):
+        """
+        重排序候选切片
+
+        Args:
+            query: 查询
+            chunks: 按检索顺序排列的切片（见 retriever.load_chunks）
+            top_k: 返回数量，为空时返回全部
+            deadline: 截止时间（time.monotonic() 时刻），默认从现在起 budget_ms
+
+        Returns:
+            tuple: (重排序后的切片, 计时信息 dict)
+        """
+        started = time.monotonic()
+        if deadline is None:
+            deadline = started + self.budget_ms / 1000
+        scores = []
+        batch_seconds = 0.0
+        error = None
+        while len(scores) < len(chunks):
+            now = time.monotonic()
+            # 按最慢一批的耗时估计，下一批会超过截止时间时停止
+            if now + batch_seconds > deadline:
+                break
+            batch = chunks[len(scores):len(scores) + self.batch_size]
+            try:
+                scores.extend(self.scorer.score(query, [chunk['text'] for chunk in batch], timeout=deadline - now))
+            except RerankError as e:
+                error = str(e)
+                break
+            batch_seconds = max(batch_seconds, time.monotonic() - now)
+
+        scored = len(scores)
+        head = []
+        for chunk, score in zip(chunks, scores):
+            chunk['rerank_score'] = score
+            head.append(chunk)
+        # 分数相同时保持检索顺序
+        head.sort(key=lambda chunk: chunk['rerank_score'], reverse=True)
+        ranked = head + list(chunks[scored:])
+        if top_k is not None:
+            ranked = ranked[:top_k]
+
+        timing = {
+            'scorer': self.scorer.name,
+            'rerank_ms': round((time.monotonic() - started) * 1000, 1),
+            'candidates': len(chunks),
+            'scored': scored,
+            'deadline_exceeded': scored < len(chunks) and error is None
+        }
+        if error is not None:
+            timing['error'] = error
+        return ranked, timing
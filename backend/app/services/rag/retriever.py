@@ -0,0 +1,167 @@
+"""
+检索：向量检索与 BM25 关键词检索各自召回候选，按倒数排名融合（RRF）后
+补全切片正文与来源文件
+
+向量检索擅长语义相近的表述，关键词检索擅长编号、型号、专有名词等精确匹配；
+RRF 只使用排名，不需要把两种得分归一化到同一尺度。
+每个命名空间的索引是独立的分片，检索只访问调用方可读的分片：向量检索的余弦
+相似度在各分片间可比，按得分合并；BM25 得分依赖各分片自己的语料统计（文档数、
+平均长度、词频），不同分片的得分不可比，按各分片内的排名融合。
+"""
+from flask import current_app
+
+from app.extensions import db
+from app.models import KBChunk, KBChunkText, KBDocument
+from app.services.embedding import embedding_service
+from app.services.ingestion.chunks import IN_CLAUSE_BATCH
+from app.services.keyword import get_keyword_index, get_keyword_index_shards
+from app.services.vectorstore import get_vector_store
+
+
+def retrieve(query, namespaces, top_k=None, timeout=None, vector=None, vector_search=True):
+    """
+    检索与查询最相关的切片
+
+    Args:
+        query: 用户问题
+        namespaces: 检索的命名空间列表
+        top_k: 返回数量，默认 RAG_TOP_K
+        timeout: 查询向量化的最长等待秒数，默认 RAG_QUERY_TIMEOUT
+        vector: 已计算的查询向量（为空时在此计算）
+        vector_search: 是否进行向量检索（查询向量化失败时只用关键词检索）
+
+    Returns:
+        list[dict]: 按融合得分降序排列的切片，见 load_chunks；另含
+            vector_score / bm25_score（未被对应方式召回时为 None）
+    """
+    config = current_app.config
+    top_k = top_k or config.get('RAG_TOP_K', 5)
+    timeout = timeout or config.get('RAG_QUERY_TIMEOUT', 10)
+    candidates = max(top_k, config.get('RAG_CANDIDATES', 20))
+    keyword_enabled = get_keyword_index_shards() is not None
+
+    vector_hits = []
+    if vector_search:
+        try:
+            if vector is None:
+                vector = embedding_service.embed_query(query, timeout=timeout)
+            vector_hits = merge_hits(
+                [get_vector_store(namespace).search(vector, candidates) for namespace in namespaces], candidates
+            )
+        except Exception as e:
+            if not keyword_enabled:
+                raise
+            current_app.logger.warning(f"向量检索失败，仅使用关键词检索: {str(e)}")
+    keyword_hits = []
+    keyword_scores = {}
+    if keyword_enabled:
+        keyword_rankings = [get_keyword_index(namespace).search(query, candidates) for namespace in namespaces]
+        keyword_hits = fuse_rankings(keyword_rankings, config.get('RAG_RRF_K', 60))[:candidates]
+        keyword_scores = dict(merge_hits(keyword_rankings, candidates))
+
+    hits = fuse_rankings([vector_hits, keyword_hits], config.get('RAG_RRF_K', 60))
+    # 融合后多取一些，load_chunks 可能跳过目录中已不存在的切片
+    chunks = load_chunks(hits, namespaces)[:top_k]
+    vector_scores = dict(vector_hits)
+    for chunk in chunks:
+        chunk['vector_score'] = vector_scores.get(chunk['chunk_hash'])
+        chunk['bm25_score'] = keyword_scores.get(chunk['chunk_hash'])
+    return chunks
+
+
+def merge_hits(rankings, limit):
+    """
+    合并各分片的检索结果（同一切片可能在多个分片中，取最高得分）
+
+    只用于得分在分片间可比的结果（向量检索的余弦相似度）；BM25 得分按分片内
+    排名融合（fuse_rankings）。
+
+    Returns:
+        list[tuple]: 按得分降序排列的前 limit 个 (chunk_hash, score)
+    """
+    best = {}
+    for ranking in rankings:
+        for chunk_hash, score in ranking:
+            if score > best.get(chunk_hash, float('-inf')):
+                best[chunk_hash] = score
+    return sorted(best.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def fuse_rankings(rankings, rrf_k=60):
+    """
+    倒数排名融合
+
+    Args:
+        rankings: 多个按得分降序排列的 [(chunk_hash, score), ...]
+        rrf_k: 平滑常数，越大排名靠后的结果权重越接近靠前的结果
+
+    Returns:
+        list[tuple]: 按融合得分降序排列的 (chunk_hash, 融合得分)
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, (chunk_hash, _) in enumerate(ranking, start=1):
+            fused[chunk_hash] = fused.get(chunk_hash, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def load_chunks(hits, namespaces):
+    """
+    补全检索结果的正文和来源
+
+    同一切片可能出现在多个文件中，取给定命名空间中文件名排序最靠前的一个。
+    向量库中存在但已不在目录中的切片（入库或删除尚未提交）会被跳过。
+
+    Args:
+        hits: [(chunk_hash, score), ...]
+        namespaces: 来源文件所在的命名空间列表
+
+    Returns:
+        list[dict]: [{'chunk_hash', 'score', 'text', 'filename', 'seq'}, ...]
+    """
+    hashes = list(dict.fromkeys(h for h, _ in hits))
+    texts = {}
+    locations = {}
+    for i in range(0, len(hashes), IN_CLAUSE_BATCH):
+        batch = hashes[i:i + IN_CLAUSE_BATCH]
+        texts.update(
+            db.session.query(KBChunkText.chunk_hash, KBChunkText.text)
+            .filter(KBChunkText.chunk_hash.in_(batch))
+        )
+        rows = db.session.query(KBChunk.chunk_hash, KBChunk.seq, KBDocument.filename)\
+            .join(KBDocument, KBDocument.blob_sha256 == KBChunk.blob_sha256)\
+            .filter(KBChunk.chunk_hash.in_(batch), KBDocument.namespace.in_(namespaces))\
+            .order_by(KBDocument.filename, KBChunk.seq)
+        for chunk_hash, seq, filename in rows:
+            locations.setdefault(chunk_hash, (filename, seq))
+
+    chunks = []
+    for chunk_hash, score in hits:
+        if chunk_hash not in texts or chunk_hash not in locations:
+            continue
+        filename, seq = locations[chunk_hash]
+        chunks.append({
+            'chunk_hash': chunk_hash,
+            'score': score,
+            'text': texts[chunk_hash],
+            'filename': filename,
+            'seq': seq
+        })
+    return chunks
+
+
+def to_sources(chunks):
+    """
+    转换为前端展示和 Message.sources 保存的来源列表
+
+    纯文本没有页码，page 为 None；chunk 为切片在文件中的序号（从 1 开始）。
+    """
+    return [
+        {
+            'filename': chunk['filename'],
+            'page': chunk.get('page'),
+            'chunk': chunk['seq'] + 1,
+            'score': round(chunk['score'], 4)
+        }
+        for chunk in chunks
+    ]
@@ -0,0 +1,103 @@
+"""
+提示词 token 计数
+
+构建上下文、截断历史消息时需要反复计算同一段文本的 token 数：
+- simple：与切分器相同的规则（CJK 每字一个 token，英文按单词），无需依赖；
+- tiktoken:<编码名>：使用 tiktoken 的 BPE 编码（需要安装 tiktoken），与
+  OpenAI 兼容模型的计费口径一致。
+计数结果按文本缓存（LRU），同一切片在不同请求中只编码一次。
+"""
+import re
+from functools import lru_cache
+
+from app.services.ingestion.splitter import TOKEN_PATTERN
+
+_TOKEN_RE = re.compile(TOKEN_PATTERN)
+
+
+class Tokenizer:
+    """带缓存的 token 计数与截断"""
+
+    name = 'base'
+
+    def __init__(self, cache_size=4096):
+        # 切片、历史消息等会重复出现的文本用 count；一次性拼接的文本用 count_uncached，避免挤占缓存
+        self.count = lru_cache(maxsize=cache_size)(self.count_uncached)
+
+    def count_uncached(self, text):
+        """计算 token 数（不经过缓存）"""
+        raise NotImplementedError
+
+    def truncate(self, text, max_tokens):
+        """
+        截断到不超过 max_tokens 个 token（在 token 边界处截断）
+
+        Returns:
+            str: 截断后的文本
+        """
+        raise NotImplementedError
+
+    def cache_info(self):
+        return self.count.cache_info()._asdict()
+
+
+class SimpleTokenizer(Tokenizer):
+    """与切分器 count_tokens 相同的规则"""
+
+    name = 'simple'
+
+    def count_uncached(self, text):
+        return len(_TOKEN_RE.findall(text))
+
+    def truncate(self, text, max_tokens):
+        if max_tokens <= 0:
+            return ''
+        end = None
+        for i, match in enumerate(_TOKEN_RE.finditer(text)):
+            if i == max_tokens:
+                break
+            end = match.end()
+        else:
+            return text
+        return text[:end] if end is not None else ''
+
+
+class TiktokenTokenizer(Tokenizer):
+    """tiktoken BPE 编码"""
+
+    def __init__(self, encoding, cache_size=4096):
+        try:
+            import tiktoken
+        except ImportError as e:
+            raise RuntimeError("使用 tiktoken 计数需要安装 tiktoken") from e
+        super().__init__(cache_size)
+        self._encoding = tiktoken.get_encoding(encoding)
+        self.name = f'tiktoken:{encoding}'
+
+    def count_uncached(self, text):
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text, max_tokens):
+        if max_tokens <= 0:
+            return ''
+        tokens = self._encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        # 截断处可能落在多字节字符中间，逐个回退直到解码结果的 token 数不超过上限
+        while max_tokens > 0:
+            truncated = self._encoding.decode(tokens[:max_tokens]).rstrip('�')
+            if self.count_uncached(truncated) <= max_tokens:
+                return truncated
+            max_tokens -= 1
+        return ''
+
+
+def create_tokenizer(config):
+    """根据 CONTEXT_TOKENIZER 创建 token 计数器"""
+    name = config.get('CONTEXT_TOKENIZER', 'simple')
+    cache_size = config.get('TOKENIZER_CACHE_SIZE', 4096)
+    if name == SimpleTokenizer.name:
+        return SimpleTokenizer(cache_size)
+    if name.startswith('tiktoken:'):
+        return TiktokenTokenizer(name.split(':', 1)[1], cache_size)
+    raise ValueError(f"未知的 token 计数器: {name}")
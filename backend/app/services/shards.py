@@ -0,0 +1,74 @@
+"""
+按命名空间懒加载的索引分片
+
+每个命名空间的向量库和关键词索引是独立的分片（各自的目录）。分片在第一次被
+访问时打开，空闲超过 idle_seconds 或打开的分片数超过 max_open 时（按最久未访问）
+从注册表中移除，内存映射在没有请求引用后随对象释放。被移除的分片再次访问时
+重新打开；分片的读写都通过文件锁和 meta 文件同步，同一分片同时存在多个实例
+（如移除时仍有请求在使用）也是安全的。
+"""
+import time
+import threading
+from collections import OrderedDict
+
+
+class ShardRegistry:
+    """按键懒加载、空闲淘汰的分片注册表"""
+
+    def __init__(self, factory, idle_seconds=600, max_open=64):
+        """
+        Args:
+            factory: 根据命名空间创建分片的函数
+            idle_seconds: 分片空闲多久后移除，0 表示不按空闲时间移除
+            max_open: 最多同时打开的分片数
+        """
+        self.factory = factory
+        self.idle_seconds = idle_seconds
+        self.max_open = max(1, max_open)
+        self._lock = threading.Lock()
+        self._open = OrderedDict()  # 命名空间 -> [分片, 最近访问时间]，按访问顺序排列
+        self._stats = {'loads': 0, 'evictions': 0}
+
+    def get(self, namespace):
+        """获取分片，未打开时打开"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._open.get(namespace)
+            if entry is None:
+                entry = [self.factory(namespace), now]
+                self._open[namespace] = entry
+                self._stats['loads'] += 1
+            else:
+                entry[1] = now
+                self._open.move_to_end(namespace)
+            self._evict(now)
+            return entry[0]
+
+    def peek(self, namespace):
+        """已打开的分片（不打开、不更新访问时间），未打开时为 None"""
+        with self._lock:
+            entry = self._open.get(namespace)
+            return entry[0] if entry is not None else None
+
+    def evict_idle(self):
+        """移除空闲分片（访问时也会顺带检查）"""
+        with self._lock:
+            self._evict(time.monotonic())
+
+    def _evict(self, now):
+        # 最久未访问的在最前面，最近访问的分片永远不会在本次被移除
+        while len(self._open) > 1:
+            namespace, (_, last_used) = next(iter(self._open.items()))
+            idle = self.idle_seconds and now - last_used > self.idle_seconds
+            if not idle and len(self._open) <= self.max_open:
+                break
+            del self._open[namespace]
+            self._stats['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open'] = list(self._open)
+        stats['max_open'] = self.max_open
+        stats['idle_seconds'] = self.idle_seconds
+        return stats
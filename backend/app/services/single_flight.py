@@ -0,0 +1,282 @@
+"""
+相同问题的请求合并（single-flight）
+
+同一时间内多个用户提出相同的问题（规范化后的问题、是否使用 RAG、检索范围及其中
+各命名空间的版本号、对话历史都相同）时，只执行一次检索和生成，事件分发给所有订阅者：
+- 每个请求订阅同一次生成（Flight），先补发已产生的事件，再跟随后续事件；
+- 同步模式下生成由订阅者轮流推进（等待事件的线程之一调用 next()），不额外占用线程；
+  异步模式下由每次生成一个的任务推进（异步生成器及其中的 HTTP 连接只在一个任务中
+  使用）；一个订阅者断开不影响其他订阅者；
+- 所有订阅者都离开时取消生成；生成结束后从登记表中移除，之后的相同问题重新生成
+  （或命中语义答案缓存）；
+- 每个请求仍由自己的 ChatStream 输出 conversation_id、保存自己对话中的助手消息。
+合并在工作进程内进行，不同工作进程之间不合并。
+"""
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+import unicodedata
+
+from flask import current_app
+
+
+def normalize_prompt(prompt):
+    """规范化问题：全角半角统一、忽略大小写、合并空白"""
+    return ' '.join(unicodedata.normalize('NFKC', prompt).casefold().split())
+
+
+def flight_key(prompt, use_rag, kb_versions=None, namespaces=(), history=None, asynchronous=False):
+    """
+    请求合并的键
+
+    Args:
+        prompt: 用户问题
+        use_rag: 是否使用 RAG
+        kb_versions: 检索范围内各命名空间的版本号 {命名空间: 版本号}（RAG 模式）
+        namespaces: 检索范围（RAG 模式）
+        history: 对话历史（见 app.services.history.History），历史不同的请求不合并
+        asynchronous: 是否异步服务模式（同步与异步的生成不能互相订阅）
+
+    Returns:
+        str: 键
+    """
+    payload = json.dumps({
+        'prompt': normalize_prompt(prompt),
+        'rag': bool(use_rag),
+        'kb_versions': kb_versions if use_rag else None,
+        'namespaces': sorted(namespaces) if use_rag else [],
+        'history': history.messages if history else [],
+        'summary': history.summary if history else '',
+        'async': bool(asynchronous)
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class Flight:
+    """一次进行中的生成及其已产生的事件"""
+
+    def __init__(self, key, source, registry):
+        """
+        Args:
+            key: 请求合并的键
+            source: 回答事件来源（AnswerStream 或 RagPipeline），提供 events() / aevents(executor)
+            registry: 所属的 SingleFlight（生成结束或取消时从中移除）
+        """
+        self.key = key
+        self.source = source
+        self.registry = registry
+        # 已产生的事件（只追加），生成是否结束，生成时的异常
+        self.events = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        # 同步模式：推进生成的线程标记，等待新事件的订阅者在 _cond 上等待
+        self._cond = threading.Condition()
+        self._driving = False
+        self._iter = None
+        # 异步模式：推进生成的任务，每产生一个事件替换一次的通知
+        self._task = None
+        self._updated = None
+
+    # ========== 同步 ==========
+
+    def wait_event(self, index):
+        """
+        获取第 index 个事件，还没有产生时由当前线程推进生成或等待其他线程
+
+        Returns:
+            dict | None: 事件；生成已结束时为 None（出错时抛出生成的异常）
+        """
+        while True:
+            with self._cond:
+                while index >= len(self.events) and not self.done and self._driving:
+                    self._cond.wait()
+                if index < len(self.events):
+                    return self.events[index]
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return None
+                self._driving = True
+            self._advance()
+
+    def _advance(self):
+        event = error = None
+        finished = False
+        try:
+            if self._iter is None:
+                self._iter = self.source.events()
+            event = next(self._iter)
+        except StopIteration:
+            finished = True
+        except Exception as e:  # noqa: BLE001 分发给所有订阅者
+            error = e
+            finished = True
+        with self._cond:
+            if finished:
+                self._end(error)
+            else:
+                self.events.append(event)
+            self._driving = False
+            self._cond.notify_all()
+
+    # ========== 异步 ==========
+
+    async def await_event(self, index, executor=None):
+        """异步获取第 index 个事件（见 wait_event）；订阅者被取消不影响推进生成的任务"""
+        while True:
+            if index < len(self.events):
+                return self.events[index]
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return None
+            if self._task is None:
+                self._updated = asyncio.Event()
+                self._task = asyncio.ensure_future(self._pump(executor))
+            await self._updated.wait()
+
+    async def _pump(self, executor):
+        error = None
+        try:
+            async for event in self.source.aevents(executor):
+                self.events.append(event)
+                self._notify()
+        except asyncio.CancelledError:
+            # 所有订阅者都已离开
+            raise
+        except Exception as e:  # noqa: BLE001 分发给所有订阅者
+            error = e
+        self._end(error)
+        self._notify()
+
+    def _notify(self):
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    # ========== 订阅 ==========
+
+    def leave(self):
+        """订阅者离开；最后一个订阅者在生成结束前离开时取消生成"""
+        with self.registry._lock:
+            self.subscribers -= 1
+            abandoned = self.subscribers == 0 and not self.done
+            if abandoned:
+                self.registry._discard(self)
+        if not abandoned:
+            return
+        self.done = True
+        if self._iter is not None:
+            # 没有订阅者时没有线程在推进生成，可以直接关闭（执行各层生成器的 finally）
+            self._iter.close()
+        elif self._task is not None:
+            self._task.cancel()
+
+    def _end(self, error):
+        if error is not None:
+            self.registry.logger.error(f"合并的生成出错: {str(error)}")
+        self.error = error
+        self.done = True
+        with self.registry._lock:
+            self.registry._discard(self)
+
+
+class Subscription:
+    """
+    一个请求对合并生成的订阅，接口与回答事件来源相同（events() / aevents(executor)、
+    answer、sources），可直接交给 ChatStream
+    """
+
+    def __init__(self, flight, leader):
+        self.flight = flight
+        # 是否由本请求发起生成
+        self.leader = leader
+        # 本订阅已输出的回答正文与引用来源（客户端中途断开时只保存已输出的部分）
+        self.answer = ''
+        self.sources = []
+
+    def events(self):
+        index = 0
+        try:
+            while True:
+                event = self.flight.wait_event(index)
+                if event is None:
+                    return
+                index += 1
+                yield self._on_event(event)
+        finally:
+            self.flight.leave()
+
+    async def aevents(self, executor=None):
+        index = 0
+        try:
+            while True:
+                event = await self.flight.await_event(index, executor)
+                if event is None:
+                    return
+                index += 1
+                yield self._on_event(event)
+        finally:
+            self.flight.leave()
+
+    def _on_event(self, event):
+        if event['type'] == 'content':
+            self.answer += event['content']
+        elif event['type'] == 'searching_end':
+            self.sources = event.get('sources') or []
+        return event
+
+
+class SingleFlight:
+    """进行中的生成登记表（当前进程）"""
+
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {'flights': 0, 'joined': 0}
+
+    def join(self, key, factory):
+        """
+        订阅 key 对应的进行中的生成，没有时用 factory() 创建回答事件来源并发起生成
+
+        Args:
+            key: 请求合并的键（见 flight_key）
+            factory: 创建回答事件来源的函数（持有锁时调用，不应执行 I/O）
+
+        Returns:
+            Subscription
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Flight(key, factory(), self)
+                self._flights[key] = flight
+                self._stats['flights'] += 1
+            else:
+                self._stats['joined'] += 1
+            flight.subscribers += 1
+        return Subscription(flight, leader)
+
+    def _discard(self, flight):
+        """从登记表中移除（调用方持有 _lock）"""
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._flights))
+
+
+def get_single_flight():
+    """获取当前进程的请求合并登记表（CHAT_COALESCE_ENABLED 关闭时为 None）"""
+    if not current_app.config.get('CHAT_COALESCE_ENABLED', True):
+        return None
+    single_flight = current_app.extensions.get('single_flight')
+    if single_flight is None:
+        single_flight = SingleFlight(current_app.logger)
+        current_app.extensions['single_flight'] = single_flight
+    return single_flight
@@ -0,0 +1,31 @@
+"""
+文件存储服务
+"""
+from flask import current_app
+
+from .blob_store import BlobStore
+from .chunked_upload import ChunkedUploadStore, UploadOffsetError
+
+
+def get_blob_store():
+    """获取当前应用的 Blob 存储"""
+    store = current_app.extensions.get('blob_store')
+    if store is None:
+        store = BlobStore.from_config(current_app.config)
+        current_app.extensions['blob_store'] = store
+    return store
+
+
+def get_chunked_upload_store():
+    """获取当前应用的分片上传存储（按进程懒加载）"""
+    store = current_app.extensions.get('chunked_upload')
+    if store is None:
+        store = ChunkedUploadStore.from_config(current_app.config)
+        current_app.extensions['chunked_upload'] = store
+    return store
+
+
+__all__ = [
+    'BlobStore', 'ChunkedUploadStore', 'UploadOffsetError',
+    'get_blob_store', 'get_chunked_upload_store'
+]
@@ -0,0 +1,94 @@
+"""
+内容寻址的 Blob 存储
+文件按 SHA-256 保存在 <root>/<前两位>/<sha256>，相同内容只保存一份
+"""
+import os
+import uuid
+import shutil
+import hashlib
+
+from app.utils.exceptions import ValidationError
+
+# 流式读取的块大小
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+
+class BlobStore:
+    """内容寻址的 Blob 存储"""
+
+    def __init__(self, root, tmp_folder):
+        self.root = root
+        self.tmp_folder = tmp_folder
+        os.makedirs(root, exist_ok=True)
+        os.makedirs(tmp_folder, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config):
+        """根据应用配置创建"""
+        return cls(config['BLOB_FOLDER'], config['UPLOAD_TMP_FOLDER'])
+
+    def path_for(self, sha256):
+        """Blob 的存储路径"""
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def exists(self, sha256):
+        return os.path.exists(self.path_for(sha256))
+
+    def write_stream(self, stream, max_size):
+        """
+        将流写入临时文件，同时计算 SHA-256
+
+        Args:
+            stream: 可读的二进制流
+            max_size: 最大字节数
+
+        Returns:
+            tuple: (sha256, size, tmp_path)
+
+        Raises:
+            ValidationError: 超过大小限制
+        """
+        tmp_path = os.path.join(self.tmp_folder, f'{uuid.uuid4().hex}.tmp')
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                while True:
+                    block = stream.read(STREAM_BLOCK_SIZE)
+                    if not block:
+                        break
+                    size += len(block)
+                    if size > max_size:
+                        raise ValidationError("超过大小限制")
+                    hasher.update(block)
+                    f.write(block)
+        except BaseException:
+            self.discard(tmp_path)
+            raise
+        return hasher.hexdigest(), size, tmp_path
+
+    def commit(self, tmp_path, sha256):
+        """
+        将临时文件移动到 Blob 路径；内容已存在时丢弃临时文件
+
+        Returns:
+            str: Blob 路径
+        """
+        path = self.path_for(sha256)
+        if os.path.exists(path):
+            self.discard(tmp_path)
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.move(tmp_path, path)
+        return path
+
+    def delete(self, sha256):
+        """删除 Blob 文件"""
+        self.discard(self.path_for(sha256))
+
+    @staticmethod
+    def discard(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,274 @@
+"""
+知识库文件目录操作
+上传时先按内容摘要去重，只有新内容才保存 Blob；同一命名空间中内容已入库时
+不再创建入库任务。目录变化时递增所在命名空间的版本号（KBRevision），目录项的入库状态
+随任务在同一事务中更新。
+删除分片中的向量和 Blob 文件不随事务回滚，在事务提交之后执行；事务回滚时文件和
+向量保持原样，与仍然存在的目录项一致。
+"""
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import KBBlob, KBDocument, KBRevision
+from app.services.ingestion import ingestion_manager, stages
+from app.services.ingestion import chunks as chunk_index
+from app.utils.exceptions import ConflictError, NotFoundError
+
+# session.info 中登记的提交后操作
+_AFTER_COMMIT_KEY = 'kb_after_commit'
+
+
+def add_document(blob_store, user_id, namespace, filename, sha256, size, tmp_path, overwrite=False,
+                 origin=KBDocument.ORIGIN_UPLOAD, mtime_ns=None):
+    """
+    登记上传文件（由调用方提交事务）
+
+    Args:
+        blob_store: Blob 存储
+        user_id: 上传用户 ID
+        namespace: 命名空间（调用方已校验写入权限）
+        filename: 安全文件名
+        sha256: 内容摘要
+        size: 文件大小
+        tmp_path: 已写入内容的临时文件
+        overwrite: 同名文件内容不同时是否覆盖
+        origin: 来源（上传 / 目录同步）
+        mtime_ns: 同步文件的修改时间
+
+    Returns:
+        tuple: (document, job)，内容已在该命名空间入库（或正在入库）时 job 为 None
+
+    Raises:
+        ConflictError: 同名文件已存在且内容不同
+    """
+    file_type = filename.rsplit('.', 1)[-1].lower()
+
+    document = KBDocument.query.filter_by(namespace=namespace, filename=filename).first()
+    if document and document.blob_sha256 == sha256:
+        blob_store.discard(tmp_path)
+        document.source_mtime_ns = mtime_ns
+        return document, None
+    if document and not overwrite:
+        blob_store.discard(tmp_path)
+        raise ConflictError(f"文件 {filename} 已存在且内容不同")
+
+    path = _ensure_blob(blob_store, sha256, size, file_type, tmp_path)
+    # 命名空间中引用同一内容的其他文件，入库状态与之相同
+    sibling = KBDocument.query.filter_by(namespace=namespace, blob_sha256=sha256).first()
+
+    if document:
+        old_sha256 = document.blob_sha256
+        document.blob_sha256 = sha256
+        document.size = size
+        document.file_type = file_type
+        document.origin = origin
+        document.source_mtime_ns = mtime_ns
+        document.uploaded_by = user_id
+        document.updated_at = datetime.utcnow()
+        db.session.flush()
+        release_blob(blob_store, namespace, old_sha256)
+    else:
+        document = KBDocument(
+            namespace=namespace,
+            filename=filename,
+            blob_sha256=sha256,
+            size=size,
+            file_type=file_type,
+            origin=origin,
+            source_mtime_ns=mtime_ns,
+            uploaded_by=user_id
+        )
+        db.session.add(document)
+        db.session.flush()
+
+    job = None
+    if sibling is not None and sibling.status != KBDocument.STATUS_FAILED:
+        # 已入库或正在入库（任务完成时会更新命名空间中引用该内容的全部文件）
+        KBDocument.set_index_state(
+            namespace, sha256, sibling.status,
+            chunk_count=sibling.chunk_count, vector_count=sibling.vector_count
+        )
+    else:
+        # 新内容、其他命名空间已入库的内容或上次入库失败的内容：写入本命名空间的分片
+        KBDocument.set_index_state(namespace, sha256, KBDocument.STATUS_PENDING, chunk_count=0, vector_count=0)
+        job = ingestion_manager.enqueue(
+            filename, path, namespace, user_id=user_id, blob_sha256=sha256, file_type=file_type
+        )
+    KBRevision.bump(namespace)
+    return document, job
+
+
+def commit_document(blob_store, user_id, namespace, filename, sha256, size, tmp_path, **kwargs):
+    """
+    登记上传文件并提交事务（参数见 add_document）
+
+    并发上传相同的新内容、或在同一命名空间上传同名文件时，两个请求都可能通过去重和
+    同名检查，后提交的一方违反 kb_blobs 主键或 (namespace, filename) 唯一约束：回滚后
+    重试一次，此时能看到已提交的 Blob 或目录项，按内容去重或报告同名冲突。
+    任何失败都会删除临时文件。
+
+    Returns:
+        tuple: (document, job)
+
+    Raises:
+        ConflictError: 同名文件已存在且内容不同
+        IntegrityError: 重试后仍违反约束
+    """
+    try:
+        for attempt in range(2):
+            try:
+                result = add_document(blob_store, user_id, namespace, filename, sha256, size, tmp_path, **kwargs)
+                db.session.commit()
+                return result
+            except IntegrityError:
+                db.session.rollback()
+                if attempt:
+                    raise
+    finally:
+        # 成功时临时文件已移入 Blob 存储或被丢弃
+        blob_store.discard(tmp_path)
+
+
+def remove_document(blob_store, namespace, filename_or_document):
+    """
+    删除目录项；命名空间中不再引用的切片从分片删除，Blob 不再被任何命名空间引用时
+    一并删除（由调用方提交事务）
+
+    Raises:
+        NotFoundError: 文件不存在
+    """
+    document = filename_or_document
+    if not isinstance(document, KBDocument):
+        document = KBDocument.query.filter_by(namespace=namespace, filename=filename_or_document).first()
+    if not document:
+        raise NotFoundError("文件不存在")
+    sha256 = document.blob_sha256
+    db.session.delete(document)
+    db.session.flush()
+    release_blob(blob_store, namespace, sha256)
+    KBRevision.bump(namespace)
+
+
+def list_documents(namespaces, status=None, file_type=None, origin=None, prefix=None, query=None,
+                   page=1, per_page=100, after=None):
+    """
+    按文件名顺序分页查询命名空间中的目录
+
+    命名空间、状态、类型筛选和文件名前缀都走 (namespace, status|file_type, filename) /
+    (namespace, filename) 索引；after 为上一页最后一项的 (文件名, 命名空间)（键集分页），
+    目录很大时比按页码偏移更快。
+
+    Args:
+        namespaces: 命名空间列表
+        status: 入库状态
+        file_type: 扩展名
+        origin: 来源（上传 / 目录同步）
+        prefix: 文件名前缀（同步目录中的子目录，如 "docs/"）
+        query: 文件名包含的文本
+        page: 页码（从 1 开始，提供 after 时忽略）
+        per_page: 每页数量
+        after: 上一页最后一项的 (文件名, 命名空间)
+
+    Returns:
+        tuple: (当前页的目录项列表, 符合条件的总数, 是否还有下一页)
+    """
+    filtered = KBDocument.query.filter(KBDocument.namespace.in_(namespaces))
+    if status:
+        filtered = filtered.filter(KBDocument.status == status)
+    if file_type:
+        filtered = filtered.filter(KBDocument.file_type == file_type.lower())
+    if origin:
+        filtered = filtered.filter(KBDocument.origin == origin)
+    if prefix:
+        # 前缀转换为区间条件，可以使用 filename 索引
+        filtered = filtered.filter(KBDocument.filename >= prefix, KBDocument.filename < prefix + '\U0010ffff')
+    if query:
+        escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        filtered = filtered.filter(KBDocument.filename.like(f'%{escaped}%', escape='\\'))
+
+    total = filtered.order_by(None).count()
+    # 不同命名空间可以有同名文件，按 (文件名, 命名空间) 排序
+    page_query = filtered.order_by(KBDocument.filename, KBDocument.namespace)
+    if after is not None:
+        after_filename, after_namespace = after
+        page_query = page_query.filter(db.or_(
+            KBDocument.filename > after_filename,
+            db.and_(KBDocument.filename == after_filename, KBDocument.namespace > after_namespace)
+        ))
+    else:
+        page_query = page_query.offset((page - 1) * per_page)
+    # 多取一条判断是否还有下一页
+    documents = page_query.limit(per_page + 1).all()
+    return documents[:per_page], total, len(documents) > per_page
+
+
+def catalog_totals(namespaces):
+    """
+    命名空间汇总：文件数、向量数（同一命名空间中相同内容的文件共享同一组向量，
+    按内容统计一次）和各入库状态的文件数
+    """
+    in_namespaces = KBDocument.namespace.in_(namespaces)
+    per_blob = db.session.query(KBDocument.namespace, KBDocument.blob_sha256, KBDocument.vector_count)\
+        .filter(in_namespaces).distinct().subquery()
+    file_count, vector_count = db.session.query(
+        db.session.query(db.func.count(KBDocument.id)).filter(in_namespaces).scalar_subquery(),
+        db.session.query(db.func.coalesce(db.func.sum(per_blob.c.vector_count), 0)).scalar_subquery()
+    ).one()
+    status_counts = dict(
+        db.session.query(KBDocument.status, db.func.count(KBDocument.id))
+        .filter(in_namespaces).group_by(KBDocument.status).all()
+    )
+    return {'file_count': file_count, 'vector_count': vector_count, 'status_counts': status_counts}
+
+
+def release_blob(blob_store, namespace, sha256):
+    """
+    命名空间中不再有文件引用 Blob 时，从该命名空间的分片删除不再被引用的切片；
+    任何命名空间都不再引用时删除 Blob、切片清单和不再被引用的切片正文（由调用方
+    提交事务，分片中的向量和 Blob 文件在提交之后删除）
+    """
+    if KBDocument.query.filter_by(namespace=namespace, blob_sha256=sha256).first() is None:
+        hashes = chunk_index.blob_hashes(sha256)
+        unused = hashes - chunk_index.existing_hashes(hashes, namespace)
+        _after_commit(lambda: stages.delete_vectors(namespace, unused))
+    if KBDocument.query.filter_by(blob_sha256=sha256).first():
+        return
+    blob = db.session.get(KBBlob, sha256)
+    if blob:
+        db.session.delete(blob)
+    _after_commit(lambda: blob_store.delete(sha256))
+    removed = chunk_index.release_blob_chunks(sha256)
+    stages.delete_texts(removed - chunk_index.existing_hashes(removed))
+
+
+def _after_commit(action):
+    """登记当前事务提交后执行的操作（事务回滚时丢弃）"""
+    db.session.info.setdefault(_AFTER_COMMIT_KEY, []).append(action)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _run_after_commit(session):
+    for action in session.info.pop(_AFTER_COMMIT_KEY, ()):
+        try:
+            action()
+        except Exception as e:  # noqa: BLE001 目录已提交，清理失败只留下不再被引用的文件或向量
+            current_app.logger.error(f"提交后清理知识库文件失败: {str(e)}")
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_after_commit(session):
+    session.info.pop(_AFTER_COMMIT_KEY, None)
+
+
+def _ensure_blob(blob_store, sha256, size, file_type, tmp_path):
+    """获取或创建 Blob，返回内容文件路径"""
+    blob = db.session.get(KBBlob, sha256)
+    if blob is None:
+        db.session.add(KBBlob(sha256=sha256, size=size, file_type=file_type))
+        return blob_store.commit(tmp_path, sha256)
+    blob_store.discard(tmp_path)
+    return blob_store.path_for(sha256)
@@ -0,0 +1,254 @@
+"""
+可续传的分片上传
+
+协议：init 创建会话 → 按偏移顺序追加分片 → finalize 校验后交给 Blob 存储。
+分片直接从请求流写入磁盘，同时增量计算 SHA-256；中断后客户端查询
+received_size 从该偏移继续发送，已落盘的字节不需要重传。
+"""
+import os
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from werkzeug.exceptions import ClientDisconnected
+
+from app.extensions import db
+from app.models import UploadSession
+from app.utils.exceptions import ValidationError, NotFoundError, ConflictError
+
+# 从请求流读取的块大小
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadOffsetError(ConflictError):
+    """分片偏移与服务端已接收字节数不一致"""
+
+    def __init__(self, expected_offset: int):
+        self.expected_offset = expected_offset
+        super().__init__(f"分片偏移错误，应从 {expected_offset} 继续上传")
+
+
+class ChunkedUploadStore:
+    """分片上传存储"""
+
+    def __init__(self, tmp_folder, max_size, max_part_size, session_ttl_hours=24, hasher_cache_size=256):
+        self.tmp_folder = tmp_folder
+        self.max_size = max_size
+        self.max_part_size = max_part_size
+        self.session_ttl = timedelta(hours=session_ttl_hours)
+        os.makedirs(tmp_folder, exist_ok=True)
+
+        # upload_id -> (offset, sha256 对象)，避免每个分片重新读取已接收的数据
+        self._hashers = OrderedDict()
+        self._hasher_cache_size = hasher_cache_size
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """根据应用配置创建"""
+        return cls(
+            tmp_folder=config['UPLOAD_TMP_FOLDER'],
+            max_size=config.get('MAX_CHUNKED_UPLOAD_SIZE'),
+            max_part_size=config.get('UPLOAD_PART_MAX_SIZE'),
+            session_ttl_hours=config.get('UPLOAD_SESSION_TTL_HOURS', 24)
+        )
+
+    def part_path(self, upload_id):
+        return os.path.join(self.tmp_folder, f'{upload_id}.part')
+
+    # ========== 协议操作 ==========
+
+    def init(self, user_id, namespace, filename, total_size):
+        """
+        创建上传会话
+
+        Args:
+            user_id: 用户 ID
+            namespace: 目标命名空间（调用方已校验写入权限）
+            filename: 安全文件名
+            total_size: 文件总字节数
+
+        Returns:
+            UploadSession: 新建的会话
+        """
+        if total_size <= 0:
+            raise ValidationError("文件大小必须大于 0")
+        if total_size > self.max_size:
+            raise ValidationError(f"文件 {filename} 超过大小限制")
+
+        self.purge_expired()
+
+        session = UploadSession(
+            id=uuid.uuid4().hex,
+            user_id=user_id,
+            namespace=namespace,
+            filename=filename,
+            total_size=total_size
+        )
+        # 预先创建空文件，追加分片时以 r+b 打开
+        open(self.part_path(session.id), 'wb').close()
+        db.session.add(session)
+        db.session.commit()
+        return session
+
+    def get(self, user_id, upload_id):
+        """获取当前用户的上传会话"""
+        session = UploadSession.query.filter_by(id=upload_id, user_id=user_id).first()
+        if not session:
+            raise NotFoundError("上传会话不存在")
+        return session
+
+    def append(self, session, offset, stream, content_length):
+        """
+        从请求流追加一个分片
+
+        Args:
+            session: 上传会话
+            offset: 分片在文件中的起始偏移
+            stream: 请求体流
+            content_length: 分片字节数
+
+        Returns:
+            UploadSession: 更新后的会话
+
+        Raises:
+            UploadOffsetError: 偏移与已接收字节数不一致
+        """
+        if session.status != UploadSession.STATUS_UPLOADING:
+            raise ConflictError("上传已完成")
+        if content_length is None or content_length <= 0:
+            raise ValidationError("分片不能为空")
+        if content_length > self.max_part_size:
+            raise ValidationError("分片超过大小限制")
+
+        with self._session_lock(session.id):
+            db.session.refresh(session)
+            if offset != session.received_size:
+                raise UploadOffsetError(session.received_size)
+            if offset + content_length > session.total_size:
+                raise ValidationError("分片超出文件总大小")
+
+            hasher = self._get_hasher(session.id, offset)
+            written = 0
+            disconnected = False
+            with open(self.part_path(session.id), 'r+b') as f:
+                # 丢弃上次中断时可能残留在偏移之后的字节
+                f.seek(offset)
+                f.truncate()
+                try:
+                    while written < content_length:
+                        block = stream.read(min(STREAM_BLOCK_SIZE, content_length - written))
+                        if not block:
+                            break
+                        f.write(block)
+                        hasher.update(block)
+                        written += len(block)
+                except ClientDisconnected:
+                    disconnected = True
+                f.flush()
+                os.fsync(f.fileno())
+
+            # 即使连接中断，已落盘的字节也计入进度，客户端从新偏移续传
+            session.received_size = offset + written
+            session.updated_at = datetime.utcnow()
+            db.session.commit()
+            self._put_hasher(session.id, session.received_size, hasher)
+
+        if disconnected or written < content_length:
+            raise UploadOffsetError(session.received_size)
+        return session
+
+    def finalize(self, session, expected_sha256=None):
+        """
+        完成上传：校验大小和摘要
+
+        Args:
+            session: 上传会话
+            expected_sha256: 客户端计算的摘要（可选）
+
+        Returns:
+            str: 已完整接收的临时文件路径，由调用方移入 Blob 存储
+        """
+        with self._session_lock(session.id):
+            db.session.refresh(session)
+            if session.status != UploadSession.STATUS_UPLOADING:
+                raise ConflictError("上传已完成")
+            if session.received_size != session.total_size:
+                raise UploadOffsetError(session.received_size)
+
+            digest = self._get_hasher(session.id, session.received_size).hexdigest()
+            if expected_sha256 and expected_sha256.lower() != digest:
+                raise ValidationError("文件校验失败，SHA-256 不一致")
+
+            session.sha256 = digest
+            session.status = UploadSession.STATUS_COMPLETED
+            self._drop_hasher(session.id)
+            return self.part_path(session.id)
+
+    def abort(self, session):
+        """取消上传并删除临时文件"""
+        with self._session_lock(session.id):
+            self._remove_part(session.id)
+            self._drop_hasher(session.id)
+            db.session.delete(session)
+            db.session.commit()
+
+    def purge_expired(self):
+        """清理过期未完成的会话"""
+        deadline = datetime.utcnow() - self.session_ttl
+        expired = UploadSession.query\
+            .filter(UploadSession.status == UploadSession.STATUS_UPLOADING)\
+            .filter(UploadSession.updated_at < deadline)\
+            .all()
+        for session in expired:
+            self._remove_part(session.id)
+            self._drop_hasher(session.id)
+            db.session.delete(session)
+        if expired:
+            db.session.commit()
+
+    # ========== 内部方法 ==========
+
+    def _session_lock(self, upload_id):
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _get_hasher(self, upload_id, offset):
+        """获取与偏移对应的摘要状态；缓存不命中时从已落盘数据重建"""
+        with self._lock:
+            cached = self._hashers.get(upload_id)
+            if cached and cached[0] == offset:
+                self._hashers.move_to_end(upload_id)
+                return cached[1].copy()
+
+        hasher = hashlib.sha256()
+        remaining = offset
+        with open(self.part_path(upload_id), 'rb') as f:
+            while remaining > 0:
+                block = f.read(min(STREAM_BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+        return hasher
+
+    def _put_hasher(self, upload_id, offset, hasher):
+        with self._lock:
+            self._hashers[upload_id] = (offset, hasher)
+            self._hashers.move_to_end(upload_id)
+            while len(self._hashers) > self._hasher_cache_size:
+                self._hashers.popitem(last=False)
+
+    def _drop_hasher(self, upload_id):
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+            self._locks.pop(upload_id, None)
+
+    def _remove_part(self, upload_id):
+        try:
+            os.remove(self.part_path(upload_id))
+        except FileNotFoundError:
+            pass
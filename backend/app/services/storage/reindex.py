@@ -0,0 +1,177 @@
+"""
+基于清单的增量重建索引
+
+kb_documents 记录每个文件的路径、大小、修改时间和内容摘要，kb_chunks 记录
+每份内容的切片哈希。同步目录中的文件属于共享知识库（shared 命名空间）。重建索引时：
+1. 扫描 KB_SOURCE_FOLDER，大小和修改时间都未变化的文件直接跳过（不读取内容）；
+2. 变化的文件重新计算摘要，内容确实变化时登记新内容并创建入库任务；
+3. 清单中已不存在的文件从目录中删除，释放不再被引用的切片向量；
+4. force 时对所有内容重新切分，切片哈希未变化的部分不会重新向量化；同时把
+   关键词索引中缺少的切片正文补入索引（如启用关键词检索前已入库的内容）。
+"""
+import os
+
+from app.extensions import db
+from app.models import KBChunk, KBChunkText, KBDocument
+from app.services.ingestion import ingestion_manager
+from app.services.keyword import get_keyword_index
+from app.services.namespaces import SHARED
+from . import catalog
+
+
+def reindex(blob_store, source_folder, allowed_extensions, max_size, user_id=None, force=False):
+    """
+    对比清单与当前状态，增量更新知识库
+
+    Args:
+        blob_store: Blob 存储
+        source_folder: 同步目录（为空时只处理 force）
+        allowed_extensions: 允许的扩展名
+        max_size: 单文件大小上限
+        user_id: 操作用户 ID
+        force: 是否重新切分所有内容
+
+    Returns:
+        dict: 统计信息
+    """
+    stats = {
+        'scanned': 0,
+        'unchanged': 0,
+        'added': 0,
+        'updated': 0,
+        'removed': 0,
+        'requeued': 0,
+        'keyword_indexed': 0,
+        'errors': []
+    }
+    queued = False
+
+    if source_folder:
+        manifest = {
+            doc.filename: doc
+            for doc in KBDocument.query.filter_by(namespace=SHARED, origin=KBDocument.ORIGIN_SYNC)
+        }
+        seen = set()
+
+        for rel_path, abs_path, st in _scan(source_folder, allowed_extensions):
+            stats['scanned'] += 1
+            seen.add(rel_path)
+
+            document = manifest.get(rel_path)
+            if document and document.size == st.st_size and document.source_mtime_ns == st.st_mtime_ns:
+                stats['unchanged'] += 1
+                continue
+
+            try:
+                with open(abs_path, 'rb') as f:
+                    sha256, size, tmp_path = blob_store.write_stream(f, max_size)
+                old_sha256 = document.blob_sha256 if document else None
+                _, job = catalog.commit_document(
+                    blob_store, user_id, SHARED, rel_path, sha256, size, tmp_path,
+                    overwrite=True, origin=KBDocument.ORIGIN_SYNC, mtime_ns=st.st_mtime_ns
+                )
+            except Exception as e:  # noqa: BLE001 单个文件失败不影响其他文件
+                db.session.rollback()
+                stats['errors'].append(f"{rel_path}: {str(e)}")
+                continue
+
+            queued = queued or job is not None
+            if document is None:
+                stats['added'] += 1
+            elif old_sha256 != sha256:
+                stats['updated'] += 1
+            else:
+                # 只有修改时间变化
+                stats['unchanged'] += 1
+
+        for rel_path, document in manifest.items():
+            if rel_path not in seen:
+                catalog.remove_document(blob_store, SHARED, document)
+                stats['removed'] += 1
+        db.session.commit()
+
+    if force:
+        stats['requeued'] = _requeue_all(blob_store, user_id)
+        queued = queued or stats['requeued'] > 0
+        stats['keyword_indexed'] = _backfill_keyword_index()
+
+    if queued:
+        ingestion_manager.notify()
+    return stats
+
+
+def _scan(root, allowed_extensions):
+    """
+    遍历同步目录（跳过隐藏文件和目录）
+
+    Yields:
+        tuple: (相对路径, 绝对路径, stat 结果)
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for name in filenames:
+            if name.startswith('.') or '.' not in name:
+                continue
+            if name.rsplit('.', 1)[1].lower() not in allowed_extensions:
+                continue
+            abs_path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(abs_path)
+            except OSError:
+                continue
+            rel_path = os.path.relpath(abs_path, root).replace(os.sep, '/')
+            yield rel_path, abs_path, st
+
+
+def _requeue_all(blob_store, user_id):
+    """为各命名空间中所有不在处理中的内容重新创建入库任务"""
+    count = 0
+    rows = db.session.query(KBDocument.namespace, KBDocument.blob_sha256, db.func.min(KBDocument.filename))\
+        .filter(KBDocument.status != KBDocument.STATUS_PENDING)\
+        .group_by(KBDocument.namespace, KBDocument.blob_sha256).all()
+    for namespace, sha256, filename in rows:
+        if not blob_store.exists(sha256):
+            continue
+        KBDocument.set_index_state(namespace, sha256, KBDocument.STATUS_PENDING)
+        ingestion_manager.enqueue(
+            filename, blob_store.path_for(sha256), namespace,
+            user_id=user_id, blob_sha256=sha256, file_type=filename.rsplit('.', 1)[-1].lower()
+        )
+        count += 1
+    db.session.commit()
+    return count
+
+
+def _backfill_keyword_index(page_size=1000, batch_size=20000):
+    """
+    把各命名空间已入库、但尚未进入该命名空间关键词索引的切片补入索引
+    （按切片哈希分页读取）
+    """
+    count = 0
+    namespaces = [row[0] for row in db.session.query(KBDocument.namespace).distinct()]
+    for namespace in namespaces:
+        keyword_index = get_keyword_index(namespace)
+        if keyword_index is None:
+            return count
+        pending = []
+        last_hash = ''
+        while True:
+            rows = db.session.query(KBChunkText.chunk_hash, KBChunkText.text)\
+                .join(KBChunk, KBChunk.chunk_hash == KBChunkText.chunk_hash)\
+                .join(KBDocument, KBDocument.blob_sha256 == KBChunk.blob_sha256)\
+                .filter(KBDocument.namespace == namespace, KBDocument.status == KBDocument.STATUS_INDEXED)\
+                .filter(KBChunkText.chunk_hash > last_hash)\
+                .distinct()\
+                .order_by(KBChunkText.chunk_hash)\
+                .limit(page_size).all()
+            if not rows:
+                break
+            last_hash = rows[-1][0]
+            indexed = keyword_index.indexed([h for h, _ in rows])
+            pending.extend((h, text) for h, text in rows if h not in indexed)
+            if len(pending) >= batch_size:
+                count += keyword_index.add(pending)
+                pending = []
+        if pending:
+            count += keyword_index.add(pending)
+    return count
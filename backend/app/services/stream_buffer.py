@@ -0,0 +1,257 @@
+"""
+可续传的回答流缓冲
+
+聊天接口的每个 SSE 事件带有 id（`<stream_id>:<seq>`），已编码的帧写入本机共享的
+回答流缓冲；客户端断线后带 Last-Event-ID 重新请求时，任何工作进程都能从缓冲中补发
+之后的事件，并继续跟随尚未结束的生成，不需要重新检索和生成。
+- 缓冲为 SQLite（WAL），与嵌入缓存一样由同一台机器上的多个工作进程共享；
+- 帧先放入进程内的待写列表，由后台线程每 STREAM_BUFFER_FLUSH_MS 毫秒在一个事务中
+  批量写入，聊天流本身不等待磁盘；
+- 每个回答流只保留最近 STREAM_BUFFER_MAX_EVENTS 个事件（环形缓冲）；结束的回答流
+  再保留 STREAM_BUFFER_TTL 秒，之后与超时未结束的回答流一起清理。
+"""
+import os
+import time
+import atexit
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass
+
+from flask import current_app
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS streams (
+    stream_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_streams_expires_at ON streams (expires_at);
+CREATE TABLE IF NOT EXISTS events (
+    stream_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    frame BLOB NOT NULL,
+    PRIMARY KEY (stream_id, seq)
+) WITHOUT ROWID;
+"""
+
+# 清理过期回答流的间隔（秒）
+_PURGE_INTERVAL = 5
+
+
+@dataclass
+class StreamInfo:
+    """回答流的状态"""
+    user_id: str
+    done: bool
+
+
+class StreamBuffer:
+    """SQLite 回答流缓冲（进程内批量写入）"""
+
+    def __init__(self, path, max_events=256, ttl=60, running_ttl=300, flush_interval=0.1, logger=None):
+        """
+        Args:
+            path: 缓冲目录
+            max_events: 每个回答流保留的事件数
+            ttl: 回答流结束后保留的秒数
+            running_ttl: 未结束的回答流在最后一次写入后保留的秒数（工作进程退出后由此清理）
+            flush_interval: 批量写入的间隔（秒）
+            logger: 后台线程使用的日志记录器
+        """
+        os.makedirs(path, exist_ok=True)
+        self.max_events = max(1, max_events)
+        self.ttl = ttl
+        self.running_ttl = max(running_ttl, ttl)
+        self.flush_interval = flush_interval
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(path, 'streams.sqlite'),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # 缓冲只用于断线续传，掉电丢失可以接受
+        self._conn.execute('PRAGMA synchronous=OFF')
+        self._conn.executescript(_SCHEMA)
+        # 待写入的操作（_pending_lock 保护）
+        self._pending_lock = threading.Lock()
+        self._opened = {}
+        self._events = []
+        self._finished = set()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._flusher = None
+        self._last_purge = 0.0
+
+    @classmethod
+    def from_config(cls, config, logger=None):
+        ttl = config.get('STREAM_BUFFER_TTL', 60)
+        # 未结束的回答流最长持续到检索和生成的预算用完
+        generate_budget = (config.get('RAG_TTFT_BUDGET_MS', 5000) + config.get('LLM_GENERATE_BUDGET_MS', 120000)) / 1000
+        return cls(
+            config['STREAM_BUFFER_PATH'],
+            max_events=config.get('STREAM_BUFFER_MAX_EVENTS', 256),
+            ttl=ttl,
+            running_ttl=generate_budget + ttl,
+            flush_interval=config.get('STREAM_BUFFER_FLUSH_MS', 100) / 1000,
+            logger=logger
+        )
+
+    # ========== 写入（聊天流一侧，不等待磁盘） ==========
+
+    def open(self, stream_id, user_id):
+        """登记一个回答流"""
+        self._start()
+        with self._pending_lock:
+            self._opened[stream_id] = str(user_id)
+
+    def append(self, stream_id, seq, frame):
+        """追加一帧（seq 从 1 开始递增）"""
+        with self._pending_lock:
+            self._events.append((stream_id, seq, frame))
+
+    def finish(self, stream_id):
+        """标记回答流结束，立即写入"""
+        with self._pending_lock:
+            self._finished.add(stream_id)
+        self._wakeup.set()
+
+    # ========== 读取（续传一侧） ==========
+
+    def lookup(self, stream_id):
+        """
+        Returns:
+            StreamInfo: 回答流状态（不存在或已过期时为 None）
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT user_id, done FROM streams WHERE stream_id = ? AND expires_at >= ?",
+                (stream_id, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        return StreamInfo(user_id=row[0], done=bool(row[1]))
+
+    def read(self, stream_id, after_seq):
+        """
+        读取 after_seq 之后的帧
+
+        Returns:
+            tuple: ([(seq, frame), ...], 回答流状态)；回答流已过期时状态为 None。
+            状态与帧在同一个读事务中读取，done 为 True 时返回的帧就是全部剩余的帧
+        """
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                row = self._conn.execute(
+                    "SELECT user_id, done FROM streams WHERE stream_id = ? AND expires_at >= ?",
+                    (stream_id, time.time())
+                ).fetchone()
+                rows = [] if row is None else self._conn.execute(
+                    "SELECT seq, frame FROM events WHERE stream_id = ? AND seq > ? ORDER BY seq",
+                    (stream_id, after_seq)
+                ).fetchall()
+            finally:
+                self._conn.execute('COMMIT')
+        if row is None:
+            return [], None
+        return rows, StreamInfo(user_id=row[0], done=bool(row[1]))
+
+    # ========== 后台写入 ==========
+
+    def _start(self):
+        if self._flusher is not None:
+            return
+        with self._pending_lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._run, name='stream-buffer', daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+
+    def close(self):
+        """写入剩余的帧后停止后台线程"""
+        if self._flusher is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._flusher.join(timeout=5)
+        self._flusher = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                self.logger.warning(f"写入回答流缓冲失败: {str(e)}")
+        self.flush()
+
+    def flush(self):
+        """把待写入的操作写入 SQLite（一个事务），并定期清理过期的回答流"""
+        with self._pending_lock:
+            opened, self._opened = self._opened, {}
+            events, self._events = self._events, []
+            finished, self._finished = self._finished, set()
+        now = time.time()
+        purge = now - self._last_purge >= _PURGE_INTERVAL
+        if not (opened or events or finished or purge):
+            return
+
+        # 每个回答流只保留最近 max_events 个事件
+        last_seq = {}
+        for stream_id, seq, _ in events:
+            last_seq[stream_id] = max(last_seq.get(stream_id, 0), seq)
+        running = (set(last_seq) | set(opened)) - finished
+
+        with self._lock:
+            conn = self._conn
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO streams (stream_id, user_id, done, expires_at) VALUES (?, ?, 0, ?)",
+                    [(stream_id, user_id, now + self.running_ttl) for stream_id, user_id in opened.items()]
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO events (stream_id, seq, frame) VALUES (?, ?, ?)", events
+                )
+                conn.executemany(
+                    "DELETE FROM events WHERE stream_id = ? AND seq <= ?",
+                    [(stream_id, seq - self.max_events) for stream_id, seq in last_seq.items() if seq > self.max_events]
+                )
+                conn.executemany(
+                    "UPDATE streams SET expires_at = ? WHERE stream_id = ?",
+                    [(now + self.running_ttl, stream_id) for stream_id in running]
+                )
+                conn.executemany(
+                    "UPDATE streams SET done = 1, expires_at = ? WHERE stream_id = ?",
+                    [(now + self.ttl, stream_id) for stream_id in finished]
+                )
+                if purge:
+                    conn.execute(
+                        "DELETE FROM events WHERE stream_id IN (SELECT stream_id FROM streams WHERE expires_at < ?)",
+                        (now,)
+                    )
+                    conn.execute("DELETE FROM streams WHERE expires_at < ?", (now,))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        if purge:
+            self._last_purge = now
+
+
+def get_stream_buffer():
+    """获取当前应用的回答流缓冲（未启用续传时为 None）"""
+    if not current_app.config.get('STREAM_RESUME_ENABLED', True):
+        return None
+    buffer = current_app.extensions.get('stream_buffer')
+    if buffer is None:
+        buffer = StreamBuffer.from_config(current_app.config, current_app.logger)
+        current_app.extensions['stream_buffer'] = buffer
+    return buffer
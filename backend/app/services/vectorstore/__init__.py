@@ -0,0 +1,53 @@
+"""
+向量库服务
+
+每个知识库命名空间有独立的向量库分片（VECTOR_STORE_PATH/<分片名>/ 或 Chroma 中的
+独立集合），按进程懒加载，空闲后移除。
+"""
+from flask import current_app
+
+from app.services.namespaces import shard_name
+from app.services.shards import ShardRegistry
+from .base import VectorStore
+from .numpy_store import NumpyVectorStore
+from .ivf_store import IVFVectorStore
+from .chroma_store import ChromaVectorStore
+
+BACKENDS = {
+    NumpyVectorStore.name: NumpyVectorStore,
+    IVFVectorStore.name: IVFVectorStore,
+    ChromaVectorStore.name: ChromaVectorStore
+}
+
+
+def create_vector_store(config, namespace):
+    """根据 VECTOR_STORE_BACKEND 创建命名空间的向量库分片"""
+    name = config.get('VECTOR_STORE_BACKEND', 'numpy')
+    if name not in BACKENDS:
+        raise ValueError(f"未知的向量库后端: {name}")
+    return BACKENDS[name].from_config(config, shard_name(namespace))
+
+
+def get_vector_store_shards():
+    """获取当前应用的向量库分片注册表"""
+    registry = current_app.extensions.get('vector_store_shards')
+    if registry is None:
+        config = current_app.config
+        registry = ShardRegistry(
+            lambda namespace: create_vector_store(config, namespace),
+            idle_seconds=config.get('KB_SHARD_IDLE_SECONDS', 600),
+            max_open=config.get('KB_SHARD_MAX_OPEN', 64)
+        )
+        current_app.extensions['vector_store_shards'] = registry
+    return registry
+
+
+def get_vector_store(namespace):
+    """获取命名空间的向量库分片（按进程懒加载）"""
+    return get_vector_store_shards().get(namespace)
+
+
+__all__ = [
+    'VectorStore', 'NumpyVectorStore', 'IVFVectorStore', 'ChromaVectorStore',
+    'create_vector_store', 'get_vector_store', 'get_vector_store_shards'
+]
@@ -0,0 +1,65 @@
+"""
+向量库接口
+
+向量以切片内容哈希（32 位十六进制字符串）为 ID，所有向量均为 L2 归一化，
+相似度为内积（余弦相似度）。
+"""
+
+
+class VectorStore:
+    """向量库基类"""
+
+    name = 'base'
+
+    def add(self, ids, vectors):
+        """
+        写入向量（已存在的 ID 覆盖）
+
+        Args:
+            ids: 切片哈希列表
+            vectors: (len(ids), dimension) 向量矩阵
+        """
+        raise NotImplementedError
+
+    def delete(self, ids):
+        """
+        删除向量（不存在的 ID 忽略）
+
+        Returns:
+            int: 实际删除的数量
+        """
+        raise NotImplementedError
+
+    def compact(self, force=False):
+        """
+        回收已删除向量占用的空间（不需要压缩的后端忽略）
+
+        Returns:
+            int: 回收的数量
+        """
+        return 0
+
+    def search(self, query, k):
+        """
+        精确或近似 top-k 检索
+
+        Args:
+            query: (dimension,) 查询向量
+            k: 返回数量
+
+        Returns:
+            list[tuple]: 按相似度降序排列的 (切片哈希, 相似度)
+        """
+        return self.search_batch([query], k)[0]
+
+    def search_batch(self, queries, k):
+        """批量检索，返回每个查询的结果列表"""
+        raise NotImplementedError
+
+    def count(self):
+        """当前向量数量"""
+        raise NotImplementedError
+
+    def stats(self):
+        """存储统计（用于知识库信息接口）"""
+        return {'backend': self.name, 'count': self.count()}
@@ -0,0 +1,59 @@
+"""
+Chroma 向量库后端（需要安装 chromadb）
+"""
+import numpy as np
+
+from .base import VectorStore
+
+# Chroma 单次写入的最大条数
+_ADD_BATCH = 5000
+
+
+class ChromaVectorStore(VectorStore):
+    """基于 chromadb.PersistentClient 的向量库（内积距离）"""
+
+    name = 'chroma'
+
+    def __init__(self, path, collection='kb_chunks'):
+        try:
+            import chromadb
+        except ImportError as e:
+            raise RuntimeError("使用 chroma 向量库需要安装 chromadb") from e
+        self._client = chromadb.PersistentClient(path=path)
+        self._collection = self._client.get_or_create_collection(collection, metadata={'hnsw:space': 'ip'})
+
+    @classmethod
+    def from_config(cls, config, shard):
+        return cls(config['CHROMA_DB_PATH'], collection=f'kb_chunks_{shard}')
+
+    def add(self, ids, vectors):
+        ids = list(ids)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        for i in range(0, len(ids), _ADD_BATCH):
+            self._collection.upsert(ids=ids[i:i + _ADD_BATCH], embeddings=vectors[i:i + _ADD_BATCH].tolist())
+
+    def delete(self, ids):
+        ids = list(ids)
+        if not ids:
+            return 0
+        existing = self._collection.get(ids=ids, include=[])['ids']
+        if existing:
+            self._collection.delete(ids=existing)
+        return len(existing)
+
+    def search_batch(self, queries, k):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        n_results = min(k, self._collection.count())
+        if n_results <= 0:
+            return [[] for _ in range(len(queries))]
+        result = self._collection.query(
+            query_embeddings=queries.tolist(), n_results=n_results, include=['distances']
+        )
+        # ip 距离为 1 - 内积
+        return [
+            [(chunk_id, 1.0 - distance) for chunk_id, distance in zip(ids, distances)]
+            for ids, distances in zip(result['ids'], result['distances'])
+        ]
+
+    def count(self):
+        return self._collection.count()
@@ -0,0 +1,255 @@
+"""
+IVF 近似最近邻向量库
+
+在内置 NumPy 向量库的存储之上增加倒排索引：
+- 用球面 k-means 把向量划分为 nlist 个簇，质心按版本保存在 centroids-<版本>.npy；
+- 每个槽位所属的簇号保存在与向量同样按槽位排列的 assign.bin 中，新写入的
+  向量直接分配到最近的质心（增量插入，不需要重建）；
+- 检索时只计算与查询最接近的 nprobe 个簇内向量的相似度，nprobe 越大召回越高、
+  延迟越高；向量数不足以训练时退化为精确检索。
+
+向量数量达到训练阈值后在写入时自动训练；数量增长到上次训练时的
+retrain_growth 倍后重新训练，避免质心随数据分布漂移。
+"""
+import os
+import time
+import threading
+
+import numpy as np
+
+from .numpy_store import NumpyVectorStore
+
+# 簇号用 int16 存储（argsort 可走基数排序），nlist 不能超过此值
+_MAX_NLIST = 32767
+
+
+class IVFVectorStore(NumpyVectorStore):
+    """倒排文件（IVF）索引的近似检索"""
+
+    name = 'ivf'
+
+    def __init__(self, root, dtype='float32', nlist=1024, nprobe=16, train_iters=10,
+                 train_sample_per_list=64, min_train_size=None, retrain_growth=4.0, block_rows=16384,
+                 compact_ratio=0.3, compact_min_deleted=1024):
+        """
+        Args:
+            root: 存储目录
+            dtype: 新建向量库时的存储精度
+            nlist: 簇数量（建议约为向量数的平方根）
+            nprobe: 检索时探查的簇数量
+            train_iters: k-means 迭代次数
+            train_sample_per_list: 训练时每个簇的采样向量数
+            min_train_size: 开始训练的最少向量数，默认 nlist * 39
+            retrain_growth: 向量数增长到上次训练时的多少倍后重新训练
+            block_rows: 分块计算时每块的行数
+            compact_ratio: 墓碑槽位占比超过此值时压缩
+            compact_min_deleted: 墓碑槽位少于此数量时不压缩
+        """
+        super().__init__(
+            root, dtype=dtype, block_rows=block_rows,
+            compact_ratio=compact_ratio, compact_min_deleted=compact_min_deleted
+        )
+        if not 0 < nlist <= _MAX_NLIST:
+            raise ValueError(f"nlist 必须在 1 到 {_MAX_NLIST} 之间")
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iters = train_iters
+        self.train_sample_per_list = train_sample_per_list
+        self.min_train_size = min_train_size or nlist * 39
+        self.retrain_growth = retrain_growth
+        # 读取方缓存的倒排表：(质心版本, 质心, 按簇排序的槽位, 每个簇的起始偏移, generation)
+        self._lists = None
+        self._train_thread = None
+
+    @classmethod
+    def from_config(cls, config, shard):
+        return cls(
+            os.path.join(config['VECTOR_STORE_PATH'], shard),
+            dtype=config.get('VECTOR_STORE_DTYPE', 'float32'),
+            compact_ratio=config.get('VECTOR_COMPACT_RATIO', 0.3),
+            compact_min_deleted=config.get('VECTOR_COMPACT_MIN_DELETED', 1024),
+            nlist=config.get('IVF_NLIST', 1024),
+            nprobe=config.get('IVF_NPROBE', 16),
+            train_iters=config.get('IVF_TRAIN_ITERS', 10),
+            train_sample_per_list=config.get('IVF_TRAIN_SAMPLE_PER_LIST', 64),
+            min_train_size=config.get('IVF_MIN_TRAIN_SIZE') or None
+        )
+
+    def _data_files(self, meta):
+        files = super()._data_files(meta)
+        # 簇号随向量一起在压缩时复制，质心不变
+        files['assign'] = (self._data_path('assign', meta), np.int16, ())
+        return files
+
+    def _centroids_path(self, version):
+        return os.path.join(self.root, f'centroids-{version}.npy')
+
+    def _files(self, meta):
+        version = meta.get('ivf', {}).get('version')
+        files = super()._files(meta)
+        if version:
+            files.append(self._centroids_path(version))
+        return files
+
+    # ========== 训练与增量插入 ==========
+
+    def _needs_training(self, meta):
+        ivf = meta.get('ivf')
+        if ivf is None:
+            return meta['live'] >= self.min_train_size
+        return meta['live'] >= ivf['trained_size'] * self.retrain_growth
+
+    def _after_add(self, meta, slots, vectors):
+        ivf = meta.get('ivf')
+        if ivf is not None:
+            centroids = self._load_centroids(ivf['version'])
+            self._maps['assign'][slots] = self._nearest(
+                np.asarray(vectors, dtype=np.float32), centroids
+            )
+        if self._needs_training(meta):
+            self._train(meta)
+
+    def train(self, force=True):
+        """
+        训练质心并重新分配所有向量
+
+        Args:
+            force: 为 False 时只在满足训练条件时训练（其他进程可能已完成训练）
+        """
+        with self._write_lock() as meta:
+            if meta['live'] == 0 or not (force or self._needs_training(meta)):
+                return
+            self._train(meta)
+            self._commit(meta)
+
+    def _train(self, meta):
+        """训练质心并分配全部已用槽位（调用方持有写锁，由调用方提交）"""
+        started = time.perf_counter()
+        count = meta['count']
+        vectors = self._maps['vectors']
+        live_slots = np.flatnonzero(self._maps['ids'][:count].any(axis=1))
+        nlist = min(self.nlist, len(live_slots))
+
+        rng = np.random.default_rng(meta['generation'])
+        sample_size = min(len(live_slots), nlist * self.train_sample_per_list)
+        sample_slots = np.sort(rng.choice(live_slots, sample_size, replace=False))
+        sample = np.asarray(vectors[sample_slots], dtype=np.float32)
+        centroids = self._kmeans(sample, nlist, rng)
+
+        assign = self._maps['assign']
+        for start in range(0, count, self.block_rows):
+            end = min(start + self.block_rows, count)
+            assign[start:end] = self._nearest(np.asarray(vectors[start:end], dtype=np.float32), centroids)
+
+        # 新版本质心写入新文件，读取方在 meta 提交前仍使用旧版本；保留上一个版本供正在检索的请求使用
+        version = meta.get('ivf', {}).get('version', 0) + 1
+        tmp_path = f'{self._centroids_path(version)}.{os.getpid()}.tmp.npy'
+        np.save(tmp_path, centroids)
+        os.replace(tmp_path, self._centroids_path(version))
+        stale = self._centroids_path(version - 2)
+        if os.path.exists(stale):
+            os.remove(stale)
+        meta['ivf'] = {
+            'version': version,
+            'nlist': nlist,
+            'trained_size': int(meta['live']),
+            'train_seconds': round(time.perf_counter() - started, 3)
+        }
+
+    def _kmeans(self, sample, nlist, rng):
+        """球面 k-means（向量已归一化，用内积作为相似度）"""
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.train_iters):
+            labels = self._nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            # 空簇重新随机取样本作为质心
+            empty = np.flatnonzero(counts == 0)
+            if len(empty):
+                sums[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+        return centroids
+
+    def _nearest(self, vectors, centroids):
+        """每个向量最近的质心编号"""
+        labels = np.empty(len(vectors), dtype=np.int16)
+        for start in range(0, len(vectors), self.block_rows):
+            end = min(start + self.block_rows, len(vectors))
+            labels[start:end] = np.argmax(vectors[start:end] @ centroids.T, axis=1)
+        return labels
+
+    def _load_centroids(self, version):
+        lists = self._lists
+        if lists is not None and lists[0] == version:
+            return lists[1]
+        return np.load(self._centroids_path(version))
+
+    # ========== 检索 ==========
+
+    def _inverted_lists(self, snapshot):
+        """按簇分组的槽位（每个 generation 构建一次）"""
+        meta = snapshot.meta
+        with self._lock:
+            cached = self._lists
+            if cached is not None and cached[0] == meta['ivf']['version'] and cached[4] == meta['generation']:
+                return cached[1], cached[2], cached[3]
+            centroids = self._load_centroids(meta['ivf']['version'])
+            assign = np.asarray(snapshot.maps['assign'][:meta['count']])
+            order = np.argsort(assign, kind='stable')
+            if snapshot.mask is not None:
+                order = order[snapshot.mask[order]]
+            offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(assign[order], minlength=len(centroids)), out=offsets[1:])
+            self._lists = (meta['ivf']['version'], centroids, order, offsets, meta['generation'])
+            return centroids, order, offsets
+
+    def search_batch(self, queries, k, nprobe=None):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        snapshot = self._snapshot()
+        meta = snapshot.meta
+        if meta['live'] == 0 or k <= 0:
+            return [[] for _ in range(len(queries))]
+        if queries.shape[1] != meta['dimension']:
+            raise ValueError(f"查询向量维度 {queries.shape[1]} 与向量库维度 {meta['dimension']} 不一致")
+        if 'ivf' not in meta:
+            self._maybe_train_async(meta)
+            return self._exact_search(snapshot, queries, k)
+
+        centroids, order, offsets = self._inverted_lists(snapshot)
+        nprobe = min(nprobe or self.nprobe, len(centroids))
+        coarse = queries @ centroids.T
+        probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+        vectors = snapshot.maps['vectors']
+
+        results = []
+        for query, probe in zip(queries, probes):
+            candidates = np.sort(np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probe]))
+            if len(candidates) == 0:
+                results.append([])
+                continue
+            scores = np.asarray(vectors[candidates], dtype=np.float32) @ query
+            top = min(k, len(candidates))
+            best = np.argpartition(-scores, top - 1)[:top]
+            results.append(self._ranked(snapshot, candidates[best], scores[best]))
+        return results
+
+    def _maybe_train_async(self, meta):
+        """已有足够向量但尚未训练（如从精确检索切换过来）时在后台训练"""
+        if meta['live'] < self.min_train_size:
+            return
+        with self._lock:
+            if self._train_thread is not None and self._train_thread.is_alive():
+                return
+            self._train_thread = threading.Thread(
+                target=self.train, kwargs={'force': False}, name='ivf-train', daemon=True
+            )
+            self._train_thread.start()
+
+    def stats(self):
+        stats = super().stats()
+        stats['ivf'] = self._read_meta().get('ivf')
+        stats['nprobe'] = self.nprobe
+        return stats
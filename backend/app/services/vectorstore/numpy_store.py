@@ -0,0 +1,391 @@
+"""
+内存映射的 NumPy 向量库
+
+向量按槽位存放在一个 (capacity, dimension) 的内存映射矩阵中（默认 float32），
+切片哈希按同样的槽位存放在 ids.bin 中，meta.json 记录维度、数量和版本号。
+- 检索是精确的：按块做矩阵乘法得到全部相似度，再用 argpartition 取 top-k；
+- 多个 gunicorn 工作进程映射同一组文件，共享操作系统页缓存，不各自加载副本；
+- 写入通过文件锁串行化，读取方每次检索前读取 meta.json，发现其他进程写入后
+  重新映射；
+- 删除只把被删切片所在槽位的 ID 清零（墓碑），耗时与删除的切片数成正比，提交后
+  检索立即跳过这些槽位；墓碑槽位在下次写入时复用。墓碑占比超过阈值时在后台
+  压缩：把存活槽位按顺序复制到新一代数据文件并缩小容量，读取方看到新 meta 后
+  切换到新文件，正在检索的请求继续使用旧映射。
+"""
+import os
+import json
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+
+from .base import VectorStore
+
+try:
+    import fcntl
+except ImportError:  # Windows：仅支持单进程写入
+    fcntl = None
+
+_ID_BYTES = 16
+_MIN_CAPACITY = 1024
+
+# 读取方的一致视图：meta、按 meta 容量映射的数据文件、有效槽位掩码（无删除时为 None）
+_Snapshot = namedtuple('_Snapshot', ['meta', 'maps', 'mask'])
+
+
+class NumpyVectorStore(VectorStore):
+    """内存映射矩阵 + 精确 top-k 检索"""
+
+    name = 'numpy'
+
+    def __init__(self, root, dtype='float32', block_rows=16384, compact_ratio=0.3, compact_min_deleted=1024):
+        """
+        Args:
+            root: 存储目录
+            dtype: 新建向量库时的存储精度（float16 / float32），已有向量库沿用原精度
+            block_rows: 检索时每块参与矩阵乘法的行数（控制临时内存）
+            compact_ratio: 墓碑槽位占已用槽位的比例超过此值时压缩
+            compact_min_deleted: 墓碑槽位少于此数量时不压缩
+        """
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.block_rows = block_rows
+        self.compact_ratio = compact_ratio
+        self.compact_min_deleted = compact_min_deleted
+        self._meta_path = os.path.join(root, 'meta.json')
+        self._lock_path = os.path.join(root, 'write.lock')
+        self._initial_meta = {
+            'dimension': 0,
+            'dtype': np.dtype(dtype).name,
+            'capacity': 0,
+            'count': 0,  # 已使用的最大槽位数（含墓碑槽位）
+            'live': 0,
+            'generation': 0,
+            'epoch': 0  # 数据文件的代数，每次压缩后递增
+        }
+
+        # 读取方状态（self._lock 保护）
+        self._lock = threading.Lock()
+        self._snapshot_cache = None
+        self._compact_thread = None
+
+        # 写入方状态（self._write_mutex 保护）
+        self._write_mutex = threading.Lock()
+        self._maps = None
+        self._maps_layout = None  # 当前映射对应的 (代数, 容量)
+        self._index = None  # 切片哈希 -> 槽位
+        self._free = None  # 空闲槽位
+        self._index_generation = None
+
+    @classmethod
+    def from_config(cls, config, shard):
+        return cls(
+            os.path.join(config['VECTOR_STORE_PATH'], shard),
+            dtype=config.get('VECTOR_STORE_DTYPE', 'float32'),
+            compact_ratio=config.get('VECTOR_COMPACT_RATIO', 0.3),
+            compact_min_deleted=config.get('VECTOR_COMPACT_MIN_DELETED', 1024)
+        )
+
+    # ========== 文件 ==========
+
+    def _read_meta(self):
+        try:
+            with open(self._meta_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return dict(self._initial_meta)
+
+    def _data_path(self, name, meta):
+        """数据文件路径：第 0 代为 <name>.bin，压缩后为 <name>-<代数>.bin"""
+        epoch = meta.get('epoch', 0)
+        return os.path.join(self.root, f'{name}.bin' if epoch == 0 else f'{name}-{epoch}.bin')
+
+    @staticmethod
+    def _layout(meta):
+        return meta.get('epoch', 0), meta['capacity']
+
+    def _data_files(self, meta):
+        """
+        与槽位一一对应的数据文件
+
+        Returns:
+            dict: 名称 -> (路径, dtype, 每个槽位的形状)
+        """
+        return {
+            'vectors': (self._data_path('vectors', meta), meta['dtype'], (meta['dimension'],)),
+            'ids': (self._data_path('ids', meta), np.uint8, (_ID_BYTES,))
+        }
+
+    def _map_files(self, meta):
+        capacity = meta['capacity']
+        if capacity == 0:
+            return {}
+        return {
+            name: np.memmap(path, dtype=dtype, mode='r+', shape=(capacity, *shape))
+            for name, (path, dtype, shape) in self._data_files(meta).items()
+        }
+
+    def _files(self, meta):
+        """统计存储大小时包含的文件"""
+        return [path for path, _, _ in self._data_files(meta).values()]
+
+    # ========== 写入 ==========
+
+    def add(self, ids, vectors):
+        ids = list(ids)
+        if not ids:
+            return
+        vectors = np.asarray(vectors)
+        with self._write_lock() as meta:
+            if meta['dimension'] == 0:
+                meta['dimension'] = vectors.shape[1]
+            elif vectors.shape[1] != meta['dimension']:
+                raise ValueError(f"向量维度 {vectors.shape[1]} 与向量库维度 {meta['dimension']} 不一致")
+
+            index, free = self._load_index(meta)
+            slots = []
+            for chunk_hash in ids:
+                slot = index.get(chunk_hash)
+                if slot is None:
+                    if free:
+                        slot = free.pop()
+                    else:
+                        slot = meta['count']
+                        meta['count'] += 1
+                    index[chunk_hash] = slot
+                    meta['live'] += 1
+                slots.append(slot)
+
+            self._ensure_capacity(meta, meta['count'])
+            slots = np.asarray(slots, dtype=np.int64)
+            self._maps['vectors'][slots] = vectors.astype(self._maps['vectors'].dtype, copy=False)
+            self._maps['ids'][slots] = np.frombuffer(
+                b''.join(bytes.fromhex(h) for h in ids), dtype=np.uint8
+            ).reshape(-1, _ID_BYTES)
+            self._after_add(meta, slots, vectors)
+            self._commit(meta)
+
+    def delete(self, ids):
+        with self._write_lock() as meta:
+            index, free = self._load_index(meta)
+            slots = [index.pop(h) for h in set(ids) if h in index]
+            if not slots:
+                return 0
+            # 只写墓碑（清零 ID），向量数据留到复用或压缩时覆盖
+            slots = np.asarray(slots, dtype=np.int64)
+            self._maps['ids'][slots] = 0
+            free.extend(slots.tolist())
+            meta['live'] -= len(slots)
+            self._commit(meta)
+            needs_compaction = self._needs_compaction(meta)
+        if needs_compaction:
+            self._compact_async()
+        return len(slots)
+
+    def _after_add(self, meta, slots, vectors):
+        """写入向量后、提交前的扩展点（子类维护附加索引）"""
+
+    @contextmanager
+    def _write_lock(self):
+        """
+        进程内互斥 + 跨进程文件锁，产出从磁盘读取的最新 meta
+
+        写入方只修改自己的 meta 副本，提交前读取方看到的始终是上一个版本。
+        """
+        with self._write_mutex:
+            with open(self._lock_path, 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    meta = self._read_meta()
+                    if self._maps is None or self._maps_layout != self._layout(meta):
+                        self._remap(meta)
+                    try:
+                        yield meta
+                    except BaseException:
+                        # 内存中的索引可能已被修改，下次写入时从磁盘重建
+                        self._index = None
+                        raise
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _remap(self, meta):
+        """写入方按 meta 重新映射数据文件"""
+        self._maps = self._map_files(meta)
+        self._maps_layout = self._layout(meta)
+
+    def _load_index(self, meta):
+        """写入方的 ID → 槽位映射（其他进程写入后从 ids.bin 重建）"""
+        if self._index is None or self._index_generation != meta['generation']:
+            count = meta['count']
+            index = {}
+            if count:
+                raw = self._maps['ids'][:count]
+                live = np.flatnonzero(raw.any(axis=1))
+                data = raw[live].tobytes()
+                for i, slot in enumerate(live.tolist()):
+                    index[data[i * _ID_BYTES:(i + 1) * _ID_BYTES].hex()] = slot
+            used = set(index.values())
+            self._free = [slot for slot in range(count - 1, -1, -1) if slot not in used]
+            self._index = index
+            self._index_generation = meta['generation']
+        return self._index, self._free
+
+    def _ensure_capacity(self, meta, needed):
+        """按 2 的幂扩容数据文件并重新映射（调用方持有写锁）"""
+        if needed <= meta['capacity']:
+            return
+        capacity = max(meta['capacity'], _MIN_CAPACITY)
+        while capacity < needed:
+            capacity *= 2
+        meta['capacity'] = capacity
+        for path, dtype, shape in self._data_files(meta).values():
+            with open(path, 'ab') as f:
+                f.truncate(capacity * int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        self._remap(meta)
+
+    def _commit(self, meta):
+        """刷新数据文件后原子替换 meta.json，读取方据此看到新数据"""
+        for data in self._maps.values():
+            data.flush()
+        meta['generation'] += 1
+        self._index_generation = meta['generation']
+        tmp_path = f'{self._meta_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path)
+
+    # ========== 压缩 ==========
+
+    def _needs_compaction(self, meta):
+        deleted = meta['count'] - meta['live']
+        return deleted >= self.compact_min_deleted and deleted > meta['count'] * self.compact_ratio
+
+    def compact(self, force=False):
+        """
+        把存活槽位复制到新一代数据文件，回收墓碑槽位占用的空间
+
+        Args:
+            force: 为 False 时只在墓碑占比超过阈值时压缩（其他进程可能已完成压缩）
+
+        Returns:
+            int: 回收的槽位数
+        """
+        with self._write_lock() as meta:
+            deleted = meta['count'] - meta['live']
+            if deleted == 0 or not (force or self._needs_compaction(meta)):
+                return 0
+            old_files = [path for path, _, _ in self._data_files(meta).values()]
+            old_maps = self._maps
+            live_slots = np.flatnonzero(old_maps['ids'][:meta['count']].any(axis=1))
+
+            # 新一代文件按存活数量重新分配容量
+            meta['epoch'] = meta.get('epoch', 0) + 1
+            meta['capacity'] = 0
+            meta['count'] = len(live_slots)
+            self._ensure_capacity(meta, max(len(live_slots), 1))
+            for name, data in self._maps.items():
+                source = old_maps[name]
+                for start in range(0, len(live_slots), self.block_rows):
+                    block = live_slots[start:start + self.block_rows]
+                    data[start:start + len(block)] = source[block]
+            # 槽位已重新编号，写入方索引从新的 ids 文件重建
+            self._index = None
+            self._commit(meta)
+        # 读取方看到新 meta 后切换到新文件；已映射旧文件的请求不受删除影响
+        for path in old_files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return int(deleted)
+
+    def _compact_async(self):
+        """在后台线程中压缩（同一时间只有一个压缩线程）"""
+        with self._lock:
+            if self._compact_thread is not None and self._compact_thread.is_alive():
+                return
+            self._compact_thread = threading.Thread(
+                target=self.compact, kwargs={'force': False}, name='vector-compact', daemon=True
+            )
+            self._compact_thread.start()
+
+    # ========== 读取 ==========
+
+    def _snapshot(self):
+        """读取最新 meta，必要时重新映射，返回一致的只读视图"""
+        with self._lock:
+            meta = self._read_meta()
+            cached = self._snapshot_cache
+            if cached is not None and cached.meta['generation'] == meta['generation']:
+                return cached
+            if cached is not None and self._layout(cached.meta) == self._layout(meta):
+                maps = cached.maps
+            else:
+                try:
+                    maps = self._map_files(meta)
+                except FileNotFoundError:
+                    # 读取 meta 后其他进程完成了压缩并删除了旧文件，按新 meta 重新映射
+                    meta = self._read_meta()
+                    maps = self._map_files(meta)
+            mask = None
+            if meta['live'] < meta['count']:
+                mask = maps['ids'][:meta['count']].any(axis=1)
+            self._snapshot_cache = _Snapshot(meta, maps, mask)
+            return self._snapshot_cache
+
+    def search_batch(self, queries, k):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        snapshot = self._snapshot()
+        meta = snapshot.meta
+        if meta['live'] == 0 or k <= 0:
+            return [[] for _ in range(len(queries))]
+        if queries.shape[1] != meta['dimension']:
+            raise ValueError(f"查询向量维度 {queries.shape[1]} 与向量库维度 {meta['dimension']} 不一致")
+        return self._exact_search(snapshot, queries, k)
+
+    def _exact_search(self, snapshot, queries, k):
+        vectors = snapshot.maps['vectors']
+        count = snapshot.meta['count']
+
+        # 按块计算相似度：float32 块直接走 BLAS；float16 块先转为 float32，临时内存与块大小成正比
+        scores = np.empty((len(queries), count), dtype=np.float32)
+        for start in range(0, count, self.block_rows):
+            end = min(start + self.block_rows, count)
+            block = vectors[start:end]
+            if block.dtype != np.float32:
+                block = block.astype(np.float32)
+            np.matmul(queries, block.T, out=scores[:, start:end])
+        if snapshot.mask is not None:
+            scores[:, ~snapshot.mask] = -np.inf
+
+        k = min(k, snapshot.meta['live'])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        return [
+            self._ranked(snapshot, candidates, scores[row, candidates])
+            for row, candidates in enumerate(top)
+        ]
+
+    @staticmethod
+    def _ranked(snapshot, slots, scores):
+        """按相似度降序返回 (切片哈希, 相似度)"""
+        order = np.argsort(-scores)
+        ids = snapshot.maps['ids']
+        return [(ids[slots[i]].tobytes().hex(), float(scores[i])) for i in order.tolist()]
+
+    def count(self):
+        return self._read_meta()['live']
+
+    def stats(self):
+        meta = self._read_meta()
+        return {
+            'backend': self.name,
+            'count': meta['live'],
+            'deleted': meta['count'] - meta['live'],
+            'epoch': meta.get('epoch', 0),
+            'dimension': meta['dimension'],
+            'dtype': meta['dtype'],
+            'size_bytes': sum(os.path.getsize(path) for path in self._files(meta) if os.path.exists(path))
+        }
@@ -0,0 +1,67 @@
+"""
+事件循环与线程池之间的桥接
+
+异步服务模式（见 app/asgi.py）下，阻塞的同步代码（数据库、检索阶段、没有原生异步
+实现的后端）在线程池中执行，事件循环只负责转发结果。
+"""
+import asyncio
+import threading
+from contextlib import nullcontext
+
+_ITEM = 'item'
+_END = 'end'
+_ERROR = 'error'
+
+
+async def iterate_in_thread(executor, factory, app=None):
+    """
+    在线程池中迭代同步生成器，逐个产出其元素
+
+    Args:
+        executor: 线程池（为空时使用事件循环的默认线程池）
+        factory: 无参函数，返回要迭代的同步生成器（在线程中调用）
+        app: Flask 应用，不为空时在线程中推入应用上下文
+
+    Yields:
+        生成器产出的元素（生成器抛出的异常原样抛出）
+    """
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    stop = threading.Event()
+
+    def put(kind, value=None):
+        try:
+            loop.call_soon_threadsafe(items.put_nowait, (kind, value))
+        except RuntimeError:
+            # 事件循环已关闭
+            stop.set()
+
+    def run():
+        try:
+            with app.app_context() if app is not None else nullcontext():
+                iterator = factory()
+                try:
+                    for item in iterator:
+                        put(_ITEM, item)
+                        # 消费方已提前结束：关闭生成器（执行其 finally）
+                        if stop.is_set():
+                            break
+                finally:
+                    close = getattr(iterator, 'close', None)
+                    if close is not None:
+                        close()
+            put(_END)
+        except Exception as e:  # noqa: BLE001 交给消费方抛出
+            put(_ERROR, e)
+
+    loop.run_in_executor(executor, run)
+    try:
+        while True:
+            kind, value = await items.get()
+            if kind == _END:
+                return
+            if kind == _ERROR:
+                raise value
+            yield value
+    finally:
+        stop.set()
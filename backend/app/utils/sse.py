@@ -0,0 +1,72 @@
+"""
+SSE 帧编码与回答片段合并
+
+聊天接口的事件编码为 `data: <JSON>\n\n` 的 UTF-8 字节（可续传时前面还有 `id: ` 行）。content 事件最频繁，
+帧的固定部分预先编码，只对正文调用 json.dumps；回答片段按字节数或时间间隔
+合并成一帧，减少编码次数和写出的帧数。
+"""
+import json
+
+DONE_FRAME = b'data: [DONE]\n\n'
+
+_CONTENT_HEAD = b'data: {"type": "content", "content": '
+_CONTENT_TAIL = b'}\n\n'
+
+
+def encode_content(text):
+    """编码 content 事件"""
+    return _CONTENT_HEAD + json.dumps(text, ensure_ascii=False).encode('utf-8') + _CONTENT_TAIL
+
+
+def encode_event(event):
+    """编码任意事件（只有 type、content 两个字段的 content 事件走预编码路径）"""
+    if len(event) == 2 and event.get('type') == 'content':
+        return encode_content(event['content'])
+    return b'data: ' + json.dumps(event, ensure_ascii=False).encode('utf-8') + b'\n\n'
+
+
+def with_id(frame, event_id):
+    """为已编码的帧加上事件 id（客户端断线重连时通过 Last-Event-ID 带回）"""
+    return b'id: ' + event_id.encode('ascii') + b'\n' + frame
+
+
+class TokenCoalescer:
+    """
+    回答片段合并：累计字节数达到 max_bytes，或最早的片段已等待 flush_interval 秒时
+    应输出一帧（ready）。调用方传入当前时间（time.monotonic()），并按 wait() 设置
+    下次检查的超时，上游停顿时已缓冲的片段也能按时发出。不是线程安全的。
+    """
+
+    def __init__(self, max_bytes=512, flush_interval=0.05):
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self._parts = []
+        self._bytes = 0
+        self._since = 0.0
+
+    def __bool__(self):
+        return bool(self._parts)
+
+    def add(self, text, now):
+        """缓冲一个片段"""
+        if not self._parts:
+            self._since = now
+        self._parts.append(text)
+        self._bytes += len(text.encode('utf-8'))
+
+    def ready(self, now):
+        """是否应输出（达到字节数或等待时间）"""
+        return bool(self._parts) and (self._bytes >= self.max_bytes or now - self._since >= self.flush_interval)
+
+    def wait(self, now):
+        """距离按时间间隔输出还有多少秒（没有缓冲时为 None）"""
+        if not self._parts:
+            return None
+        return max(self._since + self.flush_interval - now, 0)
+
+    def take(self):
+        """取出缓冲的文本"""
+        text = ''.join(self._parts)
+        self._parts = []
+        self._bytes = 0
+        return text
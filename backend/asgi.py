@@ -0,0 +1,13 @@
+"""
+异步服务模式入口（ASGI）
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+"""
+import os
+from app import create_app
+from app.asgi import create_asgi_app
+
+# 从环境变量获取配置名称，默认为 development
+config_name = os.getenv('FLASK_ENV', 'development')
+
+app = create_asgi_app(create_app(config_name))
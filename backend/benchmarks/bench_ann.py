@@ -0,0 +1,108 @@
+"""
+近似检索基准测试：IVF 索引的 recall@k 与延迟
+
+生成带簇结构的合成向量（更接近真实文本嵌入的分布），写入 IVF 向量库并训练，
+以同一份数据上的精确检索结果为基准，对不同 nprobe 报告 recall@k 和单查询
+延迟（p50/p99），用于按 p99 目标选择 IVF_NLIST / IVF_NPROBE。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_ann --count 500000 --dim 384 --nlist 1024 --nprobe 1,4,16,64
+"""
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import peak_rss_mb
+from app.services.vectorstore import IVFVectorStore, NumpyVectorStore
+
+
+def clustered_vectors(count, dim, clusters, noise, rng):
+    """围绕随机中心生成的归一化向量"""
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, clusters, count)
+    matrix = centers[labels] + noise * rng.standard_normal((count, dim), dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    return p50, p99
+
+
+def timed_search(store, queries, k, **kwargs):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(store.search_batch([query], k, **kwargs)[0])
+        latencies.append(time.perf_counter() - start)
+    return results, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='IVF 近似检索基准测试')
+    parser.add_argument('--count', type=int, default=200000, help='向量数量')
+    parser.add_argument('--dim', type=int, default=384, help='向量维度')
+    parser.add_argument('--clusters', type=int, default=2000, help='合成数据的真实簇数量')
+    parser.add_argument('--noise', type=float, default=0.6, help='簇内噪声（越大越接近均匀分布）')
+    parser.add_argument('--nlist', type=int, default=512, help='IVF 簇数量')
+    parser.add_argument('--nprobe', default='1,4,16,64', help='逗号分隔的 nprobe 取值')
+    parser.add_argument('--k', type=int, default=10, help='top-k')
+    parser.add_argument('--queries', type=int, default=100, help='查询次数')
+    parser.add_argument('--dtype', default='float32', help='存储精度')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    vectors = clustered_vectors(args.count, args.dim, args.clusters, args.noise, rng)
+    # 查询取库内向量加扰动，模拟与某些文档相近的问题
+    queries = vectors[rng.choice(args.count, args.queries, replace=False)]
+    queries = queries + 0.3 * args.noise * rng.standard_normal(queries.shape, dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    root = tempfile.mkdtemp(prefix='bench-ann-')
+    try:
+        store = IVFVectorStore(root, dtype=args.dtype, nlist=args.nlist, min_train_size=args.count + 1)
+        ids = [f'{i + 1:032x}' for i in range(args.count)]
+        start = time.perf_counter()
+        for i in range(0, args.count, 50000):
+            store.add(ids[i:i + 50000], vectors[i:i + 50000])
+        write_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        store.train()
+        train_seconds = time.perf_counter() - start
+
+        # 同一目录上的精确检索作为基准
+        exact = NumpyVectorStore(root)
+        truth, exact_latencies = timed_search(exact, queries, args.k)
+        truth = [{chunk_id for chunk_id, _ in result} for result in truth]
+
+        print(f"向量数 {args.count}，维度 {args.dim}，nlist {args.nlist}，top-{args.k}，查询 {args.queries} 次")
+        print(f"写入 {write_seconds:.2f} s，训练 + 分配 {train_seconds:.2f} s")
+        print(f"{'方式':>10}  {'recall@k':>9}  {'p50(ms)':>8}  {'p99(ms)':>8}")
+        p50, p99 = percentiles(exact_latencies)
+        print(f"{'exact':>10}  {1.0:>9.3f}  {p50:>8.2f}  {p99:>8.2f}")
+
+        store.search_batch(queries[:1], args.k)  # 构建倒排表
+        for nprobe in (int(x) for x in args.nprobe.split(',')):
+            results, latencies = timed_search(store, queries, args.k, nprobe=nprobe)
+            recall = np.mean([
+                len(expected & {chunk_id for chunk_id, _ in result}) / len(expected)
+                for expected, result in zip(truth, results)
+            ])
+            p50, p99 = percentiles(latencies)
+            print(f"{f'nprobe={nprobe}':>10}  {recall:>9.3f}  {p50:>8.2f}  {p99:>8.2f}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    rss = peak_rss_mb()
+    if rss is not None:
+        print(f"峰值 RSS: {rss:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+"""
+聊天接口并发基准测试：同步服务模式 vs 异步服务模式
+
+在子进程中启动后端（临时 SQLite 数据库，mock 大模型后端，每个字符间隔 --token-ms），
+客户端用 asyncio 在 --ramp 秒内均匀发起 --streams 个非 RAG 聊天流（每个流一个新对话，
+超过 --timeout 秒未完成的流计为未完成）：
+- sync：线程池 WSGI 服务器（--sync-workers 个线程，相当于 gunicorn -k gthread
+  --threads N），每个聊天流在整个生成期间占用一个线程，超出的请求排队；
+- async：uvicorn asgi:app（需要安装 uvicorn），回答流在事件循环上输出，
+  线程池（ASGI_BLOCKING_WORKERS）只用于请求处理和保存消息。
+输出完成数、首帧时间（TTFB，从发起请求算起）和整个流耗时的 p50 / p99、同时打开的
+聊天流峰值、总耗时，以及服务进程的峰值线程数和 RSS。
+--distinct N 时只有 N 个不同的问题（模拟大量用户同时问相同的问题），相同的问题合并为
+一次生成（见 app/services/single_flight.py），“生成”列为实际的生成次数；--no-coalesce
+关闭合并作为对照。
+每个请求在流开始之前有十几毫秒的 CPU 开销（鉴权、保存用户消息、构建历史），两种模式
+相同；--ramp 让请求分散到达，比较的是同时保持的流数，而不是请求处理速度。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_chat_concurrency --streams 200,1000 --token-ms 500 --ramp 20
+    python -m benchmarks.bench_chat_concurrency --streams 1000 --distinct 10 --modes async
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import BACKEND_DIR
+
+USERNAME = 'bench'
+PASSWORD = 'bench-password'
+
+
+# ---------------- 服务端（子进程） ----------------
+
+def serve_sync(port, workers):
+    """线程池 WSGI 服务器：最多 workers 个请求同时处理，其余在连接队列中等待"""
+    from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+    from run import app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    class PooledWSGIServer(WSGIServer):
+        request_queue_size = 4096
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wsgi-worker')
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:  # noqa: BLE001
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    server = PooledWSGIServer(('127.0.0.1', port), QuietHandler)
+    server.set_app(app)
+    server.serve_forever()
+
+
+def serve_async(port):
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit('异步模式需要安装 uvicorn: pip install uvicorn')
+    uvicorn.run('asgi:app', host='127.0.0.1', port=port, log_level='warning', backlog=4096)
+
+
+def server_env(workdir, args):
+    env = dict(os.environ)
+    env.update({
+        'FLASK_ENV': 'production',
+        'JWT_SECRET_KEY': 'benchmark-only-secret-not-for-production',
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'VECTOR_STORE_PATH': os.path.join(workdir, 'vector_store'),
+        'KEYWORD_INDEX_PATH': os.path.join(workdir, 'keyword_index'),
+        'EMBEDDING_CACHE_PATH': os.path.join(workdir, 'embedding_cache'),
+        'STREAM_BUFFER_PATH': os.path.join(workdir, 'stream_buffer'),
+        'INGEST_AUTOSTART': 'false',
+        'LOG_LEVEL': 'WARNING',
+        'LLM_BACKEND': 'mock',
+        'LLM_MOCK_TOKEN_DELAY_MS': str(args.token_ms),
+        # 排队的请求也要完整生成，不按预算截断
+        'LLM_FIRST_TOKEN_BUDGET_MS': '600000',
+        'LLM_GENERATE_BUDGET_MS': '600000',
+        'ASGI_BLOCKING_WORKERS': str(args.async_workers),
+        'CHAT_COALESCE_ENABLED': 'false' if args.no_coalesce else 'true',
+    })
+    return env
+
+
+def start_server(mode, port, workdir, args):
+    command = [sys.executable, '-m', 'benchmarks.bench_chat_concurrency', '--serve', mode, '--port', str(port),
+               '--sync-workers', str(args.sync_workers)]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=server_env(workdir, args))
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{mode} 服务启动失败")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{mode} 服务启动超时")
+
+
+class ProcessMonitor:
+    """采样服务进程的线程数和 RSS（读取 /proc，其他平台不输出）"""
+
+    def __init__(self, pid, interval=0.05):
+        self.path = f"/proc/{pid}/status"
+        self.available = os.path.exists(self.path)
+        self.interval = interval
+        self.max_threads = 0
+        self.max_rss_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        if self.available:
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with open(self.path) as f:
+                    for line in f:
+                        if line.startswith('Threads:'):
+                            self.max_threads = max(self.max_threads, int(line.split()[1]))
+                        elif line.startswith('VmRSS:'):
+                            self.max_rss_kb = max(self.max_rss_kb, int(line.split()[1]))
+            except OSError:
+                return
+
+
+# ---------------- 客户端 ----------------
+
+def call(port, path, payload=None, token=None):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f"Bearer {token}"
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}{path}", data=json.dumps(payload).encode('utf-8') if payload is not None else None,
+        headers=headers
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read())
+
+
+def login(port):
+    call(port, '/api/register', {'username': USERNAME, 'email': f"{USERNAME}@example.com", 'password': PASSWORD})
+    return call(port, '/api/login', {'username': USERNAME, 'password': PASSWORD})['data']['access_token']
+
+
+def generations(port, token):
+    """服务进程实际的生成次数（请求合并关闭时为 None）"""
+    coalescing = call(port, '/api/kb-info', token=token)['data'].get('chat_coalescing')
+    return coalescing['flights'] if coalescing else None
+
+
+async def chat_stream(port, token, index, delay, timeout):
+    """延迟 delay 秒后发起一个聊天流，返回 (发起时间, 首帧时间, 完成时间, 是否完整)（time.perf_counter()）"""
+    await asyncio.sleep(delay)
+    started = time.perf_counter()
+    try:
+        first, done = await asyncio.wait_for(_chat_stream(port, token, index), timeout)
+    except asyncio.TimeoutError:
+        return started, None, time.perf_counter(), False
+    return started, first, time.perf_counter(), done
+
+
+async def _chat_stream(port, token, index):
+    payload = json.dumps({'message': f"并发测试问题 {index}", 'use_rag': False}).encode('utf-8')
+    request = (
+        f"POST /api/chat HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nAuthorization: Bearer {token}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n"
+    ).encode('latin-1') + payload
+    first = None
+    received = b''
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError:
+        return None, False
+    try:
+        writer.write(request)
+        await writer.drain()
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            received += data
+            if first is None and b'data: ' in received:
+                first = time.perf_counter()
+    except OSError:
+        pass
+    finally:
+        writer.close()
+    return first, b'data: [DONE]' in received
+
+
+async def run_streams(port, token, args, streams):
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        chat_stream(port, token, i % args.distinct if args.distinct else i, args.ramp * i / streams, args.timeout)
+        for i in range(streams)
+    ))
+    return results, time.perf_counter() - started
+
+
+def peak_open(results):
+    """同时打开（已收到首帧、尚未结束）的聊天流峰值"""
+    edges = []
+    for _, first, end, _ in results:
+        if first is not None:
+            edges.append((first, 1))
+            edges.append((end, -1))
+    peak = current = 0
+    for _, delta in sorted(edges):
+        current += delta
+        peak = max(peak, current)
+    return peak
+
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def bench(mode, streams, args):
+    with tempfile.TemporaryDirectory(prefix='bench-chat-') as workdir:
+        port = free_port()
+        process = start_server(mode, port, workdir, args)
+        try:
+            token = login(port)
+            monitor = ProcessMonitor(process.pid)
+            monitor.start()
+            results, wall = asyncio.run(run_streams(port, token, args, streams))
+            monitor.stop()
+            generated = generations(port, token)
+        finally:
+            process.terminate()
+            process.wait()
+    completed = [r for r in results if r[3]]
+    ttfb = [first - started for started, first, _, _ in completed]
+    total = [end - started for started, _, end, _ in completed]
+    return {
+        'completed': len(completed),
+        'peak_open': peak_open(results),
+        'ttfb_p50': percentile(ttfb, 50), 'ttfb_p99': percentile(ttfb, 99),
+        'total_p50': percentile(total, 50), 'total_p99': percentile(total, 99),
+        'wall': wall,
+        'generations': generated,
+        'threads': monitor.max_threads if monitor.available else None,
+        'rss_mb': monitor.max_rss_kb / 1024 if monitor.available else None
+    }
+
+
+def raise_fd_limit():
+    """每个流占用客户端和服务端各一个文件描述符"""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY else 65536, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='聊天接口并发基准测试')
+    parser.add_argument('--streams', default='100,1000', help='并发聊天流数（逗号分隔）')
+    parser.add_argument('--modes', default='sync,async', help='服务模式（sync / async，逗号分隔）')
+    parser.add_argument('--token-ms', type=int, default=500, help='mock 后端每个字符的间隔（毫秒）')
+    parser.add_argument('--ramp', type=float, default=20, help='在多少秒内均匀发起全部聊天流')
+    parser.add_argument('--timeout', type=float, default=60, help='每个聊天流的最长等待（秒）')
+    parser.add_argument('--sync-workers', type=int, default=32, help='同步模式的工作线程数')
+    parser.add_argument('--async-workers', type=int, default=64, help='异步模式的阻塞线程池大小（ASGI_BLOCKING_WORKERS）')
+    parser.add_argument('--distinct', type=int, default=0, help='不同问题的数量（0 表示每个聊天流的问题都不同）')
+    parser.add_argument('--no-coalesce', action='store_true', help='关闭相同问题的请求合并（CHAT_COALESCE_ENABLED）')
+    parser.add_argument('--serve', choices=['sync', 'async'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve == 'sync':
+        serve_sync(args.port, args.sync_workers)
+        return
+    if args.serve == 'async':
+        serve_async(args.port)
+        return
+
+    raise_fd_limit()
+    print(f"mock 后端字符间隔 {args.token_ms} ms，{args.ramp:g} 秒内发起，超时 {args.timeout:g} 秒；"
+          f"同步模式 {args.sync_workers} 个工作线程，异步模式阻塞线程池 {args.async_workers}；"
+          f"{args.distinct or '每个流'} 个不同问题，请求合并{'关闭' if args.no_coalesce else '开启'}")
+    print(f"{'模式':>6}  {'聊天流':>6}  {'完成':>6}  {'TTFB p50':>9}  {'TTFB p99':>9}  {'流 p50':>8}  {'流 p99':>8}  "
+          f"{'同时打开':>8}  {'总耗时':>7}  {'生成':>6}  {'峰值线程':>8}  {'RSS MB':>7}")
+    for streams in [int(value) for value in args.streams.split(',') if value.strip()]:
+        for mode in [value.strip() for value in args.modes.split(',') if value.strip()]:
+            r = bench(mode, streams, args)
+            threads = '-' if r['threads'] is None else r['threads']
+            rss = '-' if r['rss_mb'] is None else f"{r['rss_mb']:.0f}"
+            generated = streams if r['generations'] is None else r['generations']
+            print(f"{mode:>6}  {streams:>6}  {r['completed']:>6}  {r['ttfb_p50']:>8.2f}s  {r['ttfb_p99']:>8.2f}s  "
+                  f"{r['total_p50']:>7.2f}s  {r['total_p99']:>7.2f}s  {r['peak_open']:>8}  {r['wall']:>6.2f}s  {generated:>6}  "
+                  f"{threads:>8}  {rss:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+嵌入服务基准测试：不同批大小下的吞吐量（texts/s）
+
+模拟多个并发调用方（入库任务、聊天请求）各自提交少量文本，比较微批处理
+合并调用与逐条调用的差异。本地哈希后端本身很快，用 --call-latency-ms
+模拟每次模型调用的固定开销（HTTP 往返、GPU kernel 启动等）。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_embedding --texts 4000 --callers 64 --batch-sizes 1,8,32,128
+"""
+import time
+import argparse
+import threading
+
+from benchmarks.common import synthetic_texts
+from app.services.embedding import EmbeddingService, HashEmbeddingBackend
+
+
+class LatencyBackend(HashEmbeddingBackend):
+    """在哈希后端上增加每次调用的固定延迟和按文本计的延迟"""
+
+    def __init__(self, dimension, call_latency, per_text_latency):
+        super().__init__(dimension)
+        self.call_latency = call_latency
+        self.per_text_latency = per_text_latency
+
+    def embed_batch(self, texts):
+        time.sleep(self.call_latency + self.per_text_latency * len(texts))
+        return super().embed_batch(texts)
+
+
+def run(texts, batch_size, args):
+    service = EmbeddingService()
+    service.backend = LatencyBackend(args.dim, args.call_latency_ms / 1000, args.per_text_latency_ms / 1000)
+    service.max_batch_size = batch_size
+    service.max_wait = args.max_wait_ms / 1000
+    service._worker_count = args.workers
+
+    # 每个调用方每次提交 texts_per_call 条文本
+    calls = [texts[i:i + args.texts_per_call] for i in range(0, len(texts), args.texts_per_call)]
+    lock = threading.Lock()
+    latencies = []
+
+    def caller():
+        while True:
+            with lock:
+                if not calls:
+                    return
+                batch = calls.pop()
+            start = time.perf_counter()
+            service.embed(batch)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=caller) for _ in range(args.callers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    stats = service.stats()
+    return {
+        'throughput': len(texts) / elapsed,
+        'avg_batch': stats['avg_batch_size'],
+        'p50': latencies[len(latencies) // 2] * 1000,
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='嵌入服务批处理基准测试')
+    parser.add_argument('--texts', type=int, default=4000, help='文本总数')
+    parser.add_argument('--callers', type=int, default=64, help='并发调用方数量')
+    parser.add_argument('--texts-per-call', type=int, default=1, help='每次调用提交的文本数')
+    parser.add_argument('--batch-sizes', default='1,8,32,128', help='逗号分隔的批大小')
+    parser.add_argument('--workers', type=int, default=1, help='批处理线程数')
+    parser.add_argument('--max-wait-ms', type=int, default=10, help='批次最长等待时间（毫秒）')
+    parser.add_argument('--call-latency-ms', type=float, default=5.0, help='模拟每次模型调用的固定开销')
+    parser.add_argument('--per-text-latency-ms', type=float, default=0.05, help='模拟每条文本的计算开销')
+    parser.add_argument('--dim', type=int, default=384, help='向量维度')
+    args = parser.parse_args()
+
+    texts = synthetic_texts(args.texts)
+    print(f"文本数 {len(texts)}，并发调用方 {args.callers}，每次调用 {args.texts_per_call} 条，"
+          f"批处理线程 {args.workers}")
+    print(f"{'批大小':>6}  {'吞吐量(texts/s)':>16}  {'平均批大小':>10}  {'p50(ms)':>8}  {'p99(ms)':>8}")
+    for batch_size in (int(x) for x in args.batch_sizes.split(',')):
+        result = run(texts, batch_size, args)
+        print(f"{batch_size:>6}  {result['throughput']:>16.0f}  {result['avg_batch']:>10.1f}  "
+              f"{result['p50']:>8.1f}  {result['p99']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+关键词索引基准测试：建索引吞吐量与 BM25 查询延迟
+
+用合成语料切分出的切片建立索引，分别测试编号类查询（低频词项，如 PN-1234）
+和常见中文词组查询（高频词项，倒排表最长）的单查询延迟（p50/p99）。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_keyword --size-mb 50 --batch 2000
+"""
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+from benchmarks.common import synthetic_blocks, peak_rss_mb
+from app.services.ingestion.splitter import TextSplitter
+from app.services.ingestion.stages import hash_chunk
+from app.services.keyword import KeywordIndex
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    return p50, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description='关键词索引基准测试')
+    parser.add_argument('--size-mb', type=int, default=50, help='合成语料大小（MB）')
+    parser.add_argument('--chunk-size', type=int, default=500, help='切片 token 上限')
+    parser.add_argument('--batch', type=int, default=2000, help='每次写入的切片数（对应一个段）')
+    parser.add_argument('--max-segments', type=int, default=8, help='段数量上限')
+    parser.add_argument('--k', type=int, default=20, help='top-k')
+    parser.add_argument('--queries', type=int, default=200, help='每类查询次数')
+    args = parser.parse_args()
+
+    splitter = TextSplitter(args.chunk_size, 50)
+    chunks = [(hash_chunk(text), text) for text in splitter.split(synthetic_blocks(args.size_mb * 1024 * 1024))]
+
+    root = tempfile.mkdtemp(prefix='bench-kw-')
+    try:
+        index = KeywordIndex(root, max_segments=args.max_segments)
+        start = time.perf_counter()
+        for i in range(0, len(chunks), args.batch):
+            index.add(chunks[i:i + args.batch])
+        build = time.perf_counter() - start
+        stats = index.stats()
+
+        rng = random.Random(7)
+        query_sets = {
+            '编号': [f'PN-{rng.randint(1000, 9999)} 是什么型号' for _ in range(args.queries)],
+            '常见词': [rng.choice(['报销流程审批', '员工培训考勤', '密码账号权限', 'vpn password reset'])
+                    for _ in range(args.queries)]
+        }
+        index.search('预热', args.k)
+
+        print(f"切片数 {len(chunks)}，写入 {build:.2f} s（{len(chunks) / build:.0f} 切片/s），"
+              f"段 {stats['segments']} 个，索引 {stats['size_bytes'] / 1024 / 1024:.1f} MB")
+        print(f"{'查询':>6}  {'p50(ms)':>8}  {'p99(ms)':>8}")
+        for name, queries in query_sets.items():
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                index.search(query, args.k)
+                latencies.append(time.perf_counter() - start)
+            p50, p99 = percentiles(latencies)
+            print(f"{name:>6}  {p50:>8.3f}  {p99:>8.3f}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    rss = peak_rss_mb()
+    if rss is not None:
+        print(f"峰值 RSS: {rss:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+切分器基准测试：吞吐量（MB/s）和峰值内存
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_splitter --size-mb 200 --chunk-size 500 --overlap 50
+"""
+import time
+import argparse
+
+from benchmarks.common import synthetic_blocks, peak_rss_mb
+from app.services.ingestion.splitter import TextSplitter
+
+
+def main():
+    parser = argparse.ArgumentParser(description='切分器基准测试')
+    parser.add_argument('--size-mb', type=int, default=200, help='合成语料大小（MB）')
+    parser.add_argument('--chunk-size', type=int, default=500, help='切片 token 上限')
+    parser.add_argument('--overlap', type=int, default=50, help='重叠 token 数')
+    args = parser.parse_args()
+
+    total_bytes = args.size_mb * 1024 * 1024
+    splitter = TextSplitter(args.chunk_size, args.overlap)
+
+    # 预先生成一组文本块循环使用，避免把语料生成时间计入切分耗时
+    pool = list(synthetic_blocks(min(total_bytes, 16 * 1024 * 1024)))
+    pool_bytes = [len(block.encode('utf-8')) for block in pool]
+    consumed = 0
+
+    def blocks():
+        nonlocal consumed
+        i = 0
+        while consumed < total_bytes:
+            consumed += pool_bytes[i]
+            yield pool[i]
+            i = (i + 1) % len(pool)
+
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    chunk_count = 0
+    chunk_chars = 0
+    for chunk in splitter.split(blocks()):
+        chunk_count += 1
+        chunk_chars += len(chunk)
+    elapsed = time.perf_counter() - start
+
+    mb = consumed / 1024 / 1024
+    print(f"语料大小:       {mb:.1f} MB")
+    print(f"切片数量:       {chunk_count}（平均 {chunk_chars / max(chunk_count, 1):.0f} 字符）")
+    print(f"耗时:           {elapsed:.2f} s")
+    print(f"切分吞吐量:     {mb / elapsed:.1f} MB/s")
+    if rss_before is not None:
+        print(f"峰值 RSS:       {peak_rss_mb():.1f} MB（切分前 {rss_before:.1f} MB）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+SSE 流式输出基准测试：逐片段发帧 vs 合并发帧
+
+模拟后端逐字符生成回答（字符间隔 --token-ms），由 AnswerStream 转为 content 事件、
+编码为 SSE 帧，并逐帧 os.write 到 /dev/null（每帧一次系统调用，与响应写出一致）：
+- per-piece：改造前的方式，生成线程经队列逐个转发片段，每个片段一帧（f-string +
+  json.dumps，ASCII 转义），响应生成器每个片段唤醒一次；
+- coalesced：AnswerStream，首个片段立即发出，之后按 --flush-bytes / --flush-ms 合并，
+  使用预编码的帧，响应生成器每帧唤醒一次。
+输出每个回答的帧数、字节数、CPU 时间（包含生成线程）和每秒帧数。
+改造前每个字符还要在工作线程中 sleep 50 ms，2000 字的回答会占用线程 100 秒。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_sse --answers 20 --chars 2000 --token-ms 0,2
+"""
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+
+from flask import Flask
+
+from benchmarks.common import synthetic_texts
+from app.services.llm import AnswerStream, MockLLMBackend, CancelToken
+from app.utils.sse import encode_event, DONE_FRAME
+
+
+def per_piece_frames(app, backend, args):
+    """改造前的方式：队列逐个转发片段，每个事件一次 json.dumps，str 帧由 WSGI 层编码为 UTF-8"""
+    pieces = queue.Queue()
+    end = object()
+
+    def produce():
+        with app.app_context():
+            for piece in backend.stream_chat([{'role': 'user', 'content': 'q'}], CancelToken()):
+                pieces.put(piece)
+        pieces.put(end)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = pieces.get()
+        if item is end:
+            break
+        yield f"data: {json.dumps({'type': 'content', 'content': item})}\n\n".encode('utf-8')
+    yield "data: [DONE]\n\n".encode('utf-8')
+
+
+def coalesced_frames(app, backend, args):
+    stream = AnswerStream(
+        app, backend, [{'role': 'user', 'content': 'q'}],
+        first_token_budget=60, total_budget=600,
+        flush_bytes=args.flush_bytes, flush_interval=args.flush_ms / 1000
+    )
+    for event in stream.events():
+        yield encode_event(event)
+    yield DONE_FRAME
+
+
+def run(app, reply, args, token_ms, mode):
+    backend = MockLLMBackend(reply=reply, delay=token_ms / 1000)
+    frames_of = per_piece_frames if mode == 'per-piece' else coalesced_frames
+    sink = os.open(os.devnull, os.O_WRONLY)
+    frames = 0
+    size = 0
+    try:
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        for _ in range(args.answers):
+            for frame in frames_of(app, backend, args):
+                os.write(sink, frame)
+                frames += 1
+                size += len(frame)
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+    finally:
+        os.close(sink)
+    return {
+        'frames': frames / args.answers,
+        'bytes': size / args.answers,
+        'cpu_ms': cpu * 1000 / args.answers,
+        'wall_ms': wall * 1000 / args.answers,
+        'fps': frames / wall
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SSE 流式输出基准测试')
+    parser.add_argument('--answers', type=int, default=20, help='每种配置生成的回答数')
+    parser.add_argument('--chars', type=int, default=2000, help='每个回答的字符数')
+    parser.add_argument('--token-ms', default='0,2', help='后端字符间隔（毫秒，逗号分隔）')
+    parser.add_argument('--flush-bytes', type=int, default=512, help='合并帧的字节数上限')
+    parser.add_argument('--flush-ms', type=float, default=50, help='合并帧的最长等待（毫秒）')
+    args = parser.parse_args()
+
+    reply = ''
+    for text in synthetic_texts(max(1, args.chars // 20)):
+        reply += text
+        if len(reply) >= args.chars:
+            break
+    reply = reply[:args.chars]
+    app = Flask('bench-sse')
+
+    print(f"回答 {len(reply)} 字符，每种配置 {args.answers} 个回答；合并参数 {args.flush_bytes} 字节 / {args.flush_ms:g} ms")
+    print(f"{'字符间隔':>8}  {'模式':>10}  {'帧/回答':>8}  {'KB/回答':>8}  {'CPU ms/回答':>11}  {'墙钟 ms/回答':>12}  {'帧/s':>9}")
+    for token_ms in [float(value) for value in args.token_ms.split(',') if value.strip()]:
+        for mode in ('per-piece', 'coalesced'):
+            result = run(app, reply, args, token_ms, mode)
+            print(f"{token_ms:>6g}ms  {mode:>10}  {result['frames']:>8.0f}  {result['bytes'] / 1024:>8.1f}  "
+                  f"{result['cpu_ms']:>11.2f}  {result['wall_ms']:>12.1f}  {result['fps']:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
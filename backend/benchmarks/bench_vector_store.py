@@ -0,0 +1,85 @@
+"""
+向量库基准测试：内置 NumPy 向量库的精确 top-k 检索延迟
+
+随机生成归一化向量写入临时目录，分别测试 float16 / float32 存储下
+单查询延迟（p50/p99）和批量查询吞吐量。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_vector_store --count 300000 --dim 384 --k 10
+"""
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import peak_rss_mb
+from app.services.vectorstore import NumpyVectorStore
+
+
+def random_unit_vectors(count, dim, rng):
+    matrix = rng.standard_normal((count, dim), dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix
+
+
+def run(dtype, vectors, queries, args):
+    root = tempfile.mkdtemp(prefix='bench-vs-')
+    try:
+        store = NumpyVectorStore(root, dtype=dtype, block_rows=args.block_rows)
+        ids = [f'{i:032x}' for i in range(len(vectors))]
+        start = time.perf_counter()
+        for i in range(0, len(ids), 50000):
+            store.add(ids[i:i + 50000], vectors[i:i + 50000])
+        build = time.perf_counter() - start
+
+        store.search(queries[0], args.k)  # 预热页缓存
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            store.search(query, args.k)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+
+        start = time.perf_counter()
+        store.search_batch(queries, args.k)
+        batch = time.perf_counter() - start
+        return {
+            'build': build,
+            'p50': latencies[len(latencies) // 2] * 1000,
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+            'batch_qps': len(queries) / batch,
+            'size_mb': store.stats()['size_bytes'] / 1024 / 1024
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='向量库检索基准测试')
+    parser.add_argument('--count', type=int, default=300000, help='向量数量')
+    parser.add_argument('--dim', type=int, default=384, help='向量维度')
+    parser.add_argument('--k', type=int, default=10, help='top-k')
+    parser.add_argument('--queries', type=int, default=50, help='查询次数')
+    parser.add_argument('--block-rows', type=int, default=16384, help='每块参与矩阵乘法的行数')
+    parser.add_argument('--dtypes', default='float16,float32', help='逗号分隔的存储精度')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    vectors = random_unit_vectors(args.count, args.dim, rng)
+    queries = random_unit_vectors(args.queries, args.dim, rng)
+
+    print(f"向量数 {args.count}，维度 {args.dim}，top-{args.k}，查询 {args.queries} 次")
+    print(f"{'精度':>8}  {'写入(s)':>8}  {'文件(MB)':>9}  {'p50(ms)':>8}  {'p99(ms)':>8}  {'批量(QPS)':>10}")
+    for dtype in args.dtypes.split(','):
+        result = run(dtype, vectors, queries, args)
+        print(f"{dtype:>8}  {result['build']:>8.2f}  {result['size_mb']:>9.1f}  {result['p50']:>8.1f}  "
+              f"{result['p99']:>8.1f}  {result['batch_qps']:>10.0f}")
+    rss = peak_rss_mb()
+    if rss is not None:
+        print(f"峰值 RSS: {rss:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+基准测试公共工具
+"""
+import os
+import sys
+import random
+
+# 允许在 backend 目录下直接运行 python -m benchmarks.xxx 或 python benchmarks/xxx.py
+BACKEND_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# 导入 app 包会加载全部配置类，基准测试不对外服务，使用占位密钥即可
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-only-secret')
+
+_ZH_WORDS = [
+    '员工', '公司', '制度', '报销', '流程', '审批', '部门', '经理', '合同', '安全',
+    '信息', '系统', '密码', '网络', '设备', '申请', '规定', '管理', '培训', '考勤',
+    '假期', '工资', '福利', '项目', '客户', '数据', '备份', '权限', '账号', '服务'
+]
+_EN_WORDS = [
+    'policy', 'employee', 'vpn', 'password', 'reset', 'device', 'network', 'access',
+    'manager', 'approval', 'expense', 'report', 'server', 'backup', 'account', 'support'
+]
+_ZH_END = ['。', '！', '？', '；']
+
+
+def synthetic_sentence(rng):
+    """生成一个中英混合的句子"""
+    if rng.random() < 0.7:
+        words = [rng.choice(_ZH_WORDS) for _ in range(rng.randint(4, 20))]
+        if rng.random() < 0.3:
+            words.insert(rng.randint(0, len(words)), f' PN-{rng.randint(1000, 9999)} ')
+        return ''.join(words) + rng.choice(_ZH_END)
+    words = [rng.choice(_EN_WORDS) for _ in range(rng.randint(5, 25))]
+    return ' '.join(words).capitalize() + '. '
+
+
+def synthetic_blocks(total_bytes, block_chars=64 * 1024, seed=42):
+    """
+    生成合成语料的文本块流（不在内存中保留整个语料）
+
+    Args:
+        total_bytes: 语料的 UTF-8 总字节数（近似）
+        block_chars: 每个文本块的字符数
+        seed: 随机种子
+
+    Yields:
+        str: 文本块
+    """
+    rng = random.Random(seed)
+    produced = 0
+    parts = []
+    size = 0
+    while produced < total_bytes:
+        sentence = synthetic_sentence(rng)
+        if rng.random() < 0.05:
+            sentence += '\n\n'
+        parts.append(sentence)
+        size += len(sentence)
+        if size >= block_chars:
+            block = ''.join(parts)
+            produced += len(block.encode('utf-8'))
+            yield block
+            parts = []
+            size = 0
+    if parts:
+        yield ''.join(parts)
+
+
+def synthetic_texts(count, seed=42):
+    """生成 count 条短文本（用于嵌入、检索等基准）"""
+    rng = random.Random(seed)
+    return [''.join(synthetic_sentence(rng) for _ in range(rng.randint(1, 4))) for _ in range(count)]
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB）；不支持的平台返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    if sys.platform == 'darwin':
+        return peak / 1024 / 1024
+    return peak / 1024
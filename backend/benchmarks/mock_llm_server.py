@@ -0,0 +1,197 @@
+"""
+本地模拟的 OpenAI 兼容流式大模型服务
+
+实现 POST /v1/chat/completions（stream 为 true 时按 SSE 逐个输出片段），用于
+离线压测整条聊天链路。首个片段延迟、片段间隔、片段数和故障率均可配置；
+GET /stats 返回请求数、完成数、客户端中途断开数、注入的故障数和连接数。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.mock_llm_server --port 8765 --first-token-ms 300 --token-ms 20 --tokens 64
+
+    # 后端使用该服务
+    LLM_BACKEND=openai LLM_API_BASE=http://127.0.0.1:8765/v1 LLM_MODEL=mock python run.py
+"""
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = '这是模拟大模型的流式回复，用于离线压测聊天链路。'
+
+
+class Stats:
+    """线程安全的计数器"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {
+            'requests': 0, 'completed': 0, 'cancelled': 0, 'injected_failures': 0,
+            'connections': 0, 'active': 0, 'max_active': 0
+        }
+
+    def add(self, key, delta=1):
+        with self._lock:
+            self.values[key] += delta
+            if key == 'active':
+                self.values['max_active'] = max(self.values['max_active'], self.values['active'])
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.values)
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 + 分块传输，客户端可以复用 keep-alive 连接
+    protocol_version = 'HTTP/1.1'
+    server_version = 'MockLLM/1.0'
+
+    def setup(self):
+        super().setup()
+        self.server.stats.add('connections')
+
+    def log_message(self, format, *args):
+        if self.server.options.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self._send_json(200, self.server.stats.snapshot())
+        elif self.path.rstrip('/') in ('/v1/models', '/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'mock', 'object': 'model'}]})
+        else:
+            self._send_json(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self):
+        if self.path.rstrip('/') not in ('/v1/chat/completions', '/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'invalid json'}})
+            return
+
+        options = self.server.options
+        stats = self.server.stats
+        stats.add('requests')
+        if options.fail_rate and random.random() < options.fail_rate:
+            stats.add('injected_failures')
+            self._send_json(503, {'error': {'message': 'injected failure'}})
+            return
+
+        tokens = self._tokens(options)
+        completion_id = f'chatcmpl-{uuid.uuid4().hex[:12]}'
+        model = body.get('model', 'mock')
+        if not body.get('stream'):
+            time.sleep(options.first_token_ms / 1000 + options.token_ms * (len(tokens) - 1) / 1000)
+            stats.add('completed')
+            self._send_json(200, {
+                'id': completion_id, 'object': 'chat.completion', 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                             'finish_reason': 'stop'}]
+            })
+            return
+
+        stats.add('active')
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            time.sleep(options.first_token_ms / 1000)
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(options.token_ms / 1000)
+                self._send_event({
+                    'id': completion_id, 'object': 'chat.completion.chunk', 'model': model,
+                    'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}]
+                })
+            self._send_event({
+                'id': completion_id, 'object': 'chat.completion.chunk', 'model': model,
+                'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]
+            })
+            self._send_chunk(b'data: [DONE]\n\n')
+            self._send_chunk(b'')
+            stats.add('completed')
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端取消（关闭连接）
+            stats.add('cancelled')
+            self.close_connection = True
+        finally:
+            stats.add('active', -1)
+
+    @staticmethod
+    def _tokens(options):
+        reply = options.reply
+        # 按字符循环拼出指定数量的片段，每个片段 1-2 个字符
+        tokens = []
+        position = 0
+        for i in range(options.tokens):
+            size = 1 + i % 2
+            tokens.append(''.join(reply[(position + k) % len(reply)] for k in range(size)))
+            position += size
+        return tokens
+
+    def _send_event(self, payload):
+        self._send_chunk(f'data: {json.dumps(payload, ensure_ascii=False)}\n\n'.encode('utf-8'))
+
+    def _send_chunk(self, data):
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def create_server(host='127.0.0.1', port=8765, first_token_ms=300, token_ms=20, tokens=64, fail_rate=0.0,
+                  reply=DEFAULT_REPLY, verbose=False):
+    """创建模拟服务（调用方负责 serve_forever / shutdown），port 为 0 时随机分配"""
+    server = ThreadingHTTPServer((host, port), MockLLMHandler)
+    server.daemon_threads = True
+    server.options = argparse.Namespace(
+        first_token_ms=first_token_ms, token_ms=token_ms, tokens=max(1, tokens),
+        fail_rate=fail_rate, reply=reply or DEFAULT_REPLY, verbose=verbose
+    )
+    server.stats = Stats()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟的 OpenAI 兼容流式大模型服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--first-token-ms', type=float, default=300, help='首个片段之前的延迟')
+    parser.add_argument('--token-ms', type=float, default=20, help='相邻片段之间的间隔')
+    parser.add_argument('--tokens', type=int, default=64, help='每次回复的片段数')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='直接返回 503 的请求比例（测试重试）')
+    parser.add_argument('--reply', default=DEFAULT_REPLY, help='回复文本（按片段数循环截取）')
+    parser.add_argument('--verbose', action='store_true', help='打印访问日志')
+    args = parser.parse_args()
+
+    server = create_server(
+        args.host, args.port, args.first_token_ms, args.token_ms, args.tokens, args.fail_rate, args.reply,
+        args.verbose
+    )
+    print(f"模拟大模型服务: http://{args.host}:{server.server_address[1]}/v1 "
+          f"(首个片段 {args.first_token_ms}ms, 间隔 {args.token_ms}ms, {args.tokens} 个片段)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats.snapshot(), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,16 @@ import { ref, nextTick, watch, type Ref } from 'vue';
 import { useRouter } from 'vue-router';
 import type { Message } from '@/types/chat';
 
+const CHAT_URL = 'http://localhost:5000/api/chat';
+// 回答流中途断开时的续传次数
+const MAX_RESUME_ATTEMPTS = 3;
+
+// 回答流的续传状态：最后收到的事件 id，是否已收到结束标识
+interface StreamState {
+  lastEventId: string | null;
+  done: boolean;
+}
+
 export function useChat(
   isAuthenticated: Ref<boolean>,
   showSnackbar: (text: string, color?: 'success' | 'error' | 'warning' | 'info') => void,
@@ -37,8 +47,41 @@ export function useChat(
     }
   };
 
-  // 处理流式响应的辅助函数
-  async function processStreamResponse(response: Response, assistantMsgIndex: number) {
+  // 打字机效果：服务端把回答片段合并成帧发送，前端逐帧显示；积压越多每帧显示的字符越多
+  function createTypewriter(target: Message) {
+    let pending = '';
+    let frame: number | null = null;
+    let drained: (() => void) | null = null;
+
+    const step = () => {
+      const count = Math.max(1, Math.ceil(pending.length / 30));
+      target.content += pending.slice(0, count);
+      pending = pending.slice(count);
+      scrollToBottom();
+      if (pending) {
+        frame = requestAnimationFrame(step);
+      } else {
+        frame = null;
+        drained?.();
+        drained = null;
+      }
+    };
+
+    return {
+      push(text: string) {
+        pending += text;
+        if (frame === null) frame = requestAnimationFrame(step);
+      },
+      // 等待已收到的内容全部显示
+      drain(): Promise<void> {
+        if (!pending) return Promise.resolve();
+        return new Promise(resolve => { drained = resolve; });
+      }
+    };
+  }
+
+  // 处理流式响应的辅助函数；连接中途断开时返回，由调用方按 state 续传
+  async function processStreamResponse(response: Response, assistantMsgIndex: number, state: StreamState) {
     const assistantMsg = messages.value[assistantMsgIndex];
 
     if (!response.body || !assistantMsg) {
@@ -48,27 +91,53 @@ export function useChat(
       return;
     }
 
+    const typewriter = createTypewriter(assistantMsg);
     const reader = response.body.getReader();
     const decoder = new TextDecoder();
     let buffer = '';
     let conversationIdFromStream: number | null = null;
 
     while (true) {
-      const { done, value } = await reader.read();
+      let chunk: ReadableStreamReadResult<Uint8Array>;
+      try {
+        chunk = await reader.read();
+      } catch (readError) {
+        // 已收到带 id 的事件时可以续传，否则按请求失败处理
+        if (state.lastEventId) break;
+        throw readError;
+      }
+      const { done, value } = chunk;
       if (done) break;
 
       buffer += decoder.decode(value, { stream: true });
-      const lines = buffer.split('\n\n');
-      buffer = lines.pop() || '';
-
-      for (const line of lines) {
-        if (line.startsWith('data: ')) {
-          const dataStr = line.slice(6);
-          if (dataStr === '[DONE]') break;
+      const blocks = buffer.split('\n\n');
+      buffer = blocks.pop() || '';
+
+      for (const block of blocks) {
+        // 一个事件可能包含 id 行和 data 行
+        let dataStr: string | null = null;
+        for (const line of block.split('\n')) {
+          if (line.startsWith('id: ')) {
+            state.lastEventId = line.slice(4);
+          } else if (line.startsWith('data: ')) {
+            dataStr = line.slice(6);
+          }
+        }
+        if (dataStr !== null) {
+          if (dataStr === '[DONE]') {
+            state.done = true;
+            break;
+          }
 
           try {
             const data = JSON.parse(dataStr);
 
+            // 续传：断线期间有事件已超出服务端缓冲，回答可能缺少片段
+            if (data.type === 'resumed') {
+              if (data.missed > 0) {
+                showSnackbar(`网络中断期间有 ${data.missed} 个片段未能补发，回答可能不完整`, 'warning');
+              }
+            }
             // 处理 conversation_id（从流式响应中获取）
             if (data.type === 'conversation_id' && data.conversation_id) {
               conversationIdFromStream = parseInt(data.conversation_id, 10);
@@ -98,8 +167,7 @@ export function useChat(
             // 处理流式文本
             else if (data.content) {
               assistantMsg.isRagSearching = false; // 确保检索状态被清除
-              assistantMsg.content += data.content;
-              scrollToBottom();
+              typewriter.push(data.content);
             }
           } catch (parseError) {
             console.error('解析SSE数据失败:', parseError);
@@ -108,6 +176,8 @@ export function useChat(
       }
     }
 
+    await typewriter.drain();
+
     // 流式响应完成后，确保对话ID被正确设置
     if (conversationIdFromStream && currentConversationId) {
       if (currentConversationId.value !== conversationIdFromStream) {
@@ -167,7 +237,7 @@ export function useChat(
         // 调试日志
         console.log('[Chat] 发送消息，当前对话ID:', conversationId);
         
-        return fetch('http://localhost:5000/api/chat', {
+        return fetch(CHAT_URL, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
@@ -229,7 +299,29 @@ export function useChat(
       }
 
       // 处理流式响应（conversation_id 会在流式响应中获取）
-      await processStreamResponse(response, assistantMsgIndex);
+      const state: StreamState = { lastEventId: null, done: false };
+      await processStreamResponse(response, assistantMsgIndex, state);
+
+      // 连接中途断开（没有收到结束标识）时带 Last-Event-ID 续传，服务端不会重新生成
+      for (let attempt = 1; !state.done && state.lastEventId && attempt <= MAX_RESUME_ATTEMPTS; attempt++) {
+        await new Promise(resolve => setTimeout(resolve, 500 * attempt));
+        console.log('[Chat] 回答流中断，续传:', state.lastEventId);
+        const resumed = await fetch(CHAT_URL, {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+            'Authorization': `Bearer ${token}`,
+            'Last-Event-ID': state.lastEventId
+          },
+          body: '{}'
+        }).catch(() => null);
+        if (!resumed) continue;
+        if (!resumed.ok) break;  // 回答流已过期
+        await processStreamResponse(resumed, assistantMsgIndex, state);
+      }
+      if (!state.done && state.lastEventId) {
+        showSnackbar('回答流连接中断，回答可能不完整', 'warning');
+      }
 
       // 流式响应完成后，刷新对话列表
       if (refreshConversations) {
@@ -84,7 +84,7 @@ export function useKnowledgeBase(
   };
 
   // 删除文件逻辑
-  const confirmDelete = async (filename: string) => {
+  const confirmDelete = async (filename: string, namespace?: string) => {
     // 检查登录状态
     if (!isAuthenticated.value) {
       showSnackbar('请先登录后再删除文件', 'warning');
@@ -95,7 +95,7 @@ export function useKnowledgeBase(
 
     try {
       const { post } = await import('@/utils/api');
-      const result = await post('/delete', { filename: filename });
+      const result = await post('/delete', { filename: filename, namespace: namespace });
 
       if (result.code === 200) {
         showSnackbar(`文件 "${filename}" 删除成功。`, 'success');
@@ -2,11 +2,18 @@ export interface KnowledgeFile {
   name: string;
   type: string;
   size: string;
+  status?: 'pending' | 'indexed' | 'failed';
+  chunk_count?: number;
+  vector_count?: number;
+  namespace?: string;
 }
 
 export interface Source {
   filename: string;
-  page: number;
+  page?: number | null;
+  chunk?: number;
+  chunk_end?: number;
+  score?: number;
 }
 
 export interface Message {